@@ -0,0 +1,2 @@
+# benchmarks/__init__.py
+# This file can be empty. It tells Python that 'benchmarks' is a package.
@@ -0,0 +1,139 @@
+# benchmarks/epub_generator.py
+import struct
+import zipfile
+import zlib
+from html import escape
+
+# Synthetic EPUBs for the benchmarks. Everything is generated from a seed-free
+# word list, so the same parameters always produce byte-identical books and
+# timings stay comparable between runs.
+
+LTR_WORDS = ("the quick brown fox jumps over a lazy dog while reading long chapters of "
+             "very ordinary prose about nothing in particular").split()
+RTL_WORDS = "این یک متن آزمایشی برای سنجش سرعت خواندن کتاب های بلند فارسی است و هیچ معنای خاصی ندارد".split()
+
+
+def solid_png(width, height, rgb=(52, 91, 154)):
+    """A minimal single-colour PNG, built without any imaging library."""
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff)
+    row = b'\x00' + bytes(rgb) * width
+    return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(row * height, 6)) + chunk(b'IEND', b''))
+
+
+def paragraph_text(words, index, length):
+    """About `length` characters of text, varied by paragraph index."""
+    out, size, i = [], 0, index
+    while size < length:
+        word = words[i % len(words)]
+        out.append(word)
+        size += len(word) + 1
+        i += 7
+    return ' '.join(out)
+
+
+def chapter_markup(number, chars, words, direction, image_paths, paragraph_chars=600):
+    """One XHTML chapter of roughly `chars` visible characters, with images spread through it."""
+    paragraphs = max(chars // paragraph_chars, 1)
+    images_at = {paragraphs * (k + 1) // (len(image_paths) + 1): path for k, path in enumerate(image_paths)}
+    body = [f'<h1 id="c{number}">Chapter {number}</h1>']
+    for p in range(paragraphs):
+        if p % 10 == 0:
+            body.append(f'<h2 id="c{number}s{p // 10}">Section {p // 10 + 1}</h2>')
+        body.append(f'<p>{escape(paragraph_text(words, number * 131 + p, paragraph_chars))} <b>bold</b> <i>{p}</i></p>')
+        if p in images_at:
+            body.append(f'<div class="figure"><img src="../{images_at[p]}" alt="figure"/></div>')
+    return (f'<?xml version="1.0" encoding="utf-8"?>\n<html xmlns="http://www.w3.org/1999/xhtml" dir="{direction}">'
+            f'<head><title>Chapter {number}</title><link rel="stylesheet" type="text/css" href="../style.css"/></head>'
+            f'<body>{"".join(body)}</body></html>')
+
+
+def toc_entries(chapters, depth):
+    """Nested (title, href, children) entries: chapters, then up to depth - 1 levels of sections."""
+    def sections(number, level):
+        if level >= depth: return []
+        return [(f'{"Sub" * (level - 1)}Section {s + 1}', f'text/ch{number}.xhtml#c{number}s{s}', sections(number, level + 1))
+                for s in range(2)]
+    return [(f'Chapter {n}', f'text/ch{n}.xhtml', sections(n, 1)) for n in range(1, chapters + 1)]
+
+
+def nav_markup(entries):
+    def items(entries):
+        return '<ol>' + ''.join(f'<li><a href="{href}">{escape(title)}</a>{items(children) if children else ""}</li>'
+                                for title, href, children in entries) + '</ol>'
+    return ('<?xml version="1.0" encoding="utf-8"?>\n<html xmlns="http://www.w3.org/1999/xhtml" '
+            'xmlns:epub="http://www.idpf.org/2007/ops"><head><title>Contents</title></head>'
+            f'<body><nav epub:type="toc">{items(entries)}</nav></body></html>')
+
+
+def ncx_markup(entries):
+    order = 0
+    def points(entries):
+        nonlocal order
+        out = []
+        for title, href, children in entries:
+            order += 1
+            out.append(f'<navPoint id="p{order}" playOrder="{order}"><navLabel><text>{escape(title)}</text></navLabel>'
+                       f'<content src="{href}"/>{points(children)}</navPoint>')
+        return ''.join(out)
+    return ('<?xml version="1.0" encoding="utf-8"?>\n<ncx xmlns="http://www.daisy.org/z3986/2005/ncx/" version="2005-1">'
+            f'<head/><docTitle><text>Contents</text></docTitle><navMap>{points(entries)}</navMap></ncx>')
+
+
+def add_entry(zf, name, data, compress_type=zipfile.ZIP_DEFLATED):
+    # A fixed timestamp keeps the archive bytes identical between runs.
+    info = zipfile.ZipInfo(name, date_time=(2020, 1, 1, 0, 0, 0))
+    info.compress_type = compress_type
+    zf.writestr(info, data)
+
+
+def make_epub(path, chapters=20, chapter_chars=20000, rtl=False, images=0, image_size=(800, 1200),
+              toc_depth=1, title=None, cover=True):
+    """
+    Writes a synthetic EPUB 3 (with an EPUB 2 NCX as well) and returns its path.
+
+    chapters: number of spine documents; chapter_chars: approximate visible
+    characters per chapter; rtl: Persian text and dir="rtl"; images: images
+    per chapter; toc_depth: 1 for chapters only, 2+ adds nested section entries.
+    """
+    words = RTL_WORDS if rtl else LTR_WORDS
+    direction = 'rtl' if rtl else 'ltr'
+    language = 'fa' if rtl else 'en'
+    title = title or f"Synthetic {chapters}x{chapter_chars}{' RTL' if rtl else ''}"
+    image = solid_png(*image_size) if images or cover else None
+    manifest, spine = [], []
+    with zipfile.ZipFile(path, 'w') as zf:
+        # The mimetype entry must come first and be stored uncompressed.
+        add_entry(zf, 'mimetype', 'application/epub+zip', zipfile.ZIP_STORED)
+        add_entry(zf, 'META-INF/container.xml',
+                    '<?xml version="1.0"?><container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">'
+                    '<rootfiles><rootfile full-path="OEBPS/content.opf" media-type="application/oebps-package+xml"/>'
+                    '</rootfiles></container>')
+        add_entry(zf, 'OEBPS/style.css', 'body { margin: 1em; } p { text-indent: 1em; } .figure { text-align: center; }')
+        manifest.append('<item id="css" href="style.css" media-type="text/css"/>')
+        if cover:
+            add_entry(zf, 'OEBPS/images/cover.png', image, zipfile.ZIP_STORED)
+            manifest.append('<item id="cover" href="images/cover.png" media-type="image/png" properties="cover-image"/>')
+        for n in range(1, chapters + 1):
+            image_paths = []
+            for k in range(images):
+                image_path = f'images/ch{n}_{k}.png'
+                add_entry(zf, 'OEBPS/' + image_path, image, zipfile.ZIP_STORED)
+                manifest.append(f'<item id="img{n}_{k}" href="{image_path}" media-type="image/png"/>')
+                image_paths.append(image_path)
+            add_entry(zf, f'OEBPS/text/ch{n}.xhtml', chapter_markup(n, chapter_chars, words, direction, image_paths))
+            manifest.append(f'<item id="ch{n}" href="text/ch{n}.xhtml" media-type="application/xhtml+xml"/>')
+            spine.append(f'<itemref idref="ch{n}"/>')
+        entries = toc_entries(chapters, toc_depth)
+        add_entry(zf, 'OEBPS/nav.xhtml', nav_markup(entries))
+        add_entry(zf, 'OEBPS/toc.ncx', ncx_markup(entries))
+        manifest.append('<item id="nav" href="nav.xhtml" media-type="application/xhtml+xml" properties="nav"/>')
+        manifest.append('<item id="ncx" href="toc.ncx" media-type="application/x-dtbncx+xml"/>')
+        add_entry(zf, 'OEBPS/content.opf',
+                    '<?xml version="1.0" encoding="utf-8"?>\n<package xmlns="http://www.idpf.org/2007/opf" version="3.0" '
+                    'unique-identifier="uid"><metadata xmlns:dc="http://purl.org/dc/elements/1.1/">'
+                    f'<dc:identifier id="uid">urn:synthetic:{escape(title)}</dc:identifier><dc:title>{escape(title)}</dc:title>'
+                    f'<dc:creator>Benchmark Generator</dc:creator><dc:language>{language}</dc:language></metadata>'
+                    f'<manifest>{"".join(manifest)}</manifest><spine toc="ncx">{"".join(spine)}</spine></package>')
+    return path
@@ -0,0 +1,337 @@
+# benchmarks/run_benchmarks.py
+"""
+Headless performance benchmarks for the reader.
+
+Run from the project root:
+
+    python -m benchmarks.run_benchmarks --output results.json
+    python -m benchmarks.run_benchmarks --baseline benchmarks/baseline.json --fail-on-regression
+
+A baseline is just an earlier results file; copy one to benchmarks/baseline.json
+on the machine that will do the comparing.
+
+Everything runs on Qt's offscreen platform against synthetic books and a
+throwaway database, so the real library is never touched.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import zipfile
+import statistics
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from PySide6 import __version__ as PYSIDE_VERSION
+from PySide6.QtCore import QEventLoop
+from PySide6.QtWidgets import QApplication
+
+from benchmarks.epub_generator import make_epub
+from database.database_manager import DatabaseManager
+from ui.library_model import LibraryModel
+from ui.main_window import EpubReader
+from ui.qt_compat import guard_signal_emit_refcount
+from ui.workers import BookLoaderWorker
+from utils.text_metrics import count_visible_chars
+from utils.thumbnails import ThumbnailCache
+
+RESULTS_VERSION = 1
+# A benchmark whose median is this much slower than the baseline is reported as a regression.
+DEFAULT_THRESHOLD = 0.15
+
+# name: make_epub arguments
+BOOKS = {
+    'small': dict(chapters=20, chapter_chars=20000),
+    'rtl': dict(chapters=30, chapter_chars=20000, rtl=True),
+    'images': dict(chapters=20, chapter_chars=10000, images=3, toc_depth=3),
+    'large': dict(chapters=150, chapter_chars=60000, toc_depth=2),
+}
+QUICK_BOOKS = ('small', 'rtl')
+LIBRARY_SIZES = (10, 1000, 50000)
+QUICK_LIBRARY_SIZES = (10, 1000)
+
+# Markup whose visible length the old measurement (ebooklib + BeautifulSoup)
+# got in a way that is easy to miss; count_visible_chars must agree on all of them.
+PARITY_CASES = {
+    'cdata': b'<html><body><p>Hello</p><![CDATA[cdata]]><p>world</p></body></html>',
+    'cdata_in_text': b'<html><body><p>Hello <![CDATA[x<y]]> there</p></body></html>',
+    'script_cdata': b'<html><body><script><![CDATA[var a;]]></script><p>ok</p></body></html>',
+    'after_html': b'<html><body><p>Tail text</p></body></html>after html<p>late</p>',
+    'after_body': b'<html><body><p>Tail text</p></body>after body<p>late</p></html>',
+    'before_html': b'before<html><body><p>x</p></body></html>',
+    'between_head_and_body': b'<html><head><title>T</title></head>loose<body><p>x</p></body></html>',
+    'body_leading': b'<html><body>Intro<p>x</p>between<p>y</p>end</body></html>',
+    'comment_leading': b'<html><body><!--c-->after comment<p>x</p></body></html>',
+    'no_body': b'lead<p>x</p>tail',
+    'unknown_entity': b'<html><body><p>x&bogus;y &bogus z &bogus;;</p></body></html>',
+    'legacy_entity': b'<html><body><p>x&copy2 y&notit; z&ampx &hellip;&nbsp;</p></body></html>',
+}
+
+
+class Bench:
+    """Collects wall-clock samples per benchmark name."""
+
+    def __init__(self, repeat):
+        self.repeat = repeat
+        self.samples = {}
+
+    def record(self, name, seconds):
+        self.samples.setdefault(name, []).append(seconds * 1000)
+
+    def time(self, name, func, repeat=None, setup=None):
+        for _ in range(repeat or self.repeat):
+            if setup: setup()
+            start = time.perf_counter()
+            func()
+            self.record(name, time.perf_counter() - start)
+
+    def results(self):
+        return {name: {'median_ms': statistics.median(runs), 'min_ms': min(runs), 'mean_ms': statistics.fmean(runs),
+                       'runs': len(runs)}
+                for name, runs in self.samples.items()}
+
+
+def process_events():
+    QEventLoop().processEvents()
+
+
+def wait_until(condition, timeout=60):
+    end = time.perf_counter() + timeout
+    while not condition():
+        if time.perf_counter() > end: raise TimeoutError("benchmark step did not finish")
+        process_events()
+        time.sleep(0.001)
+
+
+def load_book_sync(path, db_manager):
+    """Runs the book loader on the calling thread and returns its result."""
+    result = {}
+    worker = BookLoaderWorker(db_manager)
+    worker.opened.connect(lambda generation, opened: result.update(opened))
+    worker.finished.connect(lambda generation, loaded: result.update(loaded))
+    worker.load(0, path)
+    if 'error' in result: raise RuntimeError(result['error'])
+    result['book'].close()
+    return result
+
+
+# --- Benchmarks ---
+
+def bench_book_load(bench, books, work_dir):
+    for name, path in books.items():
+        db_manager = DatabaseManager(os.path.join(work_dir, f'load_{name}.db'))
+        bench.time(f'book_load_cold/{name}', lambda: load_book_sync(path, db_manager),
+                   setup=lambda: db_manager.delete_book_index(path))
+        load_book_sync(path, db_manager)
+        bench.time(f'book_load_warm/{name}', lambda: load_book_sync(path, db_manager))
+        db_manager.close()
+
+
+def bench_reader(bench, books, work_dir):
+    """Chapter render and position jump, through the real main window."""
+    db_manager = DatabaseManager(os.path.join(work_dir, 'reader.db'))
+    reader = EpubReader(db_manager, ThumbnailCache(os.path.join(work_dir, 'covers')))
+    reader.resize(1200, 900)
+    reader.show()
+    process_events()
+    rng = random.Random(1)
+    for name, path in books.items():
+        reader.load_book(path)
+        wait_until(lambda: reader.book is not None and reader.loading_path is None and reader.pending_display is None)
+        process_events()
+        spine = range(len(reader.spine))
+        picks = [rng.choice(spine) for _ in range(bench.repeat)]
+
+        def render(cached):
+            def run():
+                index = picks.pop()
+                if not cached: reader.chapter_cache.clear()
+                reader.display_spine_document(index)
+                wait_until(lambda: reader.pending_display is None)
+                # Forces the layout that the first paint would otherwise do.
+                reader.text_display.document().documentLayout().documentSize()
+                process_events()
+            return run
+        bench.time(f'chapter_render_cold/{name}', render(False))
+        picks = [rng.choice(spine) for _ in range(bench.repeat)]
+        for index in set(picks):
+            reader.display_spine_document(index)
+            wait_until(lambda: reader.pending_display is None)
+        bench.time(f'chapter_render_cached/{name}', render(True))
+
+        def jump():
+            reader.jump_to_position(rng.uniform(0, 99.5))
+            wait_until(lambda: reader.pending_display is None and reader.pending_scroll_target is None)
+            reader.get_current_char_position()
+        bench.time(f'position_jump/{name}', jump)
+    reader.close()
+    process_events()
+
+
+def synthetic_library_records(count):
+    records = []
+    for i in range(count):
+        title = f"Book {i:06d} {random.Random(i).choice(['Alpha', 'Beta', 'Gamma', 'Delta'])}"
+        index = {'title': title, 'author': f"Author {i % 997}", 'chapters': [{'title': 'One', 'href': 'a.xhtml'}],
+                 'spine': ['a.xhtml'], 'total_len': 1000 + i, 'chap_lens': [1000 + i], 'cum_lens': [0, 1000 + i]}
+        records.append({'path': f'/library/book_{i:06d}.epub', 'size': 1000 + i, 'mtime': i, 'index': index})
+    return records
+
+
+def bench_library(bench, sizes, work_dir):
+    for size in sizes:
+        db_manager = DatabaseManager(os.path.join(work_dir, f'library_{size}.db'))
+        records = synthetic_library_records(size)
+        for start in range(0, size, 1000):
+            db_manager.save_imported_books(records[start:start + 1000])
+        model = LibraryModel(db_manager)
+        bench.time(f'library_load/{size}', model.refresh)
+
+        def scroll():
+            model.refresh()
+            for _ in range(5):
+                if model.canFetchMore(): model.fetchMore()
+        bench.time(f'library_scroll_5_pages/{size}', scroll)
+
+        terms = iter(f"Book {i:03d}" for i in range(10 ** 6))
+        bench.time(f'library_filter/{size}', lambda: model.set_filter(next(terms)))
+        model.set_filter("")
+        for sort in ('title', 'progress'):
+            def resort(sort=sort):
+                model.sort = None
+                model.set_sort(sort)
+            bench.time(f'library_sort_{sort}/{size}', resort)
+        db_manager.close()
+
+
+def bench_progress(bench, work_dir):
+    db_manager = DatabaseManager(os.path.join(work_dir, 'progress.db'))
+    db_manager.save_imported_books(synthetic_library_records(50))
+    paths = [f'/library/book_{i:06d}.epub' for i in range(50)]
+    calls = 1000
+
+    def save_burst():
+        for n in range(calls):
+            db_manager.save_progress(paths[n % len(paths)], n)
+    # The per-call cost is what a scrolling reader pays; the flush runs on the writer thread.
+    bench.time(f'progress_save_x{calls}', save_burst)
+    bench.time('progress_flush', lambda: (save_burst(), db_manager.flush()))
+    db_manager.close()
+
+
+def old_visible_length(content):
+    """The visible length as it was measured before text_metrics, or None without ebooklib and bs4."""
+    try:
+        from bs4 import BeautifulSoup
+        from ebooklib import epub
+    except ImportError:
+        return None
+    item = epub.EpubHtml(file_name='parity.xhtml')
+    item.content, item.book = content, epub.EpubBook()
+    return len(BeautifulSoup(item.get_content(), 'html.parser').get_text(strip=True))
+
+
+def check_text_parity(books):
+    """Compares count_visible_chars with the old measurement. Returns the documents that differ."""
+    documents = dict(PARITY_CASES)
+    for name, path in books.items():
+        with zipfile.ZipFile(path) as zf:
+            for entry in zf.namelist():
+                if entry.endswith('.xhtml'): documents[f'{name}/{entry}'] = zf.read(entry)
+    mismatched = []
+    for name, content in documents.items():
+        expected = old_visible_length(content)
+        if expected is None:
+            print("Text parity check skipped: ebooklib and bs4 are not installed.")
+            return []
+        if count_visible_chars(content) != expected: mismatched.append(name)
+    print(f"Text parity: {len(documents) - len(mismatched)}/{len(documents)} documents match the old measurement.")
+    for name in mismatched: print(f"  differs: {name}")
+    return mismatched
+
+
+# --- Results ---
+
+def compare(results, baseline, threshold):
+    """Prints each shared benchmark against the baseline. Returns the names that regressed."""
+    regressed = []
+    print(f"\n{'benchmark':40} {'baseline':>10} {'current':>10} {'change':>8}")
+    for name in sorted(results):
+        if name not in baseline: continue
+        before, after = baseline[name]['median_ms'], results[name]['median_ms']
+        change = (after - before) / before if before else 0.0
+        flag = ''
+        if change > threshold:
+            flag = '  REGRESSION'
+            regressed.append(name)
+        elif change < -threshold:
+            flag = '  faster'
+        print(f"{name:40} {before:10.2f} {after:10.2f} {change * 100:+7.1f}%{flag}")
+    return regressed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless benchmarks for ePub Swift.")
+    parser.add_argument('--output', default='benchmark_results.json', help="where to write the JSON results")
+    parser.add_argument('--baseline', help="earlier results file to compare against")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help="relative slowdown reported as a regression (default %(default)s)")
+    parser.add_argument('--fail-on-regression', action='store_true', help="exit with status 1 if anything regressed")
+    parser.add_argument('--repeat', type=int, default=5, help="samples per benchmark")
+    parser.add_argument('--quick', action='store_true', help="skip the large book and the 50k-row library")
+    parser.add_argument('--only', help="comma-separated groups: load,reader,library,progress,parity")
+    args = parser.parse_args(argv)
+    groups = set(args.only.split(',')) if args.only else {'load', 'reader', 'library', 'progress', 'parity'}
+
+    guard_signal_emit_refcount()
+    app = QApplication.instance() or QApplication([])
+    bench = Bench(args.repeat)
+    started = time.perf_counter()
+    with tempfile.TemporaryDirectory(prefix='epub_swift_bench_') as work_dir:
+        names = QUICK_BOOKS if args.quick else tuple(BOOKS)
+        books = {name: make_epub(os.path.join(work_dir, f'{name}.epub'), title=f"Benchmark {name}", **BOOKS[name])
+                 for name in names} if groups & {'load', 'reader', 'parity'} else {}
+        mismatched = check_text_parity(books) if 'parity' in groups else []
+        if 'load' in groups: bench_book_load(bench, books, work_dir)
+        if 'reader' in groups: bench_reader(bench, books, work_dir)
+        if 'library' in groups: bench_library(bench, QUICK_LIBRARY_SIZES if args.quick else LIBRARY_SIZES, work_dir)
+        if 'progress' in groups: bench_progress(bench, work_dir)
+
+    results = bench.results()
+    output = {
+        'version': RESULTS_VERSION,
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'), 'python': platform.python_version(),
+            'pyside': PYSIDE_VERSION, 'platform': platform.platform(), 'cpu_count': os.cpu_count(),
+            'repeat': args.repeat, 'quick': args.quick, 'seconds': round(time.perf_counter() - started, 1),
+        },
+        'results': results,
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(output, f, indent=2, sort_keys=True)
+
+    for name in sorted(results):
+        r = results[name]
+        print(f"{name:40} median {r['median_ms']:9.2f} ms   min {r['min_ms']:9.2f} ms")
+    print(f"\nResults written to {args.output}")
+
+    if mismatched:
+        print(f"\n{len(mismatched)} document(s) measure differently from the old text length.")
+        return 1
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)['results']
+        regressed = compare(results, baseline, args.threshold)
+        if regressed and args.fail_on_regression:
+            print(f"\n{len(regressed)} benchmark(s) regressed by more than {args.threshold * 100:.0f}%.")
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
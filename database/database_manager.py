@@ -1,19 +1,72 @@
 # database/database_manager.py
 import sqlite3
 import os
+import json
+import atexit
+import time
+import threading
 from utils.helpers import get_base_path
+from utils.tracing import traced
+
+# Bump this whenever the layout of a cached book index, or the way its
+# lengths are measured, changes so old entries are rebuilt instead of being misread.
+BOOK_INDEX_VERSION = 6
+
+# How long queued progress writes may wait before they are flushed together.
+PROGRESS_FLUSH_DELAY = 1.0
+
+# How long a write waits for another thread's transaction before giving up, in seconds.
+BUSY_TIMEOUT = 30.0
+
+# Library sort orders; each one is backed by an index on the books table.
+LIBRARY_SORTS = {
+    'title': "title COLLATE NOCASE ASC",
+    'last_opened': "last_opened DESC",
+    'progress': "progress DESC",
+}
+
+# Put in front of each token a full-text search matched, to find where the first one is.
+MATCH_MARK = '\x02'
+
+# Lookups by a list of keys are split into queries of at most this many
+# parameters (older SQLite builds allow 999).
+SQL_BATCH_SIZE = 500
 
 class DatabaseManager:
+    """
+    Gives every thread that uses it a long-lived SQLite connection of its
+    own (WAL journaling), so a worker's long transaction never holds up
+    reads on the GUI thread. Reading-progress writes go through a
+    write-behind queue that keeps only the latest position per book and is
+    flushed in a single transaction by a background thread.
+    """
+
     def __init__(self, db_name="epub_swift.db"):
         # Use the helper to ensure the db is created in the correct location
         base_path = get_base_path()
         self.db_path = os.path.join(base_path, db_name)
+        # Guards the progress queue and the connection list, never a query.
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()
+        self._local = threading.local()
+        self._connections = {}
         self._setup_database()
 
+        self._pending_progress = {}
+        # Positions taken off the queue by a flush that has not committed yet.
+        self._writing_progress = {}
+        self._flush_requested = threading.Event()
+        self._stop = threading.Event()
+        self._closing = False
+        self._flush_thread = threading.Thread(target=self._flush_loop, name="db-write-behind", daemon=True)
+        self._flush_thread.start()
+        atexit.register(self.close)
+
     def _setup_database(self):
         """Creates the database and tables if they don't exist."""
-        con = sqlite3.connect(self.db_path)
-        cur = con.cursor()
+        cur = self._con.cursor()
+        cur.execute("PRAGMA journal_mode=WAL")
+        cur.execute("PRAGMA synchronous=NORMAL")
         cur.execute("""
             CREATE TABLE IF NOT EXISTS books (
                 path TEXT PRIMARY KEY,
@@ -22,46 +75,540 @@ class DatabaseManager:
                 last_read_pos INTEGER DEFAULT 0
             )
         """)
-        con.commit()
+        self._migrate_books_table(cur)
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_books_title ON books (title COLLATE NOCASE)")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_books_last_opened ON books (last_opened DESC)")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_books_progress ON books (progress DESC)")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_books_fingerprint ON books (fingerprint)")
+        self._setup_search_index(cur)
+        self._setup_text_index(cur)
+        # Cached result of the spine length pass, keyed by path and the file's
+        # size/mtime so a changed file is detected and re-indexed.
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS book_index (
+                path TEXT PRIMARY KEY,
+                file_size INTEGER NOT NULL,
+                file_mtime INTEGER NOT NULL,
+                version INTEGER NOT NULL,
+                data TEXT NOT NULL
+            )
+        """)
+        # Folder imports that have started but not finished, so they can be resumed.
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS import_jobs (
+                root TEXT PRIMARY KEY,
+                started_at REAL NOT NULL,
+                completed INTEGER DEFAULT 0
+            )
+        """)
+        self._con.commit()
+
+    def _migrate_books_table(self, cur):
+        """Adds the columns newer versions need to a books table from an older release."""
+        columns = {row[1] for row in cur.execute("PRAGMA table_info(books)")}
+        for name, definition in (('author', "TEXT DEFAULT ''"), ('total_len', "INTEGER DEFAULT 0"),
+                                 ('last_opened', "REAL DEFAULT 0"), ('progress', "REAL DEFAULT 0"),
+                                 # NULL: cover not looked at yet; '': the book has no usable cover.
+                                 ('cover_key', "TEXT"),
+                                 # Content hash of the file (EpubContainer.fingerprint), for finding moved books.
+                                 ('fingerprint', "TEXT")):
+            if name not in columns:
+                cur.execute(f"ALTER TABLE books ADD COLUMN {name} {definition}")
+
+    def _setup_search_index(self, cur):
+        """Creates the FTS5 title/author index used by the library filter, if SQLite supports it."""
+        try:
+            exists = cur.execute("SELECT 1 FROM sqlite_master WHERE name = 'books_search'").fetchone()
+            cur.execute("""
+                CREATE VIRTUAL TABLE IF NOT EXISTS books_search USING fts5(
+                    title, author, content='books', content_rowid='rowid',
+                    tokenize='unicode61 remove_diacritics 2'
+                )
+            """)
+            cur.execute("""
+                CREATE TRIGGER IF NOT EXISTS books_search_insert AFTER INSERT ON books BEGIN
+                    INSERT INTO books_search (rowid, title, author) VALUES (new.rowid, new.title, new.author);
+                END
+            """)
+            cur.execute("""
+                CREATE TRIGGER IF NOT EXISTS books_search_delete AFTER DELETE ON books BEGIN
+                    INSERT INTO books_search (books_search, rowid, title, author) VALUES ('delete', old.rowid, old.title, old.author);
+                END
+            """)
+            cur.execute("""
+                CREATE TRIGGER IF NOT EXISTS books_search_update AFTER UPDATE OF title, author ON books BEGIN
+                    INSERT INTO books_search (books_search, rowid, title, author) VALUES ('delete', old.rowid, old.title, old.author);
+                    INSERT INTO books_search (rowid, title, author) VALUES (new.rowid, new.title, new.author);
+                END
+            """)
+            if not exists:
+                cur.execute("INSERT INTO books_search (books_search) VALUES ('rebuild')")
+            self.has_search_index = True
+        except sqlite3.OperationalError:
+            # Builds without FTS5 fall back to a LIKE filter.
+            self.has_search_index = False
+
+    def _setup_text_index(self, cur):
+        """Creates the FTS5 index of book contents, if SQLite supports it."""
+        # Passages of one book are inserted together, so their rowids form a
+        # contiguous range; book_text_state remembers it for cheap replacement.
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS book_text_state (
+                path TEXT PRIMARY KEY,
+                file_size INTEGER NOT NULL,
+                file_mtime INTEGER NOT NULL,
+                first_rowid INTEGER,
+                last_rowid INTEGER
+            )
+        """)
+        try:
+            cur.execute("""
+                CREATE VIRTUAL TABLE IF NOT EXISTS book_text USING fts5(
+                    content, path UNINDEXED, spine_index UNINDEXED, char_offset UNINDEXED,
+                    tokenize='unicode61 remove_diacritics 2'
+                )
+            """)
+            self.has_text_index = True
+        except sqlite3.OperationalError:
+            self.has_text_index = False
+
+    def close(self):
+        """Flushes queued writes and closes the connection. Safe to call more than once."""
+        if self._closing: return
+        self._closing = True
+        self._stop.set()
+        self._flush_requested.set()
+        self._flush_thread.join()
+        self.flush()
+        with self._lock:
+            connections, self._connections = list(self._connections.values()), {}
+        for con in connections: con.close()
+
+    @property
+    def _con(self):
+        """The calling thread's connection, opened on first use."""
+        con = getattr(self._local, 'con', None)
+        if con is None:
+            # Only ever used by this thread; close() may close it from another one at exit.
+            con = sqlite3.connect(self.db_path, timeout=BUSY_TIMEOUT, check_same_thread=False)
+            con.execute("PRAGMA synchronous=NORMAL")
+            self._local.con = con
+            with self._lock:
+                self._connections[threading.get_ident()] = con
+        return con
+
+    def release_connection(self):
+        """Closes the calling thread's connection. Worker threads call this when they finish."""
+        con = getattr(self._local, 'con', None)
+        if con is None: return
+        self._local.con = None
+        with self._lock:
+            self._connections.pop(threading.get_ident(), None)
         con.close()
-    
-    def load_library(self):
-        """Loads the book library from the SQLite database."""
-        library = []
+
+    # --- Write-Behind Progress Queue ---
+
+    def _flush_loop(self):
+        while not self._closing:
+            self._flush_requested.wait()
+            if self._closing: break
+            # Give repeated saves a moment to coalesce before writing.
+            self._stop.wait(PROGRESS_FLUSH_DELAY)
+            self._flush_requested.clear()
+            self.flush()
+
+    @traced('db.flush_progress')
+    def flush(self):
+        """Writes all queued progress updates in one transaction."""
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending_progress: return
+                pending, self._pending_progress = self._pending_progress, {}
+                self._writing_progress = pending
+            # The queue stays open while this waits for the database.
+            try:
+                with self._con:
+                    self._con.executemany("""
+                        UPDATE books SET last_read_pos = ?,
+                            progress = CASE WHEN total_len > 0 THEN CAST(? AS REAL) / total_len ELSE 0 END
+                        WHERE path = ?
+                    """, [(position, position, path) for path, position in pending.items()])
+            except sqlite3.Error as e:
+                print(f"Database error: {e}")
+            finally:
+                with self._lock:
+                    self._writing_progress = {}
+
+    def _queued_progress(self):
+        """Positions queued or being written. Taken before a read, so none can be missed by it."""
+        with self._lock:
+            return {**self._writing_progress, **self._pending_progress}
+
+    @staticmethod
+    def _with_queued_progress(book, queued):
+        """A library row as it will be once queued progress is written, without writing it now."""
+        position = queued.get(book['path'])
+        if position is not None:
+            book['last_read_pos'] = position
+            book['progress'] = position / book['total_len'] if book['total_len'] > 0 else 0
+        return book
+
+    # --- Library ---
+
+    def _filter_clause(self, text):
+        """SQL condition and parameters for the library's title/author filter."""
+        terms = text.split()
+        if not terms: return "", []
+        if self.has_search_index:
+            # Every term must match as a prefix; quotes keep user input literal.
+            query = ' '.join('"' + term.replace('"', '""') + '"*' for term in terms)
+            return "WHERE rowid IN (SELECT rowid FROM books_search WHERE books_search MATCH ?)", [query]
+        conditions = " AND ".join("(title LIKE ? OR author LIKE ?)" for _ in terms)
+        params = [value for term in terms for value in (f"%{term}%", f"%{term}%")]
+        return "WHERE " + conditions, params
+
+    @traced('db.count_books')
+    def count_books(self, filter_text=""):
+        """Number of library rows matching a filter."""
+        where, params = self._filter_clause(filter_text)
+        try:
+            return self._con.execute(f"SELECT COUNT(*) FROM books {where}", params).fetchone()[0]
+        except sqlite3.Error as e:
+            print(f"Database error: {e}")
+            return 0
+
+    @traced('db.fetch_library_page')
+    def fetch_library_page(self, offset, limit, sort='title', filter_text=""):
+        """Loads one page of the library in the given sort order."""
+        where, params = self._filter_clause(filter_text)
+        order = LIBRARY_SORTS.get(sort, LIBRARY_SORTS['title'])
+        queued = self._queued_progress()
+        try:
+            cur = self._con.execute(f"""
+                SELECT path, title, chapter_count, last_read_pos, author, total_len, progress, cover_key FROM books
+                {where} ORDER BY {order} LIMIT ? OFFSET ?
+            """, params + [limit, offset])
+            rows = cur.fetchall()
+            # Queued positions show up at once; the progress sort order catches up when they are flushed.
+            return [self._with_queued_progress(self._book_from_row(row), queued) for row in rows]
+        except sqlite3.Error as e:
+            print(f"Database error: {e}")
+            return []
+
+    @traced('db.get_book')
+    def get_book(self, path):
+        """Returns one library entry, or None if the path is not in the library."""
+        queued = self._queued_progress()
         try:
-            con = sqlite3.connect(self.db_path)
-            cur = con.cursor()
-            cur.execute("SELECT path, title, chapter_count, last_read_pos FROM books")
-            for row in cur.fetchall():
-                library.append({
-                    'path': row[0], 'title': row[1], 'pages': row[2], 'last_read_pos': row[3]
-                })
-            con.close()
+            row = self._con.execute("""
+                SELECT path, title, chapter_count, last_read_pos, author, total_len, progress, cover_key
+                FROM books WHERE path = ?
+            """, (path,)).fetchone()
+            # A position queued by the last book switch is read from the queue, not committed first.
+            return self._with_queued_progress(self._book_from_row(row), queued) if row else None
         except sqlite3.Error as e:
             print(f"Database error: {e}")
-        return library
+            return None
 
+    @staticmethod
+    def _book_from_row(row):
+        return {
+            'path': row[0], 'title': row[1], 'pages': row[2], 'last_read_pos': row[3],
+            'author': row[4] or '', 'total_len': row[5] or 0, 'progress': row[6] or 0, 'cover_key': row[7]
+        }
+
+    @traced('db.add_or_update_book')
     def add_or_update_book(self, book_data):
-        """Adds a new book or updates an existing one in the database."""
+        """Adds a new book or updates an existing one in the database, and marks it as just opened."""
         try:
-            con = sqlite3.connect(self.db_path)
-            cur = con.cursor()
-            # Use INSERT OR IGNORE to avoid overwriting existing progress
-            cur.execute("INSERT OR IGNORE INTO books (path, title, chapter_count) VALUES (?, ?, ?)",
-                        (book_data['path'], book_data['title'], book_data['pages']))
-            con.commit()
-            con.close()
+            with self._con:
+                # The upsert keeps any reading progress already stored for the path.
+                self._con.execute("""
+                    INSERT INTO books (path, title, chapter_count, author, total_len, last_opened, cover_key, fingerprint)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(path) DO UPDATE SET title = excluded.title, chapter_count = excluded.chapter_count,
+                        author = excluded.author, total_len = excluded.total_len, last_opened = excluded.last_opened,
+                        cover_key = excluded.cover_key, fingerprint = COALESCE(excluded.fingerprint, books.fingerprint),
+                        progress = CASE WHEN excluded.total_len > 0 THEN CAST(books.last_read_pos AS REAL) / excluded.total_len ELSE 0 END
+                """, (book_data['path'], book_data['title'], book_data['pages'], book_data.get('author', ''),
+                      book_data.get('total_len', 0), time.time(), book_data.get('cover_key'), book_data.get('fingerprint')))
         except sqlite3.Error as e:
             print(f"Database error: {e}")
-        
+
+    def set_cover_key(self, path, key):
+        """Records the thumbnail key of a book, or NO_COVER when it has none."""
+        try:
+            with self._con:
+                self._con.execute("UPDATE books SET cover_key = ? WHERE path = ?", (key, path))
+        except sqlite3.Error as e:
+            print(f"Database error: {e}")
+
     def save_progress(self, path, position):
-        """Saves the current reading position to the database."""
+        """Queues the current reading position; repeated saves for a book are merged."""
         if not path: return
+        with self._lock:
+            self._pending_progress[path] = position
+        if self._closing:
+            self.flush()
+            return
+        self._flush_requested.set()
+
+    @traced('db.save_imported_books')
+    def save_imported_books(self, records):
+        """Writes a batch of imported books and their cached indexes in one transaction."""
         try:
-            con = sqlite3.connect(self.db_path)
-            cur = con.cursor()
-            cur.execute("UPDATE books SET last_read_pos = ? WHERE path = ?", (position, path))
-            con.commit()
-            con.close()
+            with self._con:
+                # The upsert keeps any reading progress already stored for the path.
+                self._con.executemany("""
+                    INSERT INTO books (path, title, chapter_count, author, total_len, cover_key, fingerprint) VALUES (?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(path) DO UPDATE SET title = excluded.title, chapter_count = excluded.chapter_count,
+                        author = excluded.author, total_len = excluded.total_len, cover_key = excluded.cover_key,
+                        fingerprint = COALESCE(excluded.fingerprint, books.fingerprint),
+                        progress = CASE WHEN excluded.total_len > 0 THEN CAST(books.last_read_pos AS REAL) / excluded.total_len ELSE 0 END
+                """, [(r['path'], r['index']['title'], sum(1 for c in r['index']['chapters'] if not c.get('depth')), r['index'].get('author', ''),
+                       r['index']['total_len'], r.get('cover_key'), r.get('fingerprint')) for r in records])
+                self._con.executemany("INSERT OR REPLACE INTO book_index (path, file_size, file_mtime, version, data) VALUES (?, ?, ?, ?, ?)",
+                                      [(r['path'], r['size'], r['mtime'], BOOK_INDEX_VERSION, json.dumps(r['index'])) for r in records])
         except sqlite3.Error as e:
             print(f"Database error: {e}")
+
+    # --- Moved Books ---
+
+    def paths_without_fingerprint(self):
+        """Library paths imported before fingerprints were recorded."""
+        try:
+            return [row[0] for row in self._con.execute("SELECT path FROM books WHERE fingerprint IS NULL")]
+        except sqlite3.Error as e:
+            print(f"Database error: {e}")
+            return []
+
+    def set_fingerprints(self, fingerprints):
+        """Records (path, fingerprint) pairs in one transaction."""
+        try:
+            with self._con:
+                self._con.executemany("UPDATE books SET fingerprint = ? WHERE path = ?",
+                                      [(fingerprint, path) for path, fingerprint in fingerprints])
+        except sqlite3.Error as e:
+            print(f"Database error: {e}")
+
+    @traced('db.rebind_moved_books')
+    def rebind_moved_books(self, found):
+        """
+        Reconnects books whose files were moved or renamed. `found` holds
+        (path, file_size, file_mtime, fingerprint) for files that are not in
+        the library; each one whose fingerprint belongs to a book whose file
+        is gone takes over that book's row (progress included), its cached
+        index and its full-text passages, all in one transaction.
+        Returns the (old_path, new_path) pairs that were rebound.
+        """
+        found = [f for f in found if f and f[3]]
+        if not found: return []
+        self.flush()
+        try:
+            with self._con:
+                fingerprints = list({f[3] for f in found})
+                owners = {}
+                for start in range(0, len(fingerprints), SQL_BATCH_SIZE):
+                    chunk = fingerprints[start:start + SQL_BATCH_SIZE]
+                    cur = self._con.execute(f"SELECT fingerprint, path FROM books WHERE fingerprint IN ({','.join('?' * len(chunk))})", chunk)
+                    for fingerprint, path in cur.fetchall():
+                        owners.setdefault(fingerprint, []).append(path)
+                moves = []
+                for path, file_size, file_mtime, fingerprint in found:
+                    # A copy whose original is still there is a book of its own.
+                    old_path = next((p for p in owners.get(fingerprint, ()) if p != path and not os.path.exists(p)), None)
+                    if old_path is None: continue
+                    if self._con.execute("SELECT 1 FROM books WHERE path = ?", (path,)).fetchone(): continue
+                    owners[fingerprint].remove(old_path)
+                    moves.append((old_path, path))
+                    self._con.execute("UPDATE books SET path = ? WHERE path = ?", (path, old_path))
+                    # Same contents, so the cached index stays valid for the file's new size/mtime.
+                    self._con.execute("UPDATE OR REPLACE book_index SET path = ?, file_size = ?, file_mtime = ? WHERE path = ?",
+                                      (path, file_size, file_mtime, old_path))
+                    state = self._con.execute("SELECT first_rowid, last_rowid FROM book_text_state WHERE path = ?", (old_path,)).fetchone()
+                    if state is None: continue
+                    self._con.execute("UPDATE OR REPLACE book_text_state SET path = ?, file_size = ?, file_mtime = ? WHERE path = ?",
+                                      (path, file_size, file_mtime, old_path))
+                    if self.has_text_index and state[0] is not None:
+                        self._con.execute("UPDATE book_text SET path = ? WHERE rowid BETWEEN ? AND ?", (path,) + state)
+                return moves
+        except sqlite3.Error as e:
+            print(f"Database error: {e}")
+            return []
+
+    # --- Import Jobs ---
+
+    def start_import_job(self, root):
+        try:
+            with self._con:
+                self._con.execute("INSERT OR REPLACE INTO import_jobs (root, started_at, completed) VALUES (?, ?, 0)",
+                                  (root, time.time()))
+        except sqlite3.Error as e:
+            print(f"Database error: {e}")
+
+    def finish_import_job(self, root):
+        try:
+            with self._con:
+                self._con.execute("UPDATE import_jobs SET completed = 1 WHERE root = ?", (root,))
+        except sqlite3.Error as e:
+            print(f"Database error: {e}")
+
+    def unfinished_import_jobs(self):
+        """Folders whose import was cancelled or interrupted, most recent first."""
+        try:
+            cur = self._con.execute("SELECT root FROM import_jobs WHERE completed = 0 ORDER BY started_at DESC")
+            return [row[0] for row in cur.fetchall()]
+        except sqlite3.Error as e:
+            print(f"Database error: {e}")
+            return []
+
+    # --- Full-Text Index ---
+
+    def library_paths(self):
+        try:
+            return [row[0] for row in self._con.execute("SELECT path FROM books")]
+        except sqlite3.Error as e:
+            print(f"Database error: {e}")
+            return []
+
+    def text_index_signatures(self):
+        """Maps every path in the full-text index to the (size, mtime) it was indexed at."""
+        try:
+            cur = self._con.execute("SELECT path, file_size, file_mtime FROM book_text_state")
+            return {row[0]: (row[1], row[2]) for row in cur.fetchall()}
+        except sqlite3.Error as e:
+            print(f"Database error: {e}")
+            return {}
+
+    @traced('db.replace_book_text')
+    def replace_book_text(self, path, file_size, file_mtime, passages):
+        """Swaps a book's passages in the full-text index in one transaction."""
+        if not self.has_text_index: return
+        try:
+            with self._con:
+                old = self._con.execute("SELECT first_rowid, last_rowid FROM book_text_state WHERE path = ?", (path,)).fetchone()
+                if old and old[0] is not None:
+                    self._con.execute("DELETE FROM book_text WHERE rowid BETWEEN ? AND ?", old)
+                first = last = None
+                if passages:
+                    first = (self._con.execute("SELECT MAX(rowid) FROM book_text").fetchone()[0] or 0) + 1
+                    self._con.executemany("INSERT INTO book_text (rowid, content, path, spine_index, char_offset) VALUES (?, ?, ?, ?, ?)",
+                                          [(first + i, text, path, spine_index, offset)
+                                           for i, (spine_index, offset, text) in enumerate(passages)])
+                    last = first + len(passages) - 1
+                self._con.execute("INSERT OR REPLACE INTO book_text_state (path, file_size, file_mtime, first_rowid, last_rowid) VALUES (?, ?, ?, ?, ?)",
+                                  (path, file_size, file_mtime, first, last))
+        except sqlite3.Error as e:
+            print(f"Database error: {e}")
+
+    @traced('db.search_text')
+    def search_text(self, text, limit=200):
+        """
+        Searches book contents. Each hit carries the spine index and the
+        visible-text offset of the first matching term, for jump_to_position.
+        The offset comes from FTS5 itself (highlight() marks the tokens it
+        matched), so it agrees with the tokenizer on word boundaries and
+        diacritics.
+        """
+        from utils.book_index import PASSAGE_SEPARATOR, passage_offset
+        terms = text.split()
+        if not terms or not self.has_text_index: return []
+        query = ' '.join('"' + term.replace('"', '""') + '"' for term in terms) + '*'
+        try:
+            rows = self._con.execute("""
+                SELECT t.path, b.title, t.spine_index, t.char_offset,
+                       highlight(book_text, 0, ?, ''), snippet(book_text, 0, '[', ']', '…', 16)
+                FROM book_text t LEFT JOIN books b ON b.path = t.path
+                WHERE book_text MATCH ? ORDER BY rank LIMIT ?
+            """, (MATCH_MARK, query, limit)).fetchall()
+        except sqlite3.Error as e:
+            print(f"Database error: {e}")
+            return []
+        hits = []
+        for path, title, spine_index, char_offset, marked, snippet in rows:
+            # Nothing is marked before the first match, so its position is also its position in the passage.
+            position = marked.find(MATCH_MARK)
+            hits.append({
+                'path': path, 'title': title or os.path.basename(path), 'spine_index': int(spine_index),
+                'char_offset': int(char_offset) + (passage_offset(marked, position) if position > 0 else 0),
+                'snippet': snippet.replace(PASSAGE_SEPARATOR, ' ')
+            })
+        return hits
+
+    # --- Book Index Cache ---
+
+    def indexed_signatures(self):
+        """Maps every path with a current cached index to its (size, mtime)."""
+        try:
+            cur = self._con.execute("SELECT path, file_size, file_mtime FROM book_index WHERE version = ?",
+                                    (BOOK_INDEX_VERSION,))
+            return {row[0]: (row[1], row[2]) for row in cur.fetchall()}
+        except sqlite3.Error as e:
+            print(f"Database error: {e}")
+            return {}
+
+    @traced('db.load_book_index')
+    def load_book_index(self, path, file_size, file_mtime):
+        """Returns the cached index for a book, or None if missing, stale or corrupt."""
+        try:
+            cur = self._con.execute("SELECT file_size, file_mtime, version, data FROM book_index WHERE path = ?", (path,))
+            row = cur.fetchone()
+        except sqlite3.Error as e:
+            print(f"Database error: {e}")
+            return None
+        if not row: return None
+        size, mtime, version, data = row
+        if size != file_size or mtime != file_mtime or version != BOOK_INDEX_VERSION:
+            return None
+        try:
+            index = json.loads(data)
+        except ValueError:
+            index = None
+        if not self._is_valid_book_index(index):
+            # A corrupt entry is dropped so the next load rebuilds it cleanly.
+            self.delete_book_index(path)
+            return None
+        return index
+
+    @traced('db.save_book_index')
+    def save_book_index(self, path, file_size, file_mtime, index):
+        """Stores (or replaces) the cached index for a book."""
+        try:
+            with self._con:
+                self._con.execute("INSERT OR REPLACE INTO book_index (path, file_size, file_mtime, version, data) VALUES (?, ?, ?, ?, ?)",
+                                  (path, file_size, file_mtime, BOOK_INDEX_VERSION, json.dumps(index)))
+        except sqlite3.Error as e:
+            print(f"Database error: {e}")
+
+    def delete_book_index(self, path):
+        """Removes the cached index for a book."""
+        try:
+            with self._con:
+                self._con.execute("DELETE FROM book_index WHERE path = ?", (path,))
+        except sqlite3.Error as e:
+            print(f"Database error: {e}")
+
+    @staticmethod
+    def _is_valid_book_index(index):
+        """Sanity-checks a decoded index so a damaged row is never trusted."""
+        if not isinstance(index, dict): return False
+        try:
+            title = index['title']
+            chapters = index['chapters']
+            spine = index['spine']
+            chap_lens = index['chap_lens']
+            cum_lens = index['cum_lens']
+            total_len = index['total_len']
+        except KeyError:
+            return False
+        if not isinstance(title, str) or not isinstance(chapters, list) or not isinstance(spine, list):
+            return False
+        if not all(isinstance(c, dict) and 'title' in c and 'href' in c for c in chapters):
+            return False
+        if len(index.get('toc_offsets', ())) != len(chapters):
+            return False
+        if len(spine) != len(chap_lens) or len(cum_lens) != len(chap_lens) + 1 or cum_lens[0] != 0:
+            return False
+        if any(cum_lens[i] + chap_lens[i] != cum_lens[i + 1] for i in range(len(chap_lens))):
+            return False
+        return total_len == cum_lens[-1]
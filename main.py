@@ -2,17 +2,39 @@
 
 import sys
 import os
+import multiprocessing
 
 # این چند خط کد مشکل را حل می‌کند
 # Add the project's root directory to the Python path
 # This ensures that modules in subdirectories (like ui, database) can be found
 sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
 
-from PySide6.QtWidgets import QApplication
-from ui.main_window import EpubReader
-
 if __name__ == "__main__":
+    # Needed for the text-measurement process pool in the PyInstaller build.
+    multiprocessing.freeze_support()
+
+    # `main.py index ...` and friends run without Qt widgets or a display.
+    from utils.headless import COMMANDS, run_command
+    if len(sys.argv) > 1 and sys.argv[1] in COMMANDS:
+        sys.exit(run_command(sys.argv[1:]))
+
+    from utils.startup_profile import profile, profiling_requested, PROFILE_FLAG
+    if profiling_requested(sys.argv):
+        profile.enable()
+        sys.argv = [arg for arg in sys.argv if arg != PROFILE_FLAG]
+
+    # Imported here so worker processes (which re-import this module) stay light.
+    from PySide6.QtWidgets import QApplication
+    profile.mark('import Qt')
+    from ui.main_window import EpubReader
+    profile.mark('import application modules')
+
+    from ui.qt_compat import guard_signal_emit_refcount
+    guard_signal_emit_refcount()
+
     app = QApplication(sys.argv)
+    profile.mark('create QApplication')
     reader = EpubReader()
     reader.show()
+    profile.mark('show window')
     sys.exit(app.exec())
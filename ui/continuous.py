@@ -0,0 +1,132 @@
+# ui/continuous.py
+from bisect import bisect_right
+from PySide6.QtGui import QTextCursor, QTextBlockFormat, QTextCharFormat
+
+# Continuous-scroll mode shows the spine as one long text, but the text
+# display only ever holds a small window of it: the document being read and
+# its neighbours, one segment each. As the reader crosses into another
+# segment, the one furthest behind is cut off and the next one appended, so
+# memory and layout cost stay the same however long the book is.
+
+# Documents kept on each side of the one being read.
+WINDOW_RADIUS = 1
+# Every segment starts with an empty paragraph of its own. Inserted HTML
+# merges its first block into the block at the cursor, so without it a
+# document's first paragraph would lose its format (heading, margins, direction).
+SEGMENT_SEPARATOR = '<p></p>'
+
+
+class ChapterSegment:
+    """One spine document inside the window: where its blocks start and end, and its anchor map once built."""
+    __slots__ = ('spine_index', 'chapter', 'first_block', 'end_block', 'anchor_map')
+
+    def __init__(self, spine_index, chapter, first_block, end_block):
+        self.spine_index = spine_index
+        self.chapter = chapter
+        self.first_block = first_block
+        self.end_block = end_block
+        self.anchor_map = None
+
+    def shift(self, blocks):
+        self.first_block += blocks
+        self.end_block += blocks
+        self.anchor_map = None
+
+
+class ChapterWindow:
+    """The consecutive spine documents held in a text display, and where each one's blocks are."""
+
+    def __init__(self, display):
+        self.display = display
+        self.segments = []
+
+    def __bool__(self):
+        return bool(self.segments)
+
+    def spine_indexes(self):
+        return [s.spine_index for s in self.segments]
+
+    def segment(self, spine_index):
+        return next((s for s in self.segments if s.spine_index == spine_index), None)
+
+    def segment_for_block(self, block_number):
+        if not self.segments: return None
+        i = bisect_right([s.first_block for s in self.segments], block_number) - 1
+        return self.segments[max(i, 0)]
+
+    def anchor_map(self, segment):
+        if segment.anchor_map is None:
+            from utils.anchor_map import AnchorMap
+            texts = []
+            block = self.display.document().findBlockByNumber(segment.first_block)
+            while block.isValid() and block.blockNumber() < segment.end_block:
+                texts.append(block.text())
+                block = block.next()
+            segment.anchor_map = AnchorMap(texts, segment.chapter.profile, segment.first_block)
+        return segment.anchor_map
+
+    def clear(self):
+        self.segments = []
+
+    def fill(self, chapters):
+        """Replaces the display's text with consecutive rendered chapters, given as (spine_index, chapter) pairs."""
+        self.segments = []
+        self.display.setHtml("")
+        # The window is changed in place, never edited back, so there is nothing to undo.
+        self.display.document().setUndoRedoEnabled(False)
+        for spine_index, chapter in chapters:
+            self.append(spine_index, chapter)
+
+    def move_to(self, chapters):
+        """
+        Changes the window to hold `chapters`, touching only its ends when the
+        two overlap: segments no longer wanted are cut off, new ones added.
+        """
+        wanted = [i for i, _ in chapters]
+        if not self.segments or wanted[-1] < self.segments[0].spine_index or wanted[0] > self.segments[-1].spine_index:
+            self.fill(chapters)
+            return
+        while self.segments and self.segments[0].spine_index < wanted[0]: self.drop_first()
+        while self.segments and self.segments[-1].spine_index > wanted[-1]: self.drop_last()
+        for spine_index, chapter in reversed(chapters):
+            if spine_index < self.segments[0].spine_index: self.prepend(spine_index, chapter)
+        for spine_index, chapter in chapters:
+            if spine_index > self.segments[-1].spine_index: self.append(spine_index, chapter)
+
+    def append(self, spine_index, chapter):
+        document = self.display.document()
+        cursor = QTextCursor(document)
+        cursor.movePosition(QTextCursor.End)
+        if self.segments:
+            cursor.insertBlock(QTextBlockFormat(), QTextCharFormat())
+        first_block = cursor.blockNumber()
+        cursor.insertHtml(SEGMENT_SEPARATOR + chapter.html)
+        self.segments.append(ChapterSegment(spine_index, chapter, first_block, document.blockCount()))
+
+    def prepend(self, spine_index, chapter):
+        document = self.display.document()
+        before = document.blockCount()
+        cursor = QTextCursor(document)
+        # The old first separator ends up under the new document; a fresh one is put after it.
+        cursor.insertHtml(SEGMENT_SEPARATOR + chapter.html)
+        cursor.insertBlock(QTextBlockFormat(), QTextCharFormat())
+        added = document.blockCount() - before
+        for segment in self.segments: segment.shift(added)
+        self.segments.insert(0, ChapterSegment(spine_index, chapter, 0, added))
+
+    def drop_first(self):
+        document = self.display.document()
+        removed = self.segments.pop(0).end_block
+        cursor = QTextCursor(document)
+        cursor.setPosition(document.findBlockByNumber(removed).position(), QTextCursor.KeepAnchor)
+        # Leaves the next segment's separator merged into the first block, which was a separator too.
+        cursor.removeSelectedText()
+        for segment in self.segments: segment.shift(-removed)
+
+    def drop_last(self):
+        document = self.display.document()
+        segment = self.segments.pop()
+        cursor = QTextCursor(document)
+        cursor.setPosition(document.findBlockByNumber(segment.first_block).position() - 1)
+        cursor.movePosition(QTextCursor.End, QTextCursor.KeepAnchor)
+        cursor.removeSelectedText()
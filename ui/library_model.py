@@ -0,0 +1,138 @@
+# ui/library_model.py
+from collections import OrderedDict
+from PySide6.QtCore import Qt, QAbstractListModel, QModelIndex, Signal
+from PySide6.QtGui import QPixmap, QColor
+from utils.thumbnails import THUMBNAIL_SIZE, NO_COVER
+from utils.tracing import tracer
+
+class LibraryModel(QAbstractListModel):
+    """
+    A list model over the books table that loads rows from SQLite one page at
+    a time as the view scrolls, so startup cost and memory do not grow with
+    the size of the library.
+    """
+    PAGE_SIZE = 200
+    # Decoded cover pixmaps kept in memory; the rest stay in the on-disk cache.
+    COVER_CACHE_SIZE = 300
+    thumbnail_requested = Signal(str)
+    cover_requested = Signal(str)
+
+    def __init__(self, db_manager, parent=None):
+        super().__init__(parent)
+        self.db_manager = db_manager
+        self.sort = 'last_opened'
+        self.filter_text = ""
+        self.rows = []
+        self.total = 0
+        self.covers = OrderedDict()
+        # Rows waiting on a thumbnail load (by key) or a first cover extraction (by path).
+        self.pending_loads = {}
+        self.pending_covers = {}
+        self.placeholder = QPixmap(THUMBNAIL_SIZE)
+        self.placeholder.fill(QColor("#e1e5ea"))
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or index.row() >= len(self.rows): return None
+        book = self.rows[index.row()]
+        if role == Qt.DisplayRole:
+            return f"📖 {book['title']}\n📄 Chapters: {book['pages']}"
+        if role == Qt.DecorationRole:
+            return self.cover(index.row(), book)
+        if role == Qt.UserRole:
+            return book['path']
+        if role == Qt.ToolTipRole:
+            progress = f"{book['progress'] * 100:.0f}% read"
+            return f"{book['author']}\n{progress}" if book['author'] else progress
+        return None
+
+    # --- Cover Thumbnails ---
+
+    def cover(self, row, book):
+        """
+        The cover pixmap of a row. The view only asks for rows it paints, so
+        thumbnails are requested lazily; the placeholder shows until they arrive.
+        """
+        key = book['cover_key']
+        if key == NO_COVER: return self.placeholder
+        if key is None:
+            if book['path'] not in self.pending_covers:
+                self.pending_covers[book['path']] = row
+                tracer.queued('thumbnail.generate', book['path'])
+                self.cover_requested.emit(book['path'])
+            return self.placeholder
+        pixmap = self.covers.get(key)
+        if pixmap is not None:
+            self.covers.move_to_end(key)
+            return pixmap
+        rows = self.pending_loads.get(key)
+        if rows is None:
+            self.pending_loads[key] = {row}
+            tracer.queued('thumbnail.load', key)
+            self.thumbnail_requested.emit(key)
+        else:
+            rows.add(row)
+        return self.placeholder
+
+    def on_thumbnail_loaded(self, key, image):
+        rows = self.pending_loads.pop(key, ())
+        if image.isNull():
+            # Evicted from the disk cache: make it again from the book.
+            for row in rows:
+                if row < len(self.rows) and self.rows[row]['cover_key'] == key:
+                    self.rows[row]['cover_key'] = None
+                    self.cover_changed(row)
+            return
+        self.covers[key] = QPixmap.fromImage(image)
+        if len(self.covers) > self.COVER_CACHE_SIZE: self.covers.popitem(last=False)
+        for row in rows:
+            if row < len(self.rows) and self.rows[row]['cover_key'] == key: self.cover_changed(row)
+
+    def on_cover_generated(self, path, key):
+        row = self.pending_covers.pop(path, None)
+        self.db_manager.set_cover_key(path, key)
+        if row is None or row >= len(self.rows) or self.rows[row]['path'] != path:
+            # The model was refreshed meanwhile; the book may sit on another row now.
+            row = next((i for i, book in enumerate(self.rows) if book['path'] == path), None)
+            if row is None: return
+        self.rows[row]['cover_key'] = key
+        self.cover_changed(row)
+
+    def cover_changed(self, row):
+        index = self.index(row)
+        self.dataChanged.emit(index, index, [Qt.DecorationRole])
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and len(self.rows) < self.total
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid(): return
+        page = self.db_manager.fetch_library_page(len(self.rows), self.PAGE_SIZE, self.sort, self.filter_text)
+        if not page:
+            # The table shrank underneath us; stop asking for more.
+            self.total = len(self.rows)
+            return
+        self.beginInsertRows(QModelIndex(), len(self.rows), len(self.rows) + len(page) - 1)
+        self.rows.extend(page)
+        self.endInsertRows()
+
+    def refresh(self):
+        """Reloads from the first page, keeping the current sort and filter."""
+        self.beginResetModel()
+        self.rows = []
+        self.total = self.db_manager.count_books(self.filter_text)
+        self.endResetModel()
+        if self.canFetchMore(): self.fetchMore()
+
+    def set_sort(self, sort):
+        if sort == self.sort: return
+        self.sort = sort
+        self.refresh()
+
+    def set_filter(self, text):
+        text = text.strip()
+        if text == self.filter_text: return
+        self.filter_text = text
+        self.refresh()
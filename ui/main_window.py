@@ -1,43 +1,160 @@
 # ui/main_window.py
 import os
+import math
+from bisect import bisect_left, bisect_right
 from PySide6.QtWidgets import (
-    QApplication, QMainWindow, QFileDialog, QTextBrowser, QListWidget, QWidget,
-    QVBoxLayout, QHBoxLayout, QSplitter, QTabWidget, QListWidgetItem
+    QApplication, QMainWindow, QFileDialog, QListWidget, QListView, QWidget,
+    QVBoxLayout, QHBoxLayout, QSplitter, QTabWidget, QTabBar, QToolTip, QProgressDialog, QLineEdit, QComboBox,
+    QListWidgetItem, QLabel, QPushButton, QTextEdit, QInputDialog
 )
-from PySide6.QtGui import QAction, QKeySequence, QFontDatabase, QFont, QIcon
-from PySide6.QtCore import Qt, QThread, QTimer
+from PySide6.QtGui import QAction, QKeySequence, QFontDatabase, QFont, QIcon, QCursor, QShortcut, QTextCursor, QColor
+from PySide6.QtCore import Qt, QThread, QTimer, Signal, QRegularExpression, QPointF
 
-from bs4 import BeautifulSoup
 from database.database_manager import DatabaseManager
-from ui.widgets import ClickableProgressBar, LoadingSpinner, AboutDialog
-from ui.workers import BookLoaderWorker
-from utils.helpers import is_rtl
+from ui.continuous import WINDOW_RADIUS, ChapterWindow
+from ui.library_model import LibraryModel
+from ui.widgets import (
+    BookTextBrowser, ClickableProgressBar, FirstPaintWatcher, LoadingSpinner, AboutDialog, PerformanceOverlay
+)
+from ui.workers import (
+    BookExportWorker, BookLoadPool, BookFindWorker, ChapterPrefetchWorker, ImageDecodeWorker, LibraryImportWorker,
+    LibraryTextIndexWorker, PageLayoutWorker, ThumbnailWorker
+)
+from utils.anchor_map import AnchorMap, count_text_chars, text_char_index
+from utils.epub_container import split_fragment
+from utils.helpers import is_rtl, normalize_book_path, iter_epub_files
+from utils.lru_cache import SizedLRUCache
+from utils.memory_budget import MemoryBudget, MIN_CACHE_BYTES, memory_cap_bytes, process_rss
+from utils.startup_profile import profile
+from utils.thumbnails import THUMBNAIL_SIZE, ThumbnailCache, covers_directory
+from utils.tracing import tracer, traced
+
+# Upper bound for rendered chapter HTML kept in memory across all books.
+CHAPTER_CACHE_BYTES = 64 * 1024 * 1024
+# Upper bound for decoded (already downscaled) book images, shared by all chapters.
+IMAGE_CACHE_BYTES = 128 * 1024 * 1024
+# How often resident memory is compared with the cap.
+MEMORY_CHECK_MS = 5000
+# Page tables of every chapter laid out for paginated mode, for all books and page sizes.
+PAGE_TABLE_CACHE_BYTES = 8 * 1024 * 1024
+# A resize relays out the pages once it has settled for this long.
+PAGE_LAYOUT_DELAY_MS = 150
 
 class EpubReader(QMainWindow):
-    def __init__(self):
+    prefetch_requested = Signal(object, object, str)
+    render_requested = Signal(object, object, str)
+    find_requested = Signal(int, object, str, int)
+    layout_requested = Signal(int, object, object, object, object)
+
+    def __init__(self, db_manager=None, thumbnails=None):
         super().__init__()
         self.setAcceptDrops(True)
         
-        self.db_manager = DatabaseManager()
+        # Both can be supplied (e.g. by the benchmarks) to keep the real library untouched.
+        self.db_manager = db_manager or DatabaseManager()
+        profile.mark('open database')
+        self.thumbnails = thumbnails or ThumbnailCache(covers_directory(self.db_manager.db_path))
+        self.trace_from_env = tracer.enabled
         self.book = None
         self.chapters = []
-        self.library = []
         self.current_book_path = None
         self.app_name = "ePub Swift"
         self.author_name = "GeekNeuron"
         self.total_book_len = 0
         self.chapter_lens = []
         self.cumulative_lens = []
-        self.worker_thread = None
+        # False until the text lengths (and so every position) of the open book are known.
+        self.book_measured = False
+        self.saved_position = 0
+        self.opened_position = None
+        self.spine = []
+        self.spine_lookup = {}
+        self.chapter_spine_indexes = []
+        self.toc_row_by_spine = []
+        # Per TOC row, the offset of its target in its spine document; with the
+        # running totals, every row's book position. Filled in once measured.
+        self.toc_offsets = []
+        self.toc_positions = []
+        self.toc_position_keys = []
+        self.current_spine_index = -1
+        self.pending_scroll_target = None
+        # The (book, spine index) being rendered to be shown, and what to do once it is.
+        self.pending_display = None
+        self.display_callbacks = []
+        self.loading_path = None
+        self.import_thread = None
+        self.export_thread = None
+        self.text_index_thread = None
+        self.text_index_stale = False
+        self.text_index_queued = set()
+        self.pending_search_hit = None
+        # Chapters, images and the archives of background tabs share one budget: the
+        # cap less what the process already uses, and whatever is least recently
+        # used goes first. A background tab whose archive is evicted keeps only its
+        # tab; it reopens from the cached index when it is brought back.
+        self.memory_cap = memory_cap_bytes()
+        self.memory_budget = MemoryBudget(max(self.memory_cap - (process_rss() or 0), MIN_CACHE_BYTES))
+        self.parked_books = SizedLRUCache(self.memory_cap, sizeof=lambda parked: parked[0].nbytes(),
+                                          budget=self.memory_budget, on_evict=lambda parked: parked[0].close())
+        self.book_info = {}
+        self.chapter_cache = SizedLRUCache(CHAPTER_CACHE_BYTES, sizeof=lambda chapter: chapter.nbytes(),
+                                           budget=self.memory_budget)
+        self.current_chapter = None
+        # Continuous mode: the spine documents in the text display (its chapter window), in order.
+        self.continuous = False
+        self.pending_scroll_y = None
+        self.image_cache = SizedLRUCache(IMAGE_CACHE_BYTES, sizeof=lambda image: image.sizeInBytes(),
+                                         budget=self.memory_budget)
+        self.pending_prefetches = set()
+        # Paginated mode: page tables are keyed (book, spine index, layout key), the
+        # layout key being everything the page breaks depend on (font, page size).
+        self.paged = False
+        self.page_tables = SizedLRUCache(PAGE_TABLE_CACHE_BYTES, sizeof=lambda table: table.nbytes(),
+                                         budget=self.memory_budget)
+        self.page_layout_key = None
+        self.page_layout_params = None
+        self.page_counts = {}
+        self.pending_layouts = set()
+        self.current_page = -1
+        # Offset in the chapter's visible text of the page to show once its table is in.
+        self.page_anchor = 0
+        self.find_query = ""
+        self.find_matches = []
+        self.find_current = -1
+        self.find_scanning = False
+        self.find_capped = False
+        self.find_origin = 0
+        self.find_cursor = None
+        self.find_cursor_match = None
         
         self.load_assets()
         self.update_window_title()
         self.setWindowState(Qt.WindowMaximized)
+        profile.mark('load font and icon')
         
         self.init_ui()
+        profile.mark('build widgets')
+        self.init_book_loader()
+        self.init_prefetcher()
+        self.init_finder()
+        self.init_paginator()
+        self.init_image_decoder()
+        self.init_thumbnailer()
+        profile.mark('start worker threads')
         self.apply_styles()
-        self.load_library_from_db()
+        profile.mark('apply stylesheet')
         self.show_welcome_message()
+        profile.mark('show welcome page')
+        self.first_paint_watcher = FirstPaintWatcher(self.finish_startup, self)
+        # Catch up on books added or changed while the app was closed, once the window is up.
+        self.text_index_timer = QTimer(self)
+        self.text_index_timer.setSingleShot(True)
+        self.text_index_timer.timeout.connect(self.start_text_indexing)
+        self.text_index_timer.start(3000)
+        self.memory_timer = QTimer(self)
+        self.memory_timer.setInterval(MEMORY_CHECK_MS)
+        self.memory_timer.timeout.connect(self.trim_memory)
+        self.memory_timer.start()
 
     def init_ui(self):
         self.loading_spinner = LoadingSpinner(self)
@@ -48,9 +165,49 @@ class EpubReader(QMainWindow):
         open_action.setShortcut(QKeySequence("Ctrl+O"))
         open_action.triggered.connect(self.open_file_dialog)
         file_menu.addAction(open_action)
+        import_action = QAction("Import Folder...", self)
+        import_action.triggered.connect(self.open_import_dialog)
+        file_menu.addAction(import_action)
+        self.resume_import_action = QAction("Resume Interrupted Import", self)
+        self.resume_import_action.triggered.connect(self.resume_import)
+        file_menu.addAction(self.resume_import_action)
+        self.resume_import_action.setEnabled(False)
         
-        menu_bar.addMenu("Tools")
-        menu_bar.addMenu("Settings")
+        tools_menu = menu_bar.addMenu("Tools")
+        find_action = QAction("Find in Book (Ctrl+F)", self)
+        find_action.setShortcut(QKeySequence.Find)
+        find_action.triggered.connect(self.show_find_bar)
+        tools_menu.addAction(find_action)
+        tools_menu.addSeparator()
+        export_book_action = QAction("Export Book as Text/HTML...", self)
+        export_book_action.triggered.connect(self.export_current_book)
+        tools_menu.addAction(export_book_action)
+        export_folder_action = QAction("Export Folder as Text/HTML...", self)
+        export_folder_action.triggered.connect(self.export_folder)
+        tools_menu.addAction(export_folder_action)
+        tools_menu.addSeparator()
+        self.overlay_action = QAction("Performance Overlay", self)
+        self.overlay_action.setCheckable(True)
+        self.overlay_action.setShortcut(QKeySequence("Ctrl+Shift+P"))
+        self.overlay_action.toggled.connect(self.toggle_performance_overlay)
+        tools_menu.addAction(self.overlay_action)
+        export_trace_action = QAction("Export Performance Trace...", self)
+        export_trace_action.triggered.connect(self.export_trace)
+        tools_menu.addAction(export_trace_action)
+        reset_trace_action = QAction("Reset Performance Data", self)
+        reset_trace_action.triggered.connect(tracer.reset)
+        tools_menu.addAction(reset_trace_action)
+        settings_menu = menu_bar.addMenu("Settings")
+        self.paged_action = QAction("Paginated Mode", self)
+        self.paged_action.setCheckable(True)
+        self.paged_action.setShortcut(QKeySequence("Ctrl+Shift+M"))
+        self.paged_action.toggled.connect(self.set_paged_mode)
+        settings_menu.addAction(self.paged_action)
+        self.continuous_action = QAction("Continuous Scroll", self)
+        self.continuous_action.setCheckable(True)
+        self.continuous_action.setShortcut(QKeySequence("Ctrl+Shift+L"))
+        self.continuous_action.toggled.connect(self.set_continuous_mode)
+        settings_menu.addAction(self.continuous_action)
         
         info_menu = menu_bar.addMenu("Info")
         about_action = QAction("About ePub Swift", self)
@@ -67,22 +224,68 @@ class EpubReader(QMainWindow):
         self.toc_list = QListWidget()
         self.toc_list.setAlternatingRowColors(True)
         self.toc_list.currentItemChanged.connect(self.display_chapter)
-        self.library_list = QListWidget()
-        self.library_list.setAlternatingRowColors(True)
-        self.library_list.itemClicked.connect(self.load_book_from_library)
         self.left_panel.addTab(self.toc_list, "Contents")
-        self.left_panel.addTab(self.library_list, "Library")
+        self.left_panel.addTab(self.create_library_panel(), "Library")
+        self.left_panel.addTab(self.create_search_panel(), "Search")
         right_panel_widget = QWidget()
         right_layout = QVBoxLayout(right_panel_widget)
         right_layout.setContentsMargins(0, 0, 0, 0)
         right_layout.setSpacing(8)
-        self.text_display = QTextBrowser()
+        self.book_tabs = QTabBar()
+        self.book_tabs.setDocumentMode(True)
+        self.book_tabs.setTabsClosable(True)
+        self.book_tabs.setMovable(True)
+        self.book_tabs.setExpanding(False)
+        self.book_tabs.setElideMode(Qt.ElideRight)
+        self.book_tabs.hide()
+        self.book_tabs.currentChanged.connect(self.on_book_tab_changed)
+        self.book_tabs.tabCloseRequested.connect(self.close_book_tab)
+        QShortcut(QKeySequence("Ctrl+W"), self, lambda: self.close_book_tab(self.book_tabs.currentIndex()))
+        self.text_display = BookTextBrowser(self.image_cache)
+        self.chapter_window = ChapterWindow(self.text_display)
         self.text_display.setOpenExternalLinks(True)
+        self.performance_overlay = PerformanceOverlay(self.text_display)
         self.text_display.verticalScrollBar().valueChanged.connect(self.update_global_progress)
+        self.text_display.verticalScrollBar().valueChanged.connect(self.on_display_scrolled)
+        self.text_display.page_turn_requested.connect(self.turn_page)
+        self.text_display.resized.connect(self.on_display_resized)
+        self.page_label = QLabel()
+        self.page_label.hide()
+        # Resizing relays out only the chapter on screen, and only once the size has settled.
+        self.page_layout_timer = QTimer(self)
+        self.page_layout_timer.setSingleShot(True)
+        self.page_layout_timer.setInterval(PAGE_LAYOUT_DELAY_MS)
+        self.page_layout_timer.timeout.connect(self.relayout_pages)
+        # A scroll that did not come from a page turn (a TOC anchor, find) is snapped to its page.
+        self.page_snap_timer = QTimer(self)
+        self.page_snap_timer.setSingleShot(True)
+        self.page_snap_timer.setInterval(0)
+        self.page_snap_timer.timeout.connect(self.sync_page_to_scroll)
+        # Moves the continuous-scroll window once the reader has crossed into another document.
+        self.window_timer = QTimer(self)
+        self.window_timer.setSingleShot(True)
+        self.window_timer.setInterval(0)
+        self.window_timer.timeout.connect(self.update_window)
         self.progress_bar = ClickableProgressBar()
         self.progress_bar.jump_requested.connect(self.jump_to_position)
+        self.progress_bar.scrub_moved.connect(self.preview_position)
+        # One reusable zero-delay timer, so jumps made in the same event-loop
+        # pass coalesce into a single scroll. Layout is not waited on: the
+        # anchor map forces exactly as much layout as the target needs.
+        self.scroll_timer = QTimer(self)
+        self.scroll_timer.setSingleShot(True)
+        self.scroll_timer.setInterval(0)
+        self.scroll_timer.timeout.connect(self.apply_pending_scroll)
+        self.text_display.verticalScrollBar().rangeChanged.connect(self.apply_pending_scroll_y)
+        self.text_display.verticalScrollBar().actionTriggered.connect(self.cancel_pending_scroll_y)
+        right_layout.addWidget(self.book_tabs)
         right_layout.addWidget(self.text_display)
-        right_layout.addWidget(self.progress_bar)
+        right_layout.addWidget(self.create_find_bar())
+        progress_row = QHBoxLayout()
+        progress_row.setSpacing(8)
+        progress_row.addWidget(self.progress_bar, 1)
+        progress_row.addWidget(self.page_label)
+        right_layout.addLayout(progress_row)
         
         splitter = QSplitter(Qt.Horizontal)
         splitter.addWidget(self.left_panel)
@@ -97,6 +300,174 @@ class EpubReader(QMainWindow):
         self.text_display.setAcceptDrops(True)
         self.left_panel.setAcceptDrops(True)
 
+    def create_library_panel(self):
+        """The Library tab: a filter box, a sort selector and a lazily paged list of books."""
+        panel = QWidget()
+        layout = QVBoxLayout(panel)
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.setSpacing(6)
+        controls = QHBoxLayout()
+        self.library_filter = QLineEdit()
+        self.library_filter.setPlaceholderText("Filter by title or author")
+        self.library_filter.setClearButtonEnabled(True)
+        self.library_sort = QComboBox()
+        for label, key in (("Last opened", 'last_opened'), ("Title", 'title'), ("Progress", 'progress')):
+            self.library_sort.addItem(label, key)
+        controls.addWidget(self.library_filter, 1)
+        controls.addWidget(self.library_sort)
+        layout.addLayout(controls)
+
+        self.library_model = LibraryModel(self.db_manager, self)
+        self.library_list = QListView()
+        self.library_list.setModel(self.library_model)
+        self.library_list.setAlternatingRowColors(True)
+        self.library_list.setUniformItemSizes(True)
+        self.library_list.setIconSize(THUMBNAIL_SIZE)
+        self.library_list.clicked.connect(self.load_book_from_library)
+        layout.addWidget(self.library_list)
+
+        # Typing is debounced so a fast typist triggers one query, not one per key.
+        self.library_filter_timer = QTimer(self)
+        self.library_filter_timer.setSingleShot(True)
+        self.library_filter_timer.setInterval(150)
+        self.library_filter_timer.timeout.connect(lambda: self.library_model.set_filter(self.library_filter.text()))
+        self.library_filter.textChanged.connect(self.library_filter_timer.start)
+        self.library_sort.currentIndexChanged.connect(
+            lambda: self.library_model.set_sort(self.library_sort.currentData()))
+        return panel
+
+    def create_search_panel(self):
+        """The Search tab: full-text search across every book in the library."""
+        panel = QWidget()
+        layout = QVBoxLayout(panel)
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.setSpacing(6)
+        self.search_input = QLineEdit()
+        self.search_input.setPlaceholderText("Search inside your books")
+        self.search_input.setClearButtonEnabled(True)
+        layout.addWidget(self.search_input)
+        self.search_results = QListWidget()
+        self.search_results.setAlternatingRowColors(True)
+        self.search_results.setWordWrap(True)
+        self.search_results.itemClicked.connect(self.open_search_hit)
+        layout.addWidget(self.search_results)
+
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(300)
+        self.search_timer.timeout.connect(self.run_text_search)
+        self.search_input.textChanged.connect(self.search_timer.start)
+        self.search_input.returnPressed.connect(self.run_text_search)
+        return panel
+
+    def create_find_bar(self):
+        """The in-book find bar under the text: query, match counter and next/previous."""
+        self.find_bar = QWidget()
+        layout = QHBoxLayout(self.find_bar)
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.setSpacing(6)
+        self.find_input = QLineEdit()
+        self.find_input.setPlaceholderText("Find in this book")
+        self.find_input.setClearButtonEnabled(True)
+        self.find_status = QLabel()
+        previous_button = QPushButton("▲")
+        next_button = QPushButton("▼")
+        close_button = QPushButton("✕")
+        for button in (previous_button, next_button, close_button):
+            button.setFixedWidth(32)
+        previous_button.clicked.connect(self.find_previous)
+        next_button.clicked.connect(self.find_next)
+        close_button.clicked.connect(self.hide_find_bar)
+        layout.addWidget(self.find_input, 1)
+        layout.addWidget(self.find_status)
+        layout.addWidget(previous_button)
+        layout.addWidget(next_button)
+        layout.addWidget(close_button)
+
+        self.find_timer = QTimer(self)
+        self.find_timer.setSingleShot(True)
+        self.find_timer.setInterval(250)
+        self.find_timer.timeout.connect(self.start_find)
+        self.find_input.textChanged.connect(self.find_timer.start)
+        self.find_input.returnPressed.connect(self.find_next)
+        QShortcut(QKeySequence("Shift+Return"), self.find_input, self.find_previous)
+        QShortcut(QKeySequence(Qt.Key_Escape), self.find_bar, self.hide_find_bar)
+        self.find_bar.hide()
+        return self.find_bar
+
+    def init_book_loader(self):
+        """Starts the threads that open books; a newer load always supersedes an older one."""
+        self.book_loader = BookLoadPool(self.db_manager, self.thumbnails, parent=self)
+        self.book_loader.opened.connect(self.on_book_opened)
+        self.book_loader.progress.connect(self.on_book_progress)
+        self.book_loader.loaded.connect(self.on_book_data_loaded)
+
+    def init_prefetcher(self):
+        """
+        Starts the long-lived threads that render chapters: one for neighbouring
+        chapters ahead of time, one for a chapter to be shown that was not
+        rendered yet, so it never waits behind the prefetches.
+        """
+        self.prefetch_thread = QThread(self)
+        self.prefetch_worker = ChapterPrefetchWorker()
+        self.prefetch_worker.moveToThread(self.prefetch_thread)
+        self.prefetch_requested.connect(self.prefetch_worker.prefetch)
+        self.prefetch_worker.rendered.connect(self.on_chapter_prefetched)
+        self.prefetch_worker.failed.connect(self.on_chapter_failed)
+        self.prefetch_thread.finished.connect(self.prefetch_worker.deleteLater)
+        self.prefetch_thread.start()
+        self.render_thread = QThread(self)
+        self.render_worker = ChapterPrefetchWorker()
+        self.render_worker.moveToThread(self.render_thread)
+        self.render_requested.connect(self.render_worker.prefetch)
+        self.render_worker.rendered.connect(self.on_chapter_prefetched)
+        self.render_worker.failed.connect(self.on_chapter_failed)
+        self.render_thread.finished.connect(self.render_worker.deleteLater)
+        self.render_thread.start()
+
+    def init_paginator(self):
+        """Starts the long-lived thread that computes page breaks for paginated mode."""
+        self.page_layout_thread = QThread(self)
+        self.page_layout_worker = PageLayoutWorker()
+        self.page_layout_worker.moveToThread(self.page_layout_thread)
+        self.layout_requested.connect(self.page_layout_worker.layout)
+        self.page_layout_worker.laid_out.connect(self.on_page_laid_out)
+        self.page_layout_thread.finished.connect(self.page_layout_worker.deleteLater)
+        self.page_layout_thread.start()
+
+    def init_image_decoder(self):
+        """Starts the long-lived thread that decodes large book images for the text view."""
+        self.image_thread = QThread(self)
+        self.image_worker = ImageDecodeWorker()
+        self.image_worker.moveToThread(self.image_thread)
+        self.text_display.decode_requested.connect(self.image_worker.decode)
+        self.image_worker.decoded.connect(self.text_display.on_image_decoded)
+        self.image_thread.finished.connect(self.image_worker.deleteLater)
+        self.image_thread.start()
+
+    def init_thumbnailer(self):
+        """Starts the long-lived thread that loads (and, once per book, makes) library cover thumbnails."""
+        self.thumbnail_thread = QThread(self)
+        self.thumbnail_worker = ThumbnailWorker(self.thumbnails)
+        self.thumbnail_worker.moveToThread(self.thumbnail_thread)
+        self.library_model.thumbnail_requested.connect(self.thumbnail_worker.load)
+        self.library_model.cover_requested.connect(self.thumbnail_worker.generate)
+        self.thumbnail_worker.loaded.connect(self.library_model.on_thumbnail_loaded)
+        self.thumbnail_worker.generated.connect(self.library_model.on_cover_generated)
+        self.thumbnail_thread.finished.connect(self.thumbnail_worker.deleteLater)
+        self.thumbnail_thread.start()
+
+    def init_finder(self):
+        """Starts the long-lived thread that scans the open book for the find bar."""
+        self.find_thread = QThread(self)
+        self.find_worker = BookFindWorker()
+        self.find_worker.moveToThread(self.find_thread)
+        self.find_requested.connect(self.find_worker.find)
+        self.find_worker.matches_found.connect(self.on_find_matches)
+        self.find_worker.finished.connect(self.on_find_finished)
+        self.find_thread.finished.connect(self.find_worker.deleteLater)
+        self.find_thread.start()
+
     def apply_styles(self):
         self.setStyleSheet("""
             QProgressBar {
@@ -114,10 +485,11 @@ class EpubReader(QMainWindow):
             QTabWidget::tab-bar { alignment: center; }
             QTabBar::tab { background: #e1e5ea; color: #555; padding: 8px 20px; border-top-left-radius: 6px; border-top-right-radius: 6px; margin: 0 2px; }
             QTabBar::tab:selected { background: #ffffff; color: #000; }
-            QListWidget { background-color: #ffffff; color: #2c3e50; border: none; border-radius: 8px; padding: 5px; }
-            QListWidget::item { padding: 8px; border-radius: 4px; }
-            QListWidget::item:alternate { background-color: #f8f9fa; }
-            QListWidget::item:selected { background-color: #345B9A; color: white; }
+            QListWidget, QListView { background-color: #ffffff; color: #2c3e50; border: none; border-radius: 8px; padding: 5px; }
+            QListWidget::item, QListView::item { padding: 8px; border-radius: 4px; }
+            QListWidget::item:alternate, QListView::item:alternate { background-color: #f8f9fa; }
+            QListWidget::item:selected, QListView::item:selected { background-color: #345B9A; color: white; }
+            QLineEdit, QComboBox { background-color: #ffffff; border: 1px solid #dcdde1; border-radius: 6px; padding: 4px 8px; }
             QTextBrowser { background-color: #ffffff; border: none; border-radius: 8px; padding: 20px; font-size: 16px; color: #34495e; }
             QScrollBar:vertical { border: none; background: #f8f9fa; width: 10px; margin: 0; border-radius: 5px; }
             QScrollBar::handle:vertical { background: #bdc3c7; min-height: 20px; border-radius: 5px; }
@@ -150,14 +522,98 @@ class EpubReader(QMainWindow):
                         return
         event.ignore()
         
+    def finish_startup(self):
+        """Startup work that touches the library, deferred until the window has painted."""
+        profile.first_paint()
+        self.load_library_from_db()
+        self.update_resume_import_action()
+        profile.mark('load library')
+
     def load_library_from_db(self):
-        self.library = self.db_manager.load_library()
-        self.refresh_library_list()
+        self.library_model.refresh()
         
     def closeEvent(self, event):
-        self.db_manager.save_progress(self.current_book_path, self.get_current_char_position())
+        self.save_current_progress()
+        self.book_loader.shutdown()
+        self.memory_timer.stop()
+        self.text_index_timer.stop()
+        for row in range(self.book_tabs.count()):
+            self.discard_parked_book(self.book_tabs.tabData(row))
+        if self.import_thread is not None:
+            # Already-indexed batches are saved; the rest resumes next time.
+            self.import_worker.cancel()
+            self.import_thread.quit()
+            self.import_thread.wait()
+        if self.text_index_thread is not None:
+            # A pass that already finished must not start the queued ones after closing.
+            self.text_index_stale = False
+            self.text_index_queued.clear()
+            self.text_index_worker.cancel()
+            self.text_index_thread.quit()
+            self.text_index_thread.wait()
+        if self.export_thread is not None:
+            # Finished books stay exported; the one in progress leaves no partial file.
+            self.export_worker.cancel()
+            self.export_thread.quit()
+            self.export_thread.wait()
+        self.prefetch_thread.quit()
+        self.prefetch_thread.wait()
+        self.render_thread.quit()
+        self.render_thread.wait()
+        self.find_worker.generation += 1
+        self.find_thread.quit()
+        self.find_thread.wait()
+        self.page_layout_worker.generation += 1
+        self.page_layout_thread.quit()
+        self.page_layout_thread.wait()
+        self.image_thread.quit()
+        self.image_thread.wait()
+        self.thumbnail_thread.quit()
+        self.thumbnail_thread.wait()
+        self.close_book()
+        # Guarantees queued progress writes reach the disk before exit.
+        self.db_manager.close()
         event.accept()
 
+    def save_current_progress(self):
+        """Queues the open book's reading position. Nothing is saved until the book has been measured."""
+        if self.book and self.book_measured:
+            self.db_manager.save_progress(self.current_book_path, self.get_current_char_position())
+
+    def close_book(self, park=False):
+        """
+        Releases the open book. With park, a measured book stays open in the
+        memory budget so switching back to its tab is instant; otherwise its
+        archive is closed and its cached chapters and images are dropped.
+        """
+        book_path = self.current_book_path
+        if self.book and park and self.book_measured:
+            self.parked_books.put(book_path, (self.book, self.book_info))
+        else:
+            if self.book: self.book.close()
+            self.discard_book_caches(book_path)
+        self.memory_budget.reserved_bytes = 0
+        self.book_info = {}
+        self.text_display.set_book(None, None)
+        self.pending_prefetches.clear()
+        if self.pending_display is not None:
+            self.pending_display, self.display_callbacks = None, []
+            self.loading_spinner.stop_animation()
+        if self.book: self.reset_find(release_book=True)
+        self.book = None
+        self.current_spine_index = -1
+        self.current_chapter = None
+        self.chapter_window.clear()
+        self.toc_offsets = []
+        self.toc_positions = []
+        self.toc_position_keys = []
+        self.book_measured = False
+        self.total_book_len = 0
+        self.chapter_lens = []
+        self.cumulative_lens = []
+        self.progress_bar.set_busy(None)
+        self.reset_pages()
+
     def show_welcome_message(self):
         """Displays a fully centered and restyled welcome message using a table layout."""
         self.text_display.setHtml("""
@@ -188,78 +644,350 @@ class EpubReader(QMainWindow):
             </body>
         """)
 
+    def discard_book_caches(self, book_path):
+        self.chapter_cache.discard_where(lambda key: key[0] == book_path)
+        self.image_cache.discard_where(lambda key: key[0] == book_path)
+        self.page_tables.discard_where(lambda key: key[0] == book_path)
+
     def load_book(self, file_path):
+        """Shows a book in its tab, opening a new tab if it is not open yet."""
         if not file_path:
             return
-        
-        self.db_manager.save_progress(self.current_book_path, self.get_current_char_position())
+        file_path = normalize_book_path(file_path)
+        row = self.book_tab_index(file_path)
+        if row < 0:
+            # The first tab added becomes current at once, before it has its path.
+            self.book_tabs.blockSignals(True)
+            row = self.book_tabs.addTab(os.path.basename(file_path))
+            self.book_tabs.setTabData(row, file_path)
+            self.book_tabs.setTabToolTip(row, file_path)
+            self.book_tabs.blockSignals(False)
+            self.book_tabs.show()
+        if self.book_tabs.currentIndex() == row:
+            self.on_book_tab_changed(row)
+        else:
+            # Switching tabs activates the book through on_book_tab_changed.
+            self.book_tabs.setCurrentIndex(row)
+
+    def activate_book(self, file_path):
+        """Puts a book in front, from its parked archive if it still has one; None shows the welcome page."""
+        self.save_current_progress()
         
         self.toc_list.clear()
         self.text_display.clear()
+        self.close_book(park=True)
         self.progress_bar.setValue(0)
         self.current_book_path = file_path
+        if file_path is None:
+            self.book_loader.cancel()
+            self.loading_path = None
+            self.loading_spinner.stop_animation()
+            self.update_window_title()
+            self.show_welcome_message()
+            return
+
+        parked = self.parked_books.pop(file_path)
+        if parked is not None:
+            self.book_loader.cancel()
+            self.loading_path = None
+            container, info = parked
+            self.on_book_opened(None, dict(info, book=container))
+            return
+        self.loading_path = file_path
         
         self.loading_spinner.start_animation()
-        
-        self.worker_thread = QThread()
-        self.worker = BookLoaderWorker(file_path)
-        self.worker.moveToThread(self.worker_thread)
-        self.worker_thread.started.connect(self.worker.run)
-        self.worker.finished.connect(self.on_book_data_loaded)
-        self.worker.finished.connect(self.worker_thread.quit)
-        self.worker.finished.connect(self.worker.deleteLater)
-        self.worker_thread.finished.connect(self.worker_thread.deleteLater)
-        self.worker_thread.start()
-
-    def on_book_data_loaded(self, result):
+        # Any load still running for an earlier click is abandoned.
+        self.book_loader.load(file_path)
+
+    def on_book_opened(self, generation, result):
+        """
+        First step of a load: the book is readable as soon as its TOC is in.
+        Positions, the progress bar and restoring the last position wait for
+        the text lengths, unless they came from the cache.
+        """
         self.loading_spinner.stop_animation()
-        if 'error' in result:
-            self.text_display.setHtml(f"<h1>Error Opening Book</h1><p>{result['error']}</p>")
-            return
-        
         self.book = result['book']
+        self.book_info = {key: value for key, value in result.items() if key != 'book'}
+        self.memory_budget.reserved_bytes = self.book.nbytes()
+        self.text_display.set_book(self.book, self.current_book_path)
         self.chapters = result['chapters']
-        self.total_book_len = result['total_len']
-        self.chapter_lens = result['chap_lens']
-        self.cumulative_lens = result['cum_lens']
+        self.spine = result['spine']
+        self.spine_lookup = {path: i for i, path in enumerate(self.spine)}
+        self.chapter_spine_indexes = [self.spine_lookup.get(split_fragment(c['href'])[0]) for c in self.chapters]
+        self.toc_row_by_spine = self.build_toc_row_by_spine()
         self.update_window_title(result['title'])
-        self.update_library(self.current_book_path, result['title'])
+        row = self.book_tab_index(self.current_book_path)
+        if row >= 0: self.book_tabs.setTabText(row, result['title'])
+        book_in_lib = self.db_manager.get_book(self.current_book_path)
+        self.saved_position = book_in_lib.get('last_read_pos', 0) if book_in_lib else 0
         toc_is_rtl = is_rtl(self.chapters[0]['title'] if self.chapters else "")
         self.toc_list.setLayoutDirection(Qt.RightToLeft if toc_is_rtl else Qt.LeftToRight)
-        self.toc_list.addItems([f"{i+1}. {c['title']}" for i, c in enumerate(self.chapters)])
+        self.toc_list.addItems(self.toc_labels())
+        if 'total_len' in result:
+            self.apply_book_lengths(result)
+        else:
+            self.progress_bar.set_busy("Indexing")
         if self.toc_list.count() > 0:
-            self.toc_list.setCurrentRow(0)
-            book_in_lib = next((b for b in self.library if b['path'] == self.current_book_path), None)
-            if book_in_lib and book_in_lib.get('last_read_pos', 0) > 0 and self.total_book_len > 0:
-                percentage = (book_in_lib['last_read_pos'] / self.total_book_len) * 100
-                self.jump_to_position(percentage)
-        self.worker_thread = None
+            hit = self.pending_search_hit
+            if hit is not None and not self.book_measured and self.spine:
+                # The hit's document can be shown now; the exact spot needs the lengths.
+                spine_index = min(hit['spine_index'], len(self.spine) - 1)
+                self.select_toc_row_for_spine(spine_index)
+                self.display_spine_document(spine_index)
+            else:
+                self.toc_list.setCurrentRow(0)
+            if self.book_measured: self.restore_reading_position()
+        self.opened_position = None
+        self.when_displayed(self.record_opened_position)
+
+    def record_opened_position(self):
+        self.opened_position = self.position_at_y(self.text_display.verticalScrollBar().value() + 1)
+
+    def on_book_progress(self, generation, done, total):
+        self.progress_bar.setValue(done * 100 // total)
+
+    def on_book_data_loaded(self, generation, result):
+        # The pool only delivers the newest load, so this is always the book last asked for.
+        self.loading_path = None
+        if self.pending_display is None: self.loading_spinner.stop_animation()
+        if 'error' in result:
+            self.pending_search_hit = None
+            if self.book is None:
+                self.text_display.setHtml(f"<h1>Error Opening Book</h1><p>{result['error']}</p>")
+            else:
+                # It opened but could not be measured: still readable, just without positions.
+                self.progress_bar.set_busy(None)
+                self.statusBar().showMessage(f"Could not index this book: {result['error']}", 10000)
+            return
+        if not self.book_measured:
+            self.apply_book_lengths(result)
+            self.progress_bar.set_busy(None)
+            self.when_displayed(self.restore_unless_moved)
+        self.update_library(self.current_book_path, result)
+
+    def restore_unless_moved(self):
+        """Unless the reader has moved on since the book opened, goes to where they left off."""
+        if self.position_at_y(self.text_display.verticalScrollBar().value() + 1) == self.opened_position:
+            self.restore_reading_position()
+        else:
+            self.pending_search_hit = None
+        self.update_global_progress()
+
+    def apply_book_lengths(self, index):
+        self.book_info.update(total_len=index['total_len'], chap_lens=index['chap_lens'], cum_lens=index['cum_lens'],
+                              toc_offsets=index['toc_offsets'])
+        self.total_book_len = index['total_len']
+        self.chapter_lens = index['chap_lens']
+        self.cumulative_lens = index['cum_lens']
+        self.toc_offsets = index['toc_offsets']
+        self.book_measured = True
+        self.build_toc_positions()
+        self.update_page_label()
+
+    def restore_reading_position(self):
+        """Goes to the search hit the book was opened for, or else to the saved position."""
+        search_hit, self.pending_search_hit = self.pending_search_hit, None
+        if search_hit is not None:
+            self.jump_to_search_hit(search_hit)
+        elif self.saved_position > 0 and self.total_book_len > 0:
+            self.jump_to_position((self.saved_position / self.total_book_len) * 100)
 
     def display_chapter(self, current_item):
         if not current_item or not self.book: return
         self.update_global_progress()
         selected_index = self.toc_list.row(current_item)
         if not (0 <= selected_index < len(self.chapters)): return
-        chapter_info = self.chapters[selected_index]
-        item = self.book.get_item_with_href(chapter_info['href'])
-        content_bytes = item.get_content()
-        soup = BeautifulSoup(content_bytes, 'html.parser')
-        body_tag = soup.find('body')
-        if body_tag:
-            direction = "rtl" if is_rtl(body_tag.get_text()) else "ltr"
-            body_tag['dir'] = direction
-        style_tag = soup.new_tag('style')
-        style_tag.string = "body { font-family: 'Vazirmatn', sans-serif !important; }"
-        head = soup.find('head') or soup.new_tag('head')
-        if not head.parent: soup.insert(0, head)
-        head.append(style_tag)
-        self.text_display.setHtml(soup.prettify())
-        self.text_display.verticalScrollBar().setValue(0)
+        spine_index = self.chapter_spine_indexes[selected_index]
+        if spine_index is None: return
+        self.display_spine_document(spine_index, lambda: self.scroll_to_toc_target(selected_index))
+
+    def scroll_to_toc_target(self, selected_index):
+        """Scrolls the document just shown to the anchor a TOC row points at, if it has one."""
+        fragment = split_fragment(self.chapters[selected_index]['href'])[1]
+        if not fragment: return
+        position = self.toc_position(selected_index)
+        if position is not None:
+            # Showing the document moved the highlight to its top; the picked row is put back.
+            self.toc_list.blockSignals(True)
+            self.toc_list.setCurrentRow(selected_index)
+            self.toc_list.blockSignals(False)
+            # The anchor's offset was found when the book was measured.
+            self.pending_scroll_target = position
+            self.scroll_timer.start()
+        else:
+            self.text_display.scrollToAnchor(fragment)
+            if self.paged: self.sync_page_to_scroll()
+
+    def display_spine_document(self, spine_index, then=None):
+        """
+        Shows one spine document, with its neighbours around it in continuous mode.
+        One that is not rendered yet is rendered in the background under the
+        spinner; `then` runs once the document is shown, and is dropped if
+        another one is asked for first.
+        """
+        cache_key = (self.current_book_path, spine_index)
+        chapter = self.chapter_cache.get(cache_key)
+        if chapter is None:
+            if self.pending_display is None: self.loading_spinner.start_animation()
+            self.pending_display, self.display_callbacks = cache_key, [then] if then else []
+            # A prefetch already under way is waited for rather than repeated.
+            if cache_key not in self.pending_prefetches:
+                self.pending_prefetches.add(cache_key)
+                tracer.queued('chapter.prefetch', cache_key)
+                self.render_requested.emit(self.book, cache_key, self.spine[spine_index])
+            return
+        if self.pending_display is not None:
+            self.pending_display, self.display_callbacks = None, []
+            self.loading_spinner.stop_animation()
+        self.show_chapter(spine_index, chapter)
+        if then: then()
+
+    def when_displayed(self, callback):
+        """Runs callback once the document being rendered for display is shown, or now if there is none."""
+        if self.pending_display is None:
+            callback()
+        else:
+            self.display_callbacks.append(callback)
+
+    def show_chapter(self, spine_index, chapter):
+        with tracer.span('chapter.display', spine=spine_index):
+            self.current_spine_index = spine_index
+            # Unset while the document is swapped, so no anchor map is built from a half-loaded one.
+            self.current_chapter = None
+            self.pending_scroll_y = None
+            self.find_cursor_match = None
+            self.text_display.setExtraSelections([])
+            with tracer.span('chapter.set_html'):
+                if self.continuous:
+                    self.chapter_window.fill(self.window_chapters(spine_index, chapter))
+                else:
+                    self.chapter_window.clear()
+                    self.text_display.setHtml(chapter.html)
+            self.text_display.verticalScrollBar().setValue(0)
+            self.current_chapter = chapter
+            if self.continuous: self.scroll_to_y(self.segment_top(spine_index))
+            self.prefetch_neighbours(spine_index)
+            if self.paged: self.open_chapter_pages(0)
+
+    def prefetch_neighbours(self, spine_index):
+        """Asks the background worker to prepare the next and previous chapters."""
+        # Continuous mode reaches one further, so the window can move on without waiting.
+        reach = WINDOW_RADIUS + 1 if self.continuous else 1
+        for neighbour in [spine_index + d * step for d in range(1, reach + 1) for step in (1, -1)]:
+            if not (0 <= neighbour < len(self.spine)): continue
+            cache_key = (self.current_book_path, neighbour)
+            if cache_key in self.chapter_cache or cache_key in self.pending_prefetches: continue
+            self.pending_prefetches.add(cache_key)
+            tracer.queued('chapter.prefetch', cache_key)
+            self.prefetch_requested.emit(self.book, cache_key, self.spine[neighbour])
+
+    def on_chapter_prefetched(self, cache_key, chapter):
+        self.pending_prefetches.discard(cache_key)
+        # Results for a book that has since been closed are dropped.
+        if self.book and cache_key[0] == self.current_book_path:
+            self.chapter_cache.put(cache_key, chapter)
+            if cache_key == self.pending_display:
+                callbacks = self.display_callbacks
+                self.pending_display, self.display_callbacks = None, []
+                self.loading_spinner.stop_animation()
+                self.show_chapter(cache_key[1], chapter)
+                for callback in callbacks: callback()
+            elif self.continuous and abs(cache_key[1] - self.current_spine_index) <= WINDOW_RADIUS:
+                self.window_timer.start()
+
+    def on_chapter_failed(self, cache_key, error):
+        # A failed prefetch is harmless; the chapter is rendered again when it is shown.
+        self.pending_prefetches.discard(cache_key)
+        if cache_key != self.pending_display: return
+        self.pending_display, self.display_callbacks = None, []
+        self.loading_spinner.stop_animation()
+        self.statusBar().showMessage(f"Could not show this chapter: {error}", 10000)
+
+    def build_toc_row_by_spine(self):
+        """For each spine document, the last TOC row that starts at or before it."""
+        first_row_at = {}
+        for row, spine_index in enumerate(self.chapter_spine_indexes):
+            if spine_index is not None: first_row_at.setdefault(spine_index, row)
+        rows, row = [], -1
+        for spine_index in range(len(self.spine)):
+            row = first_row_at.get(spine_index, row)
+            rows.append(row)
+        return rows
+
+    def toc_labels(self):
+        """TOC rows: top-level entries numbered, nested ones indented under them."""
+        labels, number = [], 0
+        for chapter in self.chapters:
+            depth = chapter.get('depth', 0)
+            if depth:
+                labels.append("    " * depth + chapter['title'])
+            else:
+                number += 1
+                labels.append(f"{number}. {chapter['title']}")
+        return labels
+
+    def toc_position(self, row):
+        """Book position a TOC row points at, or None if it is not known."""
+        if not (0 <= row < len(self.toc_offsets)): return None
+        spine_index, offset = self.chapter_spine_indexes[row], self.toc_offsets[row]
+        if spine_index is None or offset is None or spine_index >= len(self.chapter_lens): return None
+        return self.cumulative_lens[spine_index] + min(offset, self.chapter_lens[spine_index])
+
+    def build_toc_positions(self):
+        """Sorts the TOC rows by book position, so the row for any position is a bisection away."""
+        positions = [(self.toc_position(row), row) for row in range(len(self.chapters))]
+        self.toc_positions = sorted(p for p in positions if p[0] is not None)
+        self.toc_position_keys = [position for position, _ in self.toc_positions]
+
+    def toc_row_at(self, char_pos):
+        """The last TOC row starting at or before a book position; -1 before the first."""
+        i = bisect_right(self.toc_position_keys, char_pos) - 1
+        if i < 0: return -1
+        # Rows at the same position (a part and its first chapter) keep whichever one was picked.
+        current = self.toc_list.currentRow()
+        if current >= 0 and self.toc_position(current) == self.toc_position_keys[i]: return current
+        return self.toc_positions[i][1]
 
+    def select_toc_row_for_spine(self, spine_index):
+        """Highlights the TOC entry that contains a spine document."""
+        row = self.toc_row_by_spine[spine_index] if 0 <= spine_index < len(self.toc_row_by_spine) else -1
+        self.toc_list.blockSignals(True)
+        self.toc_list.setCurrentRow(row)
+        self.toc_list.blockSignals(False)
+
+    def current_anchor_map(self):
+        """The displayed chapter's block-to-text map, built on first use and cached with the chapter."""
+        chapter = self.current_chapter
+        if chapter is None: return None
+        if self.continuous:
+            segment = self.current_segment()
+            return self.segment_anchor_map(segment) if segment else None
+        if chapter.anchor_map is None:
+            with tracer.span('chapter.anchor_map'):
+                texts = []
+                block = self.text_display.document().begin()
+                while block.isValid():
+                    texts.append(block.text())
+                    block = block.next()
+                chapter.anchor_map = AnchorMap(texts, chapter.profile)
+        return chapter.anchor_map
+
+    @traced('position.read')
     def get_current_char_position(self):
-        if not self.book or self.total_book_len == 0 or self.toc_list.currentRow() < 0: return 0
-        current_chapter_index = self.toc_list.currentRow()
+        if not self.book or self.total_book_len == 0: return 0
+        current_chapter_index = self.current_spine_index
         if not (0 <= current_chapter_index < len(self.cumulative_lens) - 1): return 0
+        if self.paged and self.current_page >= 0:
+            table = self.current_page_table()
+            if table is not None:
+                offset = table.offsets[self.current_page]
+                return self.cumulative_lens[current_chapter_index] + min(offset, self.chapter_lens[current_chapter_index])
+        # The first character of the top line is the reading position; the
+        # probe sits a pixel down so a line boundary never picks the line above.
+        position = self.position_at_y(self.text_display.verticalScrollBar().value() + 1)
+        if position is not None and position[0] < len(self.chapter_lens):
+            spine_index, offset = position
+            return self.cumulative_lens[spine_index] + min(offset, self.chapter_lens[spine_index])
         scrollbar = self.text_display.verticalScrollBar()
         max_val = scrollbar.maximum()
         scroll_progress = (scrollbar.value() / max_val) if max_val > 0 else 0
@@ -267,43 +995,140 @@ class EpubReader(QMainWindow):
         current_chapter_len = self.chapter_lens[current_chapter_index]
         return int(preceding_len + (scroll_progress * current_chapter_len))
 
+    def position_at_y(self, y):
+        """(spine index, visible-text offset) of the line at document height y, or None."""
+        if self.current_chapter is None: return None
+        document = self.text_display.document()
+        layout = document.documentLayout()
+        position = layout.hitTest(QPointF(0, y), Qt.FuzzyHit)
+        if position < 0: return None
+        block = document.findBlock(position)
+        if self.continuous:
+            segment = self.chapter_window.segment_for_block(block.blockNumber())
+            if segment is None: return None
+            spine_index, anchor_map = segment.spine_index, self.segment_anchor_map(segment)
+        else:
+            spine_index, anchor_map = self.current_spine_index, self.current_anchor_map()
+        index = self.line_start_at(block, y - layout.blockBoundingRect(block).top())
+        chars = count_text_chars(block.text()[:index])
+        return spine_index, anchor_map.offset_at(block.blockNumber(), chars)
+
+    def chapter_offset_at_y(self, y):
+        """Visible-text offset in the displayed chapter of the line at document height y, or None."""
+        position = self.position_at_y(y)
+        return position[1] if position and position[0] == self.current_spine_index else None
+
     def update_global_progress(self):
+        # Until the book is measured the bar shows the measuring progress instead.
+        if not self.book_measured: return
         current_char_pos = self.get_current_char_position()
         if self.total_book_len > 0:
             global_percentage = (current_char_pos / self.total_book_len) * 100
         else:
             global_percentage = 0
         self.progress_bar.setValue(int(global_percentage))
+        # A jump still on its way would highlight the rows it passes.
+        if self.toc_positions and self.pending_scroll_target is None:
+            row = self.toc_row_at(current_char_pos)
+            if row != self.toc_list.currentRow():
+                self.toc_list.blockSignals(True)
+                self.toc_list.setCurrentRow(row)
+                self.toc_list.blockSignals(False)
+
+    def spine_index_at(self, char_pos):
+        """Binary-searches the cumulative lengths for the document holding a position."""
+        if not self.chapter_lens: return -1
+        index = bisect_right(self.cumulative_lens, char_pos) - 1
+        return min(max(index, 0), len(self.chapter_lens) - 1)
 
     def jump_to_position(self, percentage):
         if not self.book or self.total_book_len == 0: return
         target_char_pos = self.total_book_len * (percentage / 100)
-        target_chapter_index = -1
-        for i in range(len(self.cumulative_lens) - 1):
-            if self.cumulative_lens[i] <= target_char_pos < self.cumulative_lens[i+1]:
-                target_chapter_index = i
-                break
-        if target_chapter_index == -1 and target_char_pos >= self.cumulative_lens[-1]:
-             target_chapter_index = len(self.cumulative_lens) - 2
+        target_chapter_index = self.spine_index_at(target_char_pos)
         if target_chapter_index < 0: return
-        if self.toc_list.currentRow() != target_chapter_index:
-            self.toc_list.blockSignals(True)
-            self.toc_list.setCurrentRow(target_chapter_index)
-            self.toc_list.blockSignals(False)
-            self.display_chapter(self.toc_list.currentItem())
-        QTimer.singleShot(50, lambda: self.scroll_to_position_in_chapter(target_char_pos))
+        if self.current_spine_index != target_chapter_index or self.pending_display is not None:
+            self.select_toc_row_for_spine(target_chapter_index)
+            self.display_spine_document(target_chapter_index, lambda: self.scroll_to_target(target_char_pos))
+        else:
+            self.scroll_to_target(target_char_pos)
 
+    def scroll_to_target(self, target_char_pos):
+        self.pending_scroll_target = target_char_pos
+        self.scroll_timer.start()
+
+    def apply_pending_scroll(self):
+        if self.pending_scroll_target is None: return
+        target_char_pos, self.pending_scroll_target = self.pending_scroll_target, None
+        # Another document is on its way; this position was for the one shown.
+        if self.pending_display is not None: return
+        self.scroll_to_position_in_chapter(target_char_pos)
+
+    def preview_position(self, percentage):
+        """Shows where a drag on the progress bar would land, without rendering anything."""
+        if not self.book or self.total_book_len == 0: return
+        spine_index = self.spine_index_at(self.total_book_len * (percentage / 100))
+        row = self.toc_row_by_spine[spine_index] if spine_index >= 0 else -1
+        title = self.chapters[row]['title'] if row >= 0 else ""
+        QToolTip.showText(QCursor.pos(), f"{title}\n{percentage:.1f}%" if title else f"{percentage:.1f}%", self.progress_bar)
+
+    @traced('position.scroll')
     def scroll_to_position_in_chapter(self, target_char_pos):
-        current_chapter_index = self.toc_list.currentRow()
+        current_chapter_index = self.current_spine_index
         if not (0 <= current_chapter_index < len(self.chapter_lens)): return
         preceding_len = self.cumulative_lens[current_chapter_index]
         current_chapter_len = self.chapter_lens[current_chapter_index]
+        if self.paged:
+            # The page holding the position; until the chapter is paged, it is scrolled to as usual.
+            self.page_anchor = target_char_pos - preceding_len
+            table = self.current_page_table()
+            if table is not None:
+                self.show_page(table.page_at(self.page_anchor))
+                return
+        anchor_map = self.current_anchor_map()
+        if anchor_map is not None:
+            document = self.text_display.document()
+            block_number, chars = anchor_map.locate(target_char_pos - preceding_len)
+            block = document.findBlockByNumber(block_number)
+            if block.isValid():
+                # blockBoundingRect lays the document out up to this block, so
+                # the position is final without waiting for the event loop.
+                top = document.documentLayout().blockBoundingRect(block).top()
+                line = block.layout().lineForTextPosition(text_char_index(block.text(), chars))
+                self.scroll_to_y(math.ceil(top + (line.y() if line.isValid() else 0)))
+                return
         if current_chapter_len > 0:
             progress_in_chapter = (target_char_pos - preceding_len) / current_chapter_len
             scrollbar = self.text_display.verticalScrollBar()
             new_scroll_value = int(progress_in_chapter * scrollbar.maximum())
             scrollbar.setValue(new_scroll_value)
 
+    def line_start_at(self, block, y):
+        """Text index where the block's line at height y starts."""
+        # Searched by height: hit-testing an x would land on the wrong end of right-to-left lines.
+        layout = block.layout()
+        low, high = 0, layout.lineCount() - 1
+        if high < 0: return 0
+        while low < high:
+            middle = (low + high + 1) // 2
+            if layout.lineAt(middle).y() <= y: low = middle
+            else: high = middle - 1
+        return layout.lineAt(low).textStart()
+
+    def scroll_to_y(self, y):
+        scrollbar = self.text_display.verticalScrollBar()
+        scrollbar.setValue(y)
+        # The scroll range can lag behind the layout; finish once it has grown.
+        self.pending_scroll_y = y if scrollbar.value() != y else None
+
+    def apply_pending_scroll_y(self, minimum, maximum):
+        if self.pending_scroll_y is None: return
+        self.text_display.verticalScrollBar().setValue(min(self.pending_scroll_y, maximum))
+        if maximum >= self.pending_scroll_y: self.pending_scroll_y = None
+
+    def cancel_pending_scroll_y(self, action):
+        # The reader scrolled by hand; their position wins.
+        self.pending_scroll_y = None
+
     def load_assets(self):
         base_path = os.path.dirname(os.path.abspath(__file__))
         project_root = os.path.abspath(os.path.join(base_path, '..'))
@@ -328,23 +1153,687 @@ class EpubReader(QMainWindow):
         file_path, _ = QFileDialog.getOpenFileName(self, "Select an EPUB File", "", "EPUB Files (*.epub)")
         self.load_book(file_path)
 
-    def update_library(self, file_path, book_title):
-        if any(b['path'] == file_path for b in self.library): return
-        new_book_data = {'path': file_path, 'title': book_title, 'pages': len(self.chapters), 'last_read_pos': 0}
-        self.library.append(new_book_data)
-        self.db_manager.add_or_update_book(new_book_data)
-        self.refresh_library_list()
-
-    def refresh_library_list(self):
-        self.library_list.clear()
-        for book in self.library:
-            item_text = f"📖 {book['title']}\n📄 Chapters: {book['pages']}"
-            list_item = QListWidgetItem(item_text)
-            list_item.setData(Qt.UserRole, book['path'])
-            self.library_list.addItem(list_item)
-    
-    def load_book_from_library(self, item):
-        self.db_manager.save_progress(self.current_book_path, self.get_current_char_position())
-        file_path = item.data(Qt.UserRole)
+    # --- Bulk Import ---
+
+    def open_import_dialog(self):
+        root = QFileDialog.getExistingDirectory(self, "Select a Folder of EPUB Files")
+        if root: self.import_folder(root)
+
+    def resume_import(self):
+        jobs = self.db_manager.unfinished_import_jobs()
+        if jobs: self.import_folder(jobs[0])
+
+    def update_resume_import_action(self):
+        jobs = self.db_manager.unfinished_import_jobs()
+        self.resume_import_action.setEnabled(bool(jobs) and self.import_thread is None)
+        self.resume_import_action.setToolTip(jobs[0] if jobs else "")
+
+    def import_folder(self, root):
+        if self.import_thread is not None: return
+        self.import_progress = QProgressDialog("Scanning folder...", "Cancel", 0, 0, self)
+        self.import_progress.setWindowTitle("Importing Books")
+        self.import_progress.setMinimumDuration(0)
+        self.import_progress.setAutoClose(False)
+        self.import_progress.setAutoReset(False)
+
+        self.import_thread = QThread(self)
+        self.import_worker = LibraryImportWorker(root, self.db_manager, thumbnails=self.thumbnails)
+        self.import_worker.moveToThread(self.import_thread)
+        self.import_thread.started.connect(self.import_worker.run)
+        self.import_worker.progress.connect(self.on_import_progress)
+        self.import_worker.finished.connect(self.on_import_finished)
+        self.import_worker.finished.connect(self.import_thread.quit)
+        self.import_worker.finished.connect(self.import_worker.deleteLater)
+        self.import_thread.finished.connect(self.import_thread.deleteLater)
+        # cancel() only sets a flag, so calling it straight from the GUI thread is safe.
+        self.import_progress.canceled.connect(self.import_worker.cancel, Qt.DirectConnection)
+        self.import_thread.start()
+        self.update_resume_import_action()
+
+    def on_import_progress(self, done, total):
+        self.import_progress.setMaximum(total)
+        self.import_progress.setValue(done)
+        self.import_progress.setLabelText(f"Importing books... {done} of {total}")
+
+    def on_import_finished(self, summary):
+        self.import_progress.close()
+        self.import_thread = None
+        self.load_library_from_db()
+        self.update_resume_import_action()
+        self.start_text_indexing()
+        if 'error' in summary:
+            message = f"Import failed: {summary['error']}"
+        else:
+            message = (f"Imported {summary['imported']} books, skipped {summary['skipped']} unchanged, "
+                       + (f"reconnected {summary['relinked']} moved, " if summary['relinked'] else "")
+                       + f"{len(summary['failed'])} failed" + (" (cancelled)" if summary['cancelled'] else ""))
+        self.statusBar().showMessage(message, 10000)
+
+    def update_library(self, file_path, book):
+        """Records an opened book (and its open time) in the library."""
+        self.db_manager.add_or_update_book({
+            'path': file_path, 'title': book['title'], 'pages': sum(1 for c in book['chapters'] if not c.get('depth')),
+            'author': book.get('author', ''), 'total_len': book['total_len'],
+            'cover_key': book.get('cover_key'), 'fingerprint': book.get('fingerprint')
+        })
+        self.library_model.refresh()
+        self.start_text_indexing([file_path])
+
+    def load_book_from_library(self, index):
+        file_path = index.data(Qt.UserRole)
         if file_path and file_path != self.current_book_path:
             self.load_book(file_path)
+
+    # --- Export ---
+
+    def export_current_book(self):
+        if not self.book:
+            self.statusBar().showMessage("Open a book to export it", 5000)
+            return
+        text_filter, html_filter = "Plain Text (*.txt)", "HTML (*.html)"
+        path, selected = QFileDialog.getSaveFileName(self, "Export Book", os.path.splitext(self.current_book_path)[0] + ".txt",
+                                                     f"{text_filter};;{html_filter}")
+        if not path: return
+        fmt = 'html' if selected == html_filter or path.lower().endswith(('.html', '.htm')) else 'txt'
+        self.start_export([(self.current_book_path, path)], fmt)
+
+    def export_folder(self):
+        from utils.book_export import export_jobs
+        root = QFileDialog.getExistingDirectory(self, "Select a Folder of EPUB Files to Export")
+        if not root: return
+        output_dir = QFileDialog.getExistingDirectory(self, "Select Where the Exported Files Go")
+        if not output_dir: return
+        formats = {"Plain text (.txt)": 'txt', "HTML (.html)": 'html'}
+        choice, ok = QInputDialog.getItem(self, "Export Format", "Export every book as:", list(formats), 0, False)
+        if not ok: return
+        # A generator: the folder is walked on the export thread, not here.
+        self.start_export(export_jobs(iter_epub_files(root), output_dir, formats[choice]), formats[choice])
+
+    def start_export(self, jobs, fmt):
+        if self.export_thread is not None:
+            self.statusBar().showMessage("An export is already running", 5000)
+            return
+        self.export_progress = QProgressDialog("Exporting...", "Cancel", 0, 0, self)
+        self.export_progress.setWindowTitle("Exporting Books")
+        self.export_progress.setMinimumDuration(0)
+        self.export_progress.setAutoClose(False)
+        self.export_progress.setAutoReset(False)
+
+        self.export_thread = QThread(self)
+        self.export_worker = BookExportWorker(jobs, fmt)
+        self.export_worker.moveToThread(self.export_thread)
+        self.export_thread.started.connect(self.export_worker.run)
+        self.export_worker.progress.connect(self.on_export_progress)
+        self.export_worker.finished.connect(self.on_export_finished)
+        self.export_worker.finished.connect(self.export_thread.quit)
+        self.export_worker.finished.connect(self.export_worker.deleteLater)
+        self.export_thread.finished.connect(self.export_thread.deleteLater)
+        self.export_progress.canceled.connect(self.export_worker.cancel, Qt.DirectConnection)
+        self.export_thread.start()
+
+    def on_export_progress(self, done, total):
+        self.export_progress.setMaximum(total)
+        self.export_progress.setValue(done)
+        self.export_progress.setLabelText(f"Exporting books... {done} of {total}")
+
+    def on_export_finished(self, summary):
+        self.export_progress.close()
+        self.export_thread = None
+        if 'error' in summary:
+            message = f"Export failed: {summary['error']}"
+        elif summary['exported'] == 1 and not summary['failed'] and not summary['cancelled']:
+            message = f"Exported to {summary['outputs'][0]}"
+        else:
+            message = (f"Exported {summary['exported']} books, {len(summary['failed'])} failed"
+                       + (" (cancelled)" if summary['cancelled'] else ""))
+        self.statusBar().showMessage(message, 10000)
+
+    # --- Book Tabs ---
+
+    def book_tab_index(self, file_path):
+        for row in range(self.book_tabs.count()):
+            if self.book_tabs.tabData(row) == file_path: return row
+        return -1
+
+    def on_book_tab_changed(self, row):
+        file_path = self.book_tabs.tabData(row) if row >= 0 else None
+        if file_path != self.current_book_path:
+            self.activate_book(file_path)
+
+    def close_book_tab(self, row):
+        if row < 0: return
+        file_path = self.book_tabs.tabData(row)
+        if file_path == self.current_book_path:
+            self.save_current_progress()
+            self.book_loader.cancel()
+            self.close_book()
+            # Whichever tab comes to the front next is activated from scratch.
+            self.current_book_path = None
+        else:
+            self.discard_parked_book(file_path)
+        self.book_tabs.removeTab(row)
+        if self.book_tabs.count() == 0:
+            self.book_tabs.hide()
+            self.activate_book(None)
+
+    def discard_parked_book(self, file_path):
+        parked = self.parked_books.pop(file_path)
+        if parked is not None:
+            parked[0].close()
+            self.discard_book_caches(file_path)
+
+    def trim_memory(self):
+        """Evicts whatever the process holds past the memory cap, least recently used first."""
+        rss = process_rss()
+        if rss is not None and rss > self.memory_cap:
+            self.memory_budget.release(rss - self.memory_cap)
+
+    # --- Full-Text Search ---
+
+    def start_text_indexing(self, paths=None):
+        """Indexes the given books, or else every library book, in the background if new or changed."""
+        if not self.db_manager.has_text_index: return
+        if self.text_index_thread is not None:
+            # Pick up whatever changed meanwhile once the current pass ends.
+            if paths is None:
+                self.text_index_stale = True
+            else:
+                self.text_index_queued.update(paths)
+            return
+        if paths is None:
+            self.text_index_stale = False
+            self.text_index_queued.clear()
+        self.text_index_thread = QThread(self)
+        self.text_index_worker = LibraryTextIndexWorker(self.db_manager, paths)
+        self.text_index_worker.moveToThread(self.text_index_thread)
+        self.text_index_thread.started.connect(self.text_index_worker.run)
+        self.text_index_worker.progress.connect(self.on_text_index_progress)
+        self.text_index_worker.finished.connect(self.on_text_index_finished)
+        self.text_index_worker.finished.connect(self.text_index_thread.quit)
+        self.text_index_worker.finished.connect(self.text_index_worker.deleteLater)
+        self.text_index_thread.finished.connect(self.text_index_thread.deleteLater)
+        self.text_index_thread.start()
+
+    def on_text_index_progress(self, done, total):
+        self.statusBar().showMessage(f"Indexing book text... {done} of {total}", 2000)
+
+    def on_text_index_finished(self, summary):
+        self.text_index_thread = None
+        if summary.get('indexed'):
+            self.statusBar().showMessage(f"Indexed the text of {summary['indexed']} books", 5000)
+            if self.search_input.text().strip(): self.run_text_search()
+        if summary.get('cancelled'): return
+        if self.text_index_stale:
+            self.start_text_indexing()
+        elif self.text_index_queued:
+            paths, self.text_index_queued = list(self.text_index_queued), set()
+            self.start_text_indexing(paths)
+
+    def run_text_search(self):
+        self.search_timer.stop()
+        self.search_results.clear()
+        query = self.search_input.text().strip()
+        if not query: return
+        for hit in self.db_manager.search_text(query):
+            item = QListWidgetItem(f"📖 {hit['title']}\n{hit['snippet']}")
+            item.setData(Qt.UserRole, hit)
+            self.search_results.addItem(item)
+        if self.search_results.count() == 0:
+            self.search_results.addItem("No matches")
+
+    def open_search_hit(self, item):
+        hit = item.data(Qt.UserRole) if item else None
+        if not hit: return
+        if hit['path'] == self.current_book_path and self.book:
+            self.jump_to_search_hit(hit)
+            return
+        # Set first: a book still parked in its tab opens within load_book.
+        self.pending_search_hit = hit
+        self.load_book(hit['path'])
+
+    def jump_to_search_hit(self, hit):
+        """A hit's offset is relative to its spine document; the global position needs this book's lengths."""
+        if not self.cumulative_lens or self.total_book_len == 0: return
+        spine_index = min(hit['spine_index'], len(self.cumulative_lens) - 1)
+        char_pos = min(self.cumulative_lens[spine_index] + hit['char_offset'], self.total_book_len)
+        self.jump_to_position(char_pos / self.total_book_len * 100)
+
+    # --- Find in Book ---
+
+    def show_find_bar(self):
+        self.find_bar.show()
+        self.find_input.setFocus()
+        self.find_input.selectAll()
+
+    def hide_find_bar(self):
+        self.find_bar.hide()
+        self.text_display.setExtraSelections([])
+        self.text_display.setFocus()
+
+    def reset_find(self, release_book=False):
+        """Forgets the current matches and stops any scan still running."""
+        self.find_worker.generation += 1
+        self.find_matches, self.find_current, self.find_scanning, self.find_capped = [], -1, False, False
+        self.find_cursor_match = None
+        self.find_status.setText("")
+        if release_book:
+            self.find_requested.emit(self.find_worker.generation, None, "", 0)
+
+    def start_find(self):
+        self.find_timer.stop()
+        self.reset_find()
+        self.find_query = self.find_input.text().strip()
+        if not self.find_query or not self.book: return
+        self.find_scanning = True
+        # The first match shown is the first one at or after the reading position.
+        self.find_origin = self.get_current_char_position()
+        self.find_status.setText("Searching...")
+        self.find_requested.emit(self.find_worker.generation, self.book, self.find_query, max(self.current_spine_index, 0))
+
+    def on_find_matches(self, generation, matches):
+        if generation != self.find_worker.generation: return
+        # Each batch is one whole document; documents arrive in wrap-around
+        # order, so the batch is spliced in to keep the list in book order.
+        first_new = bisect_left(self.find_matches, matches[0])
+        self.find_matches[first_new:first_new] = matches
+        if self.find_current >= first_new:
+            self.find_current += len(matches)
+        elif self.find_current < 0:
+            for i in range(first_new, first_new + len(matches)):
+                if self.match_position(i) >= self.find_origin:
+                    self.go_to_match(i)
+                    break
+        self.update_find_status()
+
+    def on_find_finished(self, generation, total):
+        if generation != self.find_worker.generation: return
+        self.find_scanning = False
+        self.find_capped = total >= BookFindWorker.MAX_MATCHES
+        if self.find_current < 0 and self.find_matches:
+            self.go_to_match(0)
+        self.update_find_status()
+
+    def update_find_status(self):
+        if not self.find_matches:
+            self.find_status.setText("Searching..." if self.find_scanning else "No matches")
+            return
+        more = "+" if self.find_scanning or self.find_capped else ""
+        current = self.find_current + 1 if self.find_current >= 0 else "-"
+        self.find_status.setText(f"{current} of {len(self.find_matches)}{more}")
+
+    def match_position(self, i):
+        spine_index, offset, _ = self.find_matches[i]
+        return self.cumulative_lens[spine_index] + offset
+
+    def find_next(self):
+        if self.find_input.text().strip() != self.find_query or not self.find_matches:
+            self.start_find()
+            return
+        self.go_to_match((self.find_current + 1) % len(self.find_matches))
+
+    def find_previous(self):
+        if not self.find_matches: return
+        self.go_to_match((self.find_current - 1) % len(self.find_matches))
+
+    def go_to_match(self, i):
+        match = self.find_matches[i]
+        self.find_current = i
+        if self.current_spine_index != match[0] or self.pending_display is not None:
+            self.select_toc_row_for_spine(match[0])
+            self.display_spine_document(match[0], lambda: self.show_match(i, match))
+        else:
+            self.show_match(i, match)
+
+    def show_match(self, i, match):
+        """Highlights match i in the displayed document, unless a new search has replaced it meanwhile."""
+        if self.find_matches[i:i + 1] != [match]: return
+        spine_index = match[0]
+        # Matches are sorted, so the first one in this document is found by bisection.
+        nth = i - bisect_left(self.find_matches, (spine_index,))
+        cursor = self.locate_match(spine_index, nth)
+        if cursor is None:
+            self.scroll_to_position_in_chapter(self.match_position(i))
+        else:
+            highlight = QTextEdit.ExtraSelection()
+            highlight.cursor = cursor
+            highlight.format.setBackground(QColor("#ffd54f"))
+            self.text_display.setExtraSelections([highlight])
+            self.text_display.setTextCursor(cursor)
+            self.text_display.ensureCursorVisible()
+            if self.paged: self.show_page_at_cursor(cursor)
+        self.update_find_status()
+        self.update_global_progress()
+
+    def locate_match(self, spine_index, nth):
+        """Finds the nth match in the displayed document, stepping on from the previous match if possible."""
+        words = self.find_query.split()
+        regex = QRegularExpression(r'\s+'.join(QRegularExpression.escape(w) for w in words),
+                                   QRegularExpression.CaseInsensitiveOption)
+        document = self.text_display.document()
+        # In continuous mode the document's segment is searched, not the whole window.
+        segment = self.current_segment() if self.continuous else None
+        if self.find_cursor_match == (spine_index, nth - 1):
+            cursor, steps = self.find_cursor, 1
+        elif segment is not None:
+            cursor, steps = QTextCursor(document.findBlockByNumber(segment.first_block)), nth + 1
+        else:
+            cursor, steps = QTextCursor(document), nth + 1
+        for _ in range(steps):
+            cursor = document.find(regex, cursor)
+            if cursor.isNull() or (segment is not None and cursor.block().blockNumber() >= segment.end_block):
+                self.find_cursor_match = None
+                return None
+        self.find_cursor, self.find_cursor_match = cursor, (spine_index, nth)
+        return cursor
+
+    # --- Continuous Scroll ---
+
+    def set_continuous_mode(self, continuous):
+        """The spine reads as one text: the neighbours of the document being read are always in place."""
+        if continuous: self.paged_action.setChecked(False)
+        position = self.get_current_char_position() if self.book and self.book_measured else None
+        spine_index = self.current_spine_index
+        self.continuous = continuous
+        if not self.book or spine_index < 0: return
+        def restore():
+            if position is not None: self.scroll_to_position_in_chapter(position)
+        self.display_spine_document(spine_index, restore)
+
+    def current_segment(self):
+        return self.chapter_window.segment(self.current_spine_index)
+
+    def segment_anchor_map(self, segment):
+        if segment.anchor_map is not None: return segment.anchor_map
+        with tracer.span('chapter.anchor_map'):
+            return self.chapter_window.anchor_map(segment)
+
+    def segment_top(self, spine_index):
+        """Document y where a spine document starts in the window."""
+        segment = self.chapter_window.segment(spine_index)
+        if segment is None: return 0
+        document = self.text_display.document()
+        return int(document.documentLayout().blockBoundingRect(document.findBlockByNumber(segment.first_block)).top())
+
+    def window_chapters(self, spine_index, chapter):
+        """
+        The rendered documents to show around spine_index, in order. Neighbours
+        not rendered yet are left out; their prefetch brings them in later.
+        """
+        def rendered(i):
+            held = self.chapter_window.segment(i)
+            return held.chapter if held else self.chapter_cache.get((self.current_book_path, i))
+        chapters = [(spine_index, chapter)]
+        for step in (1, -1):
+            for i in range(spine_index + step, spine_index + step * (WINDOW_RADIUS + 1), step):
+                if not (0 <= i < len(self.spine)): break
+                neighbour = rendered(i)
+                if neighbour is None: break
+                chapters.append((i, neighbour))
+        return sorted(chapters, key=lambda item: item[0])
+
+    def follow_scroll(self, value):
+        """Tracks which document the reader is in; crossing into another one moves the window."""
+        # Scrolls made while a window is filled, or before a jump has landed, are not the reader's.
+        if not self.chapter_window or self.current_chapter is None or self.pending_scroll_y is not None: return
+        document = self.text_display.document()
+        position = document.documentLayout().hitTest(QPointF(0, value + 1), Qt.FuzzyHit)
+        if position < 0: return
+        segment = self.chapter_window.segment_for_block(document.findBlock(position).blockNumber())
+        if segment.spine_index == self.current_spine_index: return
+        self.current_spine_index = segment.spine_index
+        self.current_chapter = segment.chapter
+        self.find_cursor_match = None
+        if not self.toc_positions: self.select_toc_row_for_spine(segment.spine_index)
+        self.prefetch_neighbours(segment.spine_index)
+        self.window_timer.start()
+
+    def update_window(self):
+        """Moves the window along to the document being read, keeping the reader's place to the pixel."""
+        if not self.continuous or not self.book or not self.chapter_window: return
+        spine_index = self.current_spine_index
+        chapters = self.window_chapters(spine_index, self.current_chapter)
+        if [i for i, _ in chapters] == self.chapter_window.spine_indexes(): return
+        with tracer.span('chapter.window', spine=spine_index):
+            # A document lays out the same wherever it sits in the window, so the
+            # distance from its top is all that has to be kept.
+            into = self.text_display.verticalScrollBar().value() - self.segment_top(spine_index)
+            chapter, self.current_chapter = self.current_chapter, None
+            self.pending_scroll_y = None
+            self.find_cursor_match = None
+            self.text_display.setExtraSelections([])
+            self.chapter_window.move_to(chapters)
+            self.current_chapter = chapter
+            self.scroll_to_y(self.segment_top(spine_index) + into)
+
+    # --- Paginated Mode ---
+
+    def set_paged_mode(self, paged):
+        """Pages replace scrolling: the reader turns whole screens, and positions snap to page starts."""
+        if paged: self.continuous_action.setChecked(False)
+        anchor = self.chapter_offset_at_y(self.text_display.verticalScrollBar().value() + 1) if self.book else None
+        self.paged = paged
+        self.text_display.set_paged(paged)
+        self.page_label.setVisible(paged)
+        self.current_page = -1
+        if paged and self.book:
+            # Hiding the scroll bar resizes the page; the tables are requested once that has settled.
+            self.page_anchor = anchor or 0
+            self.page_layout_timer.start()
+
+    def reset_pages(self):
+        """Forgets the open book's pages. The page tables stay cached for when it comes back."""
+        self.page_layout_worker.generation += 1
+        self.page_layout_key = None
+        self.page_counts = {}
+        self.pending_layouts.clear()
+        self.current_page = -1
+        self.page_anchor = 0
+        self.text_display.set_page_window(None)
+        self.page_label.setText("")
+
+    def update_page_layout_key(self):
+        """Everything a chapter's page breaks depend on, as the text display is set up now."""
+        display = self.text_display
+        document = display.document()
+        viewport = display.viewport()
+        params = (document.defaultFont(), document.documentMargin(), viewport.width(), viewport.height(),
+                  display.devicePixelRatioF())
+        key = (params[0].toString(),) + params[1:]
+        if key == self.page_layout_key: return
+        # Whatever is queued for the old page size is no longer wanted.
+        self.page_layout_worker.generation += 1
+        self.page_layout_key = key
+        self.page_layout_params = params
+        self.page_counts = {}
+        self.pending_layouts.clear()
+        self.current_page = -1
+
+    def current_page_table(self):
+        if not self.paged or self.page_layout_key is None: return None
+        return self.page_tables.get((self.current_book_path, self.current_spine_index, self.page_layout_key))
+
+    def request_page_table(self, spine_index):
+        key = (self.current_book_path, spine_index, self.page_layout_key)
+        if key in self.pending_layouts: return
+        table = self.page_tables.get(key)
+        if table is not None:
+            self.page_counts[spine_index] = len(table)
+            return
+        self.pending_layouts.add(key)
+        # A chapter not rendered yet is rendered by the layout worker, and not cached.
+        chapter = self.chapter_cache.get((self.current_book_path, spine_index))
+        self.layout_requested.emit(self.page_layout_worker.generation, key, self.book,
+                                   chapter or self.spine[spine_index], self.page_layout_params)
+
+    def open_chapter_pages(self, offset):
+        """Shows the page of the displayed chapter holding a text offset, once the chapter is paged."""
+        self.update_page_layout_key()
+        self.page_anchor = offset
+        self.current_page = -1
+        self.text_display.set_page_window(None)
+        self.request_page_table(self.current_spine_index)
+        table = self.current_page_table()
+        if table is not None:
+            self.show_page(table.page_at(offset))
+            self.request_neighbour_pages()
+        else:
+            self.update_page_label()
+
+    def request_neighbour_pages(self):
+        for neighbour in (self.current_spine_index + 1, self.current_spine_index - 1):
+            if 0 <= neighbour < len(self.spine): self.request_page_table(neighbour)
+
+    def on_page_laid_out(self, key, table):
+        self.pending_layouts.discard(key)
+        # Tables for another book or an old page size are dropped.
+        if not self.book or key[0] != self.current_book_path or key[2] != self.page_layout_key: return
+        spine_index = key[1]
+        # A chapter that could not be laid out counts as one page and is read by scrolling.
+        self.page_counts[spine_index] = len(table) if table is not None else 1
+        if table is None:
+            self.update_page_label()
+            return
+        self.page_tables.put(key, table)
+        if spine_index == self.current_spine_index and self.paged and self.current_page < 0:
+            self.show_page(table.page_at(self.page_anchor))
+            self.request_neighbour_pages()
+        else:
+            self.update_page_label()
+
+    def page_line_y(self, table, page):
+        """Document y where a page starts in the text display's own layout."""
+        document = self.text_display.document()
+        block = document.findBlockByNumber(table.blocks[page])
+        if not block.isValid(): return None
+        # Lays the document out up to this block only.
+        top = document.documentLayout().blockBoundingRect(block).top()
+        layout = block.layout()
+        line = table.lines[page]
+        return top + (layout.lineAt(line).y() if line < layout.lineCount() else 0)
+
+    def show_page(self, page):
+        table = self.current_page_table()
+        if table is None: return
+        page = min(max(page, 0), len(table) - 1)
+        top = self.page_line_y(table, page)
+        if top is None: return
+        bottom = self.page_line_y(table, page + 1) if page + 1 < len(table) else None
+        self.current_page = page
+        self.page_anchor = table.offsets[page]
+        self.text_display.set_page_window((top, math.inf if bottom is None else bottom))
+        # The last pages of a chapter can start below the furthest scroll; the
+        # page window masks whatever of the previous page is still in view.
+        self.scroll_to_y(0 if page == 0 else math.ceil(top))
+        self.update_page_label()
+        self.update_global_progress()
+
+    def turn_page(self, step):
+        if not self.book: return
+        table = self.current_page_table()
+        if table is None or self.current_page < 0:
+            # Not paged yet: a screenful of scrolling stands in for the page.
+            scrollbar = self.text_display.verticalScrollBar()
+            scrollbar.setValue(scrollbar.value() + step * scrollbar.pageStep())
+            offset = self.chapter_offset_at_y(scrollbar.value() + 1)
+            if offset is not None: self.page_anchor = offset
+            return
+        page = self.current_page + step
+        if 0 <= page < len(table):
+            self.show_page(page)
+            return
+        spine_index = self.current_spine_index + step
+        if not (0 <= spine_index < len(self.spine)): return
+        self.select_toc_row_for_spine(spine_index)
+        # Paging back from the start of a chapter lands on the last page of the one before.
+        self.display_spine_document(spine_index, (lambda: self.open_chapter_pages(math.inf)) if step < 0 else None)
+
+    def on_display_scrolled(self, value):
+        if self.continuous:
+            self.follow_scroll(value)
+            return
+        if not self.paged or self.current_page < 0 or self.text_display.page_window is None: return
+        if self.pending_scroll_y is not None: return  # A page turn is still being applied.
+        top = self.text_display.page_window[0]
+        if not (value <= top < value + self.text_display.viewport().height()):
+            self.page_snap_timer.start()
+
+    def sync_page_to_scroll(self):
+        """Shows the page holding the line at the top of the display."""
+        offset = self.chapter_offset_at_y(self.text_display.verticalScrollBar().value() + 1)
+        if offset is None: return
+        self.page_anchor = offset
+        table = self.current_page_table()
+        if table is not None: self.show_page(table.page_at(offset))
+
+    def show_page_at_cursor(self, cursor):
+        """Shows the page holding a text cursor, e.g. a find match."""
+        table = self.current_page_table()
+        anchor_map = self.current_anchor_map()
+        if table is None or anchor_map is None: return
+        block = cursor.block()
+        line = block.layout().lineForTextPosition(cursor.selectionStart() - block.position())
+        chars = count_text_chars(block.text()[:line.textStart() if line.isValid() else 0])
+        self.show_page(table.page_at(anchor_map.offset_at(block.blockNumber(), chars)))
+
+    def on_display_resized(self):
+        if not self.paged or not self.book: return
+        # The old breaks no longer match the layout; the page is found again from page_anchor.
+        self.current_page = -1
+        self.text_display.set_page_window(None)
+        self.page_layout_timer.start()
+
+    def relayout_pages(self):
+        if self.paged and self.book and self.current_spine_index >= 0:
+            self.open_chapter_pages(self.page_anchor)
+
+    def page_numbers(self):
+        """
+        (page, total, exact) for the whole book. Chapters not laid out yet are
+        estimated from their text length at the pages per character of those that are.
+        """
+        counts = self.page_counts
+        laid_out = [i for i in counts if i < len(self.chapter_lens)]
+        # A one-page chapter (a cover, a title page) says little about how much text fits on a page.
+        sample = [i for i in laid_out if counts[i] > 1] or laid_out
+        chars = sum(self.chapter_lens[i] for i in sample)
+        pages = sum(counts[i] for i in sample)
+        chars_per_page = chars / pages if chars and pages else None
+        def count(i):
+            if i in counts: return counts[i]
+            if chars_per_page is None: return 1
+            return max(math.ceil(self.chapter_lens[i] / chars_per_page), 1)
+        before = sum(count(i) for i in range(self.current_spine_index))
+        total = before + sum(count(i) for i in range(self.current_spine_index, len(self.chapter_lens)))
+        return before + self.current_page + 1, total, len(counts) >= len(self.chapter_lens)
+
+    def update_page_label(self):
+        if not self.paged: return
+        table = self.current_page_table()
+        if not self.book or table is None or self.current_page < 0:
+            self.page_label.setText("")
+        elif not self.book_measured:
+            # Book-wide numbers need the chapter lengths.
+            self.page_label.setText(f"Page {self.current_page + 1:,} of {len(table):,} in chapter")
+        else:
+            page, total, exact = self.page_numbers()
+            self.page_label.setText(f"Page {page:,} of {'' if exact else '~'}{total:,}")
+
+    # --- Performance Tracing ---
+
+    def toggle_performance_overlay(self, checked):
+        """The overlay records while it is shown; EPUB_SWIFT_TRACE keeps tracing on regardless."""
+        tracer.set_enabled(checked or self.trace_from_env)
+        self.performance_overlay.set_active(checked)
+
+    def export_trace(self):
+        chrome_filter, stats_filter = "Chrome Trace (*.json)", "Span Statistics (*.json)"
+        path, selected = QFileDialog.getSaveFileName(self, "Export Performance Trace", "epub_swift_trace.json",
+                                                     f"{chrome_filter};;{stats_filter}")
+        if not path: return
+        try:
+            if selected == stats_filter: tracer.export_json(path)
+            else: tracer.export_chrome_trace(path)
+        except OSError as e:
+            self.statusBar().showMessage(f"Could not export the trace: {e}", 10000)
+            return
+        self.statusBar().showMessage(f"Trace exported to {path}", 10000)
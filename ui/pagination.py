@@ -0,0 +1,119 @@
+# ui/pagination.py
+from array import array
+from bisect import bisect_right
+from PySide6.QtCore import QUrl
+from PySide6.QtGui import QTextDocument, QImage, QColor
+from ui.widgets import fitted_image_size
+from utils.thumbnails import image_reader
+
+# Paginated mode lays each chapter out a second time, off the GUI thread, in a
+# QTextDocument set up like the text display (same font, width, stylesheets
+# and image sizes), and records where every page starts. Pages always start
+# on a line, so the display only has to scroll to that line and mask off the
+# partial line below the page.
+
+
+class PageTable:
+    """
+    Where each page of one laid-out chapter starts: the block and line in the
+    layout, and the visible-text offset of that line (what positions use).
+    """
+    __slots__ = ('blocks', 'lines', 'offsets')
+
+    def __init__(self):
+        self.blocks = array('l')
+        self.lines = array('l')
+        self.offsets = array('l')
+
+    def __len__(self):
+        return len(self.blocks)
+
+    def add(self, block_number, line_number, offset):
+        self.blocks.append(block_number)
+        self.lines.append(line_number)
+        # Offsets never go backwards, even where the anchor map rounds.
+        self.offsets.append(max(offset, self.offsets[-1]) if self.offsets else 0)
+
+    def page_at(self, offset):
+        """The page holding a visible-text offset of the chapter."""
+        return min(max(bisect_right(self.offsets, offset) - 1, 0), max(len(self) - 1, 0))
+
+    def nbytes(self):
+        return 3 * self.blocks.itemsize * len(self.blocks) + 64
+
+
+class PageLayoutDocument(QTextDocument):
+    """A chapter document laid out like the text display's, but with no pixels decoded."""
+
+    def __init__(self, container, image_width, ratio):
+        super().__init__()
+        self.container = container
+        self.image_width = image_width
+        self.ratio = ratio
+
+    def loadResource(self, resource_type, url):
+        from utils.html_transform import RESOURCE_SCHEME
+        if url.scheme() != RESOURCE_SCHEME:
+            return super().loadResource(resource_type, url)
+        path = url.path(QUrl.FullyDecoded).lstrip('/')
+        if resource_type == QTextDocument.StyleSheetResource:
+            from utils.chapter_renderer import load_stylesheet
+            return load_stylesheet(self.container, path)
+        if resource_type == QTextDocument.ImageResource:
+            # Only the size matters for the layout; it comes from the image header.
+            try:
+                size = image_reader(self.container.read(path)).size()
+            except (KeyError, ValueError):
+                return None
+            if not size.isValid(): return None
+            image = QImage(fitted_image_size(size, int(self.image_width * self.ratio)), QImage.Format_Mono)
+            image.fill(QColor('white'))
+            image.setDevicePixelRatio(self.ratio)
+            return image
+        return None
+
+
+def line_tops(document, block):
+    """The y of every line of a block, in document coordinates."""
+    top = document.documentLayout().blockBoundingRect(block).top()
+    layout = block.layout()
+    return [top + layout.lineAt(i).y() for i in range(layout.lineCount())]
+
+
+def compute_page_table(document, page_height, anchor_map):
+    """
+    Breaks a laid-out document into pages of at most page_height, never
+    inside a line. A line taller than a page (a large image) gets a page of its own.
+    """
+    from utils.anchor_map import count_text_chars
+    table = PageTable()
+    page_top = None
+    block = document.begin()
+    while block.isValid():
+        layout = block.layout()
+        for i, top in enumerate(line_tops(document, block)):
+            bottom = top + layout.lineAt(i).height()
+            if page_top is None or (bottom > page_top + page_height and top > page_top):
+                page_top = top
+                chars = count_text_chars(block.text()[:layout.lineAt(i).textStart()])
+                table.add(block.blockNumber(), i, int(anchor_map.offset_at(block.blockNumber(), chars)))
+        block = block.next()
+    if not len(table): table.add(0, 0, 0)
+    return table
+
+
+def lay_out_chapter(container, chapter, font, margin, width, height, ratio):
+    """The page table of one chapter for a given font and page size."""
+    from utils.anchor_map import AnchorMap
+    # Same image width as BookTextBrowser.image_target_width.
+    document = PageLayoutDocument(container, max(width - 2 * margin, 64), ratio)
+    document.setDefaultFont(font)
+    document.setDocumentMargin(margin)
+    document.setTextWidth(width)
+    document.setHtml(chapter.html)
+    texts = []
+    block = document.begin()
+    while block.isValid():
+        texts.append(block.text())
+        block = block.next()
+    return compute_page_table(document, height, AnchorMap(texts, chapter.profile))
@@ -0,0 +1,42 @@
+# ui/qt_compat.py
+import sys
+import ctypes
+from PySide6.QtCore import QObject, Signal
+
+# PySide6 6.12.0's SignalInstance.emit() returns True without taking a
+# reference to it, so every emit() made from Python leaves True's refcount
+# one lower. Nothing goes wrong until the interpreter shuts down and lets go
+# of its own references to True: once a session has emitted more signals
+# than True had references, that aborts with "Fatal Python error:
+# bool_dealloc". Loading books alone (progress, prefetch, thumbnail and
+# decode requests) emits thousands of signals.
+
+PROBE_EMITS = 16
+# Python 3.12+ makes True immortal; this does the same for older interpreters.
+TRUE_REFCOUNT_RESERVE = 1 << 40
+
+
+class _EmitProbe(QObject):
+    ping = Signal()
+
+
+def emit_leaks_true_references():
+    """True when this PySide6 build drops a reference to True on every emit()."""
+    probe = _EmitProbe()
+    before = sys.getrefcount(True)
+    for _ in range(PROBE_EMITS): probe.ping.emit()
+    leaked = before - sys.getrefcount(True)
+    if leaked > 0:
+        # Pay back what the probe itself took.
+        ctypes.c_ssize_t.from_address(id(True)).value += leaked
+    return leaked >= PROBE_EMITS
+
+
+def guard_signal_emit_refcount():
+    """
+    Works around the emit() refcount bug, if this PySide6 has it, by giving
+    True a reference reserve no session can use up. Call once at startup.
+    """
+    if sys.implementation.name != 'cpython' or not emit_leaks_true_references(): return False
+    ctypes.c_ssize_t.from_address(id(True)).value += TRUE_REFCOUNT_RESERVE
+    return True
@@ -1,16 +1,47 @@
 # ui/widgets.py
-from PySide6.QtWidgets import QProgressBar, QWidget, QDialog, QLabel, QPushButton, QVBoxLayout, QHBoxLayout, QFrame
-from PySide6.QtGui import QPainter, QPen, QColor
-from PySide6.QtCore import Qt, Signal, QRect, QTimer
+import math
+from PySide6.QtWidgets import QApplication, QProgressBar, QWidget, QDialog, QLabel, QPushButton, QVBoxLayout, QHBoxLayout, QFrame, QTextBrowser
+from PySide6.QtGui import QPainter, QPen, QColor, QImage, QTextDocument, QFontDatabase
+from PySide6.QtCore import Qt, Signal, QObject, QEvent, QRect, QTimer, QUrl, QSize
+from utils.thumbnails import image_reader
+from utils.tracing import tracer
+
+class FirstPaintWatcher(QObject):
+    """Calls back once, right after the application has painted its first frame."""
+
+    def __init__(self, callback, parent=None):
+        super().__init__(parent)
+        self.callback = callback
+        QApplication.instance().installEventFilter(self)
+
+    def eventFilter(self, watched, event):
+        if event.type() == QEvent.Paint:
+            QApplication.instance().removeEventFilter(self)
+            # The timer fires once every paint event of this frame has been handled.
+            QTimer.singleShot(0, self.callback)
+        return False
+
 
 class ClickableProgressBar(QProgressBar):
-    """A custom progress bar that is clickable and has reactive text color."""
+    """
+    A custom progress bar that is clickable and has reactive text color.
+    Dragging only emits cheap scrub_moved previews; the real jump is emitted
+    once, for the latest position, on release or after a short pause.
+    """
     jump_requested = Signal(float)
+    scrub_moved = Signal(float)
+    SCRUB_IDLE_MS = 250
 
     def __init__(self, parent=None):
         super().__init__(parent)
         self.setCursor(Qt.PointingHandCursor)
         self.setTextVisible(False) # We draw the text manually for reactive color
+        self.scrub_target = None
+        self.busy_text = None
+        self.idle_timer = QTimer(self)
+        self.idle_timer.setSingleShot(True)
+        self.idle_timer.setInterval(self.SCRUB_IDLE_MS)
+        self.idle_timer.timeout.connect(self.commit_scrub)
 
     def paintEvent(self, event):
         super().paintEvent(event)
@@ -19,7 +50,7 @@ class ClickableProgressBar(QProgressBar):
         progress_ratio = self.value() / self.maximum() if self.maximum() != 0 else 0
         chunk_width = int(self.width() * progress_ratio)
         
-        text = f"{self.value()}%"
+        text = f"{self.busy_text} {self.value()}%" if self.busy_text else f"{self.value()}%"
         font = self.font()
         font.setPointSize(9)
         font.setBold(True)
@@ -43,25 +74,246 @@ class ClickableProgressBar(QProgressBar):
         painter.drawText(self.rect(), Qt.AlignCenter, text)
         painter.restore()
 
+    def set_busy(self, text):
+        """Shows the bar as a labelled, unclickable progress indicator; None makes it a position bar again."""
+        self.busy_text = text
+        self.setCursor(Qt.ArrowCursor if text else Qt.PointingHandCursor)
+        self.update()
+
     def mousePressEvent(self, event):
-        if event.button() == Qt.LeftButton: self.process_jump(event.pos())
+        if self.busy_text: return
+        if event.button() == Qt.LeftButton: self.process_scrub(event.pos())
 
     def mouseMoveEvent(self, event):
-        if event.buttons() & Qt.LeftButton: self.process_jump(event.pos())
-            
-    def process_jump(self, pos):
-        percentage = (pos.x() / self.width()) * 100
+        if self.busy_text: return
+        if event.buttons() & Qt.LeftButton: self.process_scrub(event.pos())
+
+    def mouseReleaseEvent(self, event):
+        if event.button() == Qt.LeftButton and self.scrub_target is not None:
+            self.process_scrub(event.pos())
+            self.commit_scrub()
+
+    def process_scrub(self, pos):
+        percentage = min(max((pos.x() / self.width()) * 100, 0.0), 100.0)
+        self.scrub_target = percentage
         self.setValue(int(percentage))
+        self.scrub_moved.emit(percentage)
+        self.idle_timer.start()
+
+    def commit_scrub(self):
+        self.idle_timer.stop()
+        if self.scrub_target is None: return
+        percentage, self.scrub_target = self.scrub_target, None
         self.jump_requested.emit(percentage)
 
 
+def fitted_image_size(size, max_width):
+    """The size a book image is shown at: its own, or scaled down to max_width."""
+    if size.width() > max_width:
+        size = size.scaled(max_width, size.height() * max_width // size.width() + 1, Qt.KeepAspectRatio)
+    return size
+
+
+class BookTextBrowser(QTextBrowser):
+    """
+    The chapter view. epub:/ images and stylesheets are served from the open
+    book: images are scaled down to the viewport width and decoded off the
+    GUI thread (a same-sized placeholder keeps the layout stable meanwhile),
+    and decoded images live in a byte-budgeted cache shared by all chapters.
+    """
+    decode_requested = Signal(object, bytes, QSize)
+    # Paginated mode: the wheel and paging keys turn pages instead of scrolling.
+    page_turn_requested = Signal(int)
+    resized = Signal()
+    # Small images are cheaper to decode on the spot than to round-trip through the worker.
+    SYNC_DECODE_BYTES = 64 * 1024
+    PLACEHOLDER_COLOR = "#eef0f3"
+
+    def __init__(self, image_cache, parent=None):
+        super().__init__(parent)
+        self.image_cache = image_cache
+        self.container = None
+        self.book_key = None
+        self.pending_images = {}
+        self.stylesheets = {}
+        self.paged = False
+        self.page_window = None
+        self.wheel_delta = 0
+
+    def set_book(self, container, book_key):
+        self.container = container
+        self.book_key = book_key
+        self.pending_images.clear()
+        self.stylesheets.clear()
+
+    def loadResource(self, resource_type, url):
+        # Not needed until a book is open, so kept off the startup path.
+        from utils.html_transform import RESOURCE_SCHEME
+        if url.scheme() != RESOURCE_SCHEME or self.container is None:
+            return super().loadResource(resource_type, url)
+        path = url.path(QUrl.FullyDecoded).lstrip('/')
+        if resource_type == QTextDocument.StyleSheetResource:
+            return self.load_stylesheet(path)
+        if resource_type == QTextDocument.ImageResource:
+            return self.load_image(path, url)
+        return None
+
+    def load_stylesheet(self, path):
+        if path not in self.stylesheets:
+            from utils.chapter_renderer import load_stylesheet
+            self.stylesheets[path] = load_stylesheet(self.container, path)
+        return self.stylesheets[path]
+
+    def image_target_width(self):
+        """Widest an image can be shown, in device pixels."""
+        margin = int(self.document().documentMargin() * 2)
+        return max(self.viewport().width() - margin, 64)
+
+    def load_image(self, path, url):
+        ratio = self.devicePixelRatioF()
+        max_width = int(self.image_target_width() * ratio)
+        key = (self.book_key, path, max_width)
+        image = self.image_cache.get(key)
+        if image is not None: return image
+        try:
+            data = self.container.read(path)
+        except (KeyError, ValueError):
+            return None
+        reader = image_reader(data)
+        size = reader.size()  # Read from the header; nothing is decoded yet.
+        if not size.isValid(): return None
+        size = fitted_image_size(size, max_width)
+        if len(data) <= self.SYNC_DECODE_BYTES:
+            with tracer.span('image.decode_sync'):
+                reader.setScaledSize(size)
+                image = reader.read()
+            if image.isNull(): return None
+            image.setDevicePixelRatio(ratio)
+            self.image_cache.put(key, image)
+            return image
+        if key not in self.pending_images:
+            self.pending_images[key] = url
+            tracer.queued('image.decode', key)
+            self.decode_requested.emit(key, data, size)
+        placeholder = QImage(size, QImage.Format_ARGB32_Premultiplied)
+        placeholder.fill(QColor(self.PLACEHOLDER_COLOR))
+        placeholder.setDevicePixelRatio(ratio)
+        return placeholder
+
+    # --- Paginated Mode ---
+
+    def set_paged(self, paged):
+        self.paged = paged
+        self.setVerticalScrollBarPolicy(Qt.ScrollBarAlwaysOff if paged else Qt.ScrollBarAsNeeded)
+        self.set_page_window(None)
+
+    def set_page_window(self, window):
+        """The (top, bottom) document y of the page on show; lines outside it are masked. None shows everything."""
+        self.page_window = window
+        self.viewport().update()
+
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if not self.paged or self.page_window is None: return
+        # The scroll position can lag behind a page turn, so the mask is placed at paint time.
+        offset = self.verticalScrollBar().value()
+        top, bottom = self.page_window[0] - offset, self.page_window[1] - offset
+        viewport = self.viewport()
+        painter = QPainter(viewport)
+        background = viewport.palette().color(viewport.backgroundRole())
+        if top > 0: painter.fillRect(QRect(0, 0, viewport.width(), math.ceil(top)), background)
+        if bottom < viewport.height():
+            painter.fillRect(QRect(0, int(bottom), viewport.width(), viewport.height() - int(bottom)), background)
+
+    def wheelEvent(self, event):
+        if not self.paged: return super().wheelEvent(event)
+        # One page per wheel notch; touchpads send smaller steps that add up to one.
+        self.wheel_delta += event.angleDelta().y()
+        while abs(self.wheel_delta) >= 120:
+            step = -1 if self.wheel_delta > 0 else 1
+            self.wheel_delta += 120 * step
+            self.page_turn_requested.emit(step)
+        event.accept()
+
+    def keyPressEvent(self, event):
+        if self.paged:
+            key = event.key()
+            if key in (Qt.Key_PageDown, Qt.Key_Down, Qt.Key_Right) or (key == Qt.Key_Space and not event.modifiers()):
+                self.page_turn_requested.emit(1)
+                return
+            if key in (Qt.Key_PageUp, Qt.Key_Up, Qt.Key_Left) or (key == Qt.Key_Space and event.modifiers() & Qt.ShiftModifier):
+                self.page_turn_requested.emit(-1)
+                return
+        super().keyPressEvent(event)
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.resized.emit()
+
+    def on_image_decoded(self, key, image):
+        url = self.pending_images.pop(key, None)
+        if image.isNull(): return
+        image.setDevicePixelRatio(self.devicePixelRatioF())
+        self.image_cache.put(key, image)
+        if url is None or key[0] != self.book_key: return
+        # Same size as the placeholder, so only a repaint is needed, not a relayout.
+        self.document().addResource(QTextDocument.ImageResource, url, image)
+        self.viewport().update()
+
+
+class PerformanceOverlay(QLabel):
+    """Live tracing statistics drawn over the top-right corner of its parent."""
+    REFRESH_MS = 500
+    MAX_ROWS = 16
+
+    def __init__(self, parent):
+        super().__init__(parent)
+        self.setAttribute(Qt.WA_TransparentForMouseEvents)
+        self.setTextFormat(Qt.PlainText)
+        font = QFontDatabase.systemFont(QFontDatabase.FixedFont)
+        font.setPointSize(9)
+        self.setFont(font)
+        self.setStyleSheet("background-color: rgba(24, 28, 36, 210); color: #e8ecf2; border-radius: 6px; padding: 8px;")
+        self.timer = QTimer(self)
+        self.timer.setInterval(self.REFRESH_MS)
+        self.timer.timeout.connect(self.refresh)
+        self.hide()
+
+    def set_active(self, active):
+        if active:
+            self.refresh()
+            self.show()
+            self.raise_()
+            self.timer.start()
+        else:
+            self.timer.stop()
+            self.hide()
+
+    def refresh(self):
+        lines = [f"{'span (ms)':24} {'count':>6} {'last':>7} {'p50':>7} {'p95':>7} {'max':>7}"]
+        for name, s in list(tracer.stats().items())[:self.MAX_ROWS]:
+            lines.append(f"{name[:24]:24} {s['count']:6d} {s['last_ms']:7.1f} {s['p50_ms']:7.1f} "
+                         f"{s['p95_ms']:7.1f} {s['max_ms']:7.1f}")
+        if len(lines) == 1: lines.append("Nothing recorded yet.")
+        self.setText('\n'.join(lines))
+        self.adjustSize()
+        self.move(max(self.parentWidget().width() - self.width() - 24, 0), 8)
+
+
 class LoadingSpinner(QWidget):
-    """A modal loading spinner animation."""
+    """
+    A small spinner centred over its parent while a book is opening. It is
+    not modal and lets clicks through, so another book can be picked meanwhile,
+    and each frame repaints only its own square.
+    """
+    SIZE = 64
+
     def __init__(self, parent=None):
         super().__init__(parent)
-        self.setWindowFlags(Qt.FramelessWindowHint | Qt.Dialog)
-        self.setWindowModality(Qt.ApplicationModal)
         self.setAttribute(Qt.WA_TranslucentBackground)
+        self.setAttribute(Qt.WA_TransparentForMouseEvents)
+        self.setFixedSize(self.SIZE, self.SIZE)
+        self.hide()
         
         self.angle = 0
         self.timer = QTimer(self)
@@ -76,22 +328,25 @@ class LoadingSpinner(QWidget):
         painter = QPainter(self)
         painter.setRenderHint(QPainter.Antialiasing)
         
-        # Draw a semi-transparent background overlay
-        painter.fillRect(self.rect(), QColor(240, 240, 240, 150))
+        # A soft disc behind the arc keeps it visible over any page
+        painter.setPen(Qt.NoPen)
+        painter.setBrush(QColor(240, 240, 240, 200))
+        painter.drawEllipse(self.rect())
         
         painter.translate(self.width() / 2, self.height() / 2)
         painter.rotate(self.angle)
         
-        pen = QPen(QColor("#345B9A"), 8)
+        pen = QPen(QColor("#345B9A"), 6)
         pen.setCapStyle(Qt.RoundCap)
         painter.setPen(pen)
         
         # Draw a smaller arc for a more subtle animation
-        painter.drawArc(QRect(-20, -20, 40, 40), 0, 270 * 16)
+        painter.drawArc(QRect(-18, -18, 36, 36), 0, 270 * 16)
 
     def start_animation(self):
         if self.parent():
-            self.setGeometry(self.parent().rect())
+            self.move(self.parent().rect().center() - self.rect().center())
+        self.raise_()
         self.timer.start()
         self.show()
 
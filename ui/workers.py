@@ -1,55 +1,510 @@
 # ui/workers.py
 import os
-from PySide6.QtCore import QObject, Signal
-import ebooklib
-from ebooklib import epub
-from bs4 import BeautifulSoup
+from itertools import islice
+from PySide6.QtCore import QObject, QThread, Signal
+from PySide6.QtGui import QImage
+from utils.thumbnails import NO_COVER, image_reader
+from utils.helpers import normalize_book_path, iter_epub_files
+from utils.tracing import tracer
+
+# The EPUB parsing, rendering and process pool modules are imported inside
+# the methods that use them, on the worker threads, so none of them are
+# loaded before the main window has painted.
+
+# Imported books are written to the database in transactions of this size.
+IMPORT_BATCH_SIZE = 200
+# Library books fingerprinted per job when catching up on ones imported without; each one is quick.
+FINGERPRINT_CHUNK_SIZE = 32
+# Threads loading books for the reader. A second one lets a new load start
+# while a superseded one is still finishing its current spine document.
+BOOK_LOAD_THREADS = 2
 
 class BookLoaderWorker(QObject):
-    finished = Signal(dict)
+    """
+    Loads books on one of the BookLoadPool's threads, in two steps: `opened`
+    hands over the container and TOC as soon as the OPF is parsed, then
+    `finished` brings the text lengths, which are measured with `progress`
+    updates unless the database has them cached. A load whose generation
+    is no longer current stops at the next spine document.
+    """
+    requested = Signal(int, str)
+    opened = Signal(int, dict)
+    progress = Signal(int, int, int)
+    finished = Signal(int, dict)
 
-    def __init__(self, file_path):
+    def __init__(self, db_manager=None, thumbnails=None, current_generation=None):
         super().__init__()
-        self.file_path = file_path
+        self.db_manager = db_manager
+        self.thumbnails = thumbnails
+        self.current_generation = current_generation
 
-    def run(self):
+    def load(self, generation, file_path):
         """
-        Loads the EPUB using the stable method. This is slightly slower but
-        compatible with all versions of the ebooklib.
+        Opens the EPUB as a lazy zip-backed container: only the OPF, spine and
+        NCX/nav are read here, chapter bytes are fetched later on demand.
+
+        The title, TOC, spine order and text lengths are cached in the database,
+        so reopening an unchanged book skips the expensive spine parse.
         """
+        from utils.book_index import book_metadata, measure_book, file_signature, book_cover_key, LoadCancelled
+        from utils.epub_container import EpubContainer
+        tracer.started('book.load', generation)
+
+        def check():
+            if self.current_generation and self.current_generation() != generation:
+                raise LoadCancelled()
+
+        last_percent = -1
+        def report(done, total):
+            nonlocal last_percent
+            percent = done * 100 // total
+            if percent != last_percent:
+                last_percent = percent
+                self.progress.emit(generation, done, total)
+
+        container = None
+        handed_over = False
+        try:
+            with tracer.span('book.load', path=os.path.basename(file_path)):
+                check()
+                file_size, file_mtime = file_signature(file_path)
+
+                with tracer.span('book.open'):
+                    container = EpubContainer(file_path)
+
+                fingerprint = container.fingerprint()
+                index = None
+                if self.db_manager:
+                    # A library book opened from where it was moved to takes its entry back first.
+                    self.db_manager.rebind_moved_books([(file_path, file_size, file_mtime, fingerprint)])
+                    index = self.db_manager.load_book_index(file_path, file_size, file_mtime)
+                # From here on the reader owns the container and closes it.
+                self.opened.emit(generation, dict(index or book_metadata(container), book=container))
+                handed_over = True
+                if index is None:
+                    with tracer.span('book.measure'):
+                        index = dict(book_metadata(container), **measure_book(container, check=check, progress=report))
+                    if self.db_manager:
+                        self.db_manager.save_book_index(file_path, file_size, file_mtime, index)
+
+                result = dict(index, fingerprint=fingerprint)
+                if self.thumbnails:
+                    check()
+                    # Cheap when the thumbnail exists: the key check is a single stat.
+                    try:
+                        with tracer.span('book.cover'):
+                            result['cover_key'] = book_cover_key(container, file_size, file_mtime, self.thumbnails)
+                    except Exception:
+                        pass
+            self.finished.emit(generation, result)
+        except LoadCancelled:
+            if container and not handed_over: container.close()
+            self.finished.emit(generation, {'cancelled': True})
+        except Exception as e:
+            if container and not handed_over: container.close()
+            self.finished.emit(generation, {'error': str(e)})
+
+
+class BookLoadPool(QObject):
+    """
+    A fixed set of book-loading threads. Every load() supersedes the ones
+    before it: their signals are dropped and any archive they opened is
+    closed, and while all threads are busy only the newest request waits.
+    """
+    opened = Signal(int, dict)
+    progress = Signal(int, int, int)
+    loaded = Signal(int, dict)
+
+    def __init__(self, db_manager=None, thumbnails=None, size=BOOK_LOAD_THREADS, parent=None):
+        super().__init__(parent)
+        self.generation = 0
+        self.pending = None
+        self.threads = []
+        # Workers have no parent, so this list is what keeps them alive.
+        self.workers = []
+        for _ in range(size):
+            thread = QThread(self)
+            worker = BookLoaderWorker(db_manager, thumbnails, lambda: self.generation)
+            worker.moveToThread(thread)
+            worker.requested.connect(worker.load)
+            worker.opened.connect(self.on_worker_opened)
+            worker.progress.connect(self.on_worker_progress)
+            worker.finished.connect(self.on_worker_finished)
+            thread.finished.connect(worker.deleteLater)
+            thread.start()
+            self.threads.append(thread)
+            self.workers.append(worker)
+        self.idle = list(self.workers)
+
+    def load(self, file_path):
+        """Starts loading a book and returns the load's generation."""
+        self.generation += 1
+        self.pending = (self.generation, file_path)
+        tracer.queued('book.load', self.generation)
+        self.dispatch()
+        return self.generation
+
+    def cancel(self):
+        """Abandons every load in progress."""
+        self.generation += 1
+        self.pending = None
+
+    def dispatch(self):
+        if self.pending and self.idle:
+            self.idle.pop().requested.emit(*self.pending)
+            self.pending = None
+
+    def on_worker_opened(self, generation, result):
+        if generation == self.generation:
+            self.opened.emit(generation, result)
+        else:
+            # Opened just as it was superseded; let go of the archive now rather than at GC.
+            result['book'].close()
+
+    def on_worker_progress(self, generation, done, total):
+        if generation == self.generation: self.progress.emit(generation, done, total)
+
+    def on_worker_finished(self, generation, result):
+        self.idle.append(self.sender())
+        if generation == self.generation: self.loaded.emit(generation, result)
+        self.dispatch()
+
+    def shutdown(self):
+        self.cancel()
+        for thread in self.threads:
+            thread.quit()
+            thread.wait()
+
+
+class ChapterPrefetchWorker(QObject):
+    """
+    Renders chapters in the background: neighbouring ones so flipping to them
+    is instant, and (on a thread of its own) ones asked for before they were.
+    """
+    rendered = Signal(object, object)
+    failed = Signal(object, str)
+
+    def prefetch(self, container, cache_key, spine_path):
+        from utils.chapter_renderer import prepare_chapter
+        tracer.started('chapter.prefetch', cache_key)
+        if container.closed: return
+        try:
+            with tracer.span('chapter.prefetch'):
+                chapter = prepare_chapter(container, spine_path)
+        except Exception as e:
+            self.failed.emit(cache_key, str(e))
+            return
+        self.rendered.emit(cache_key, chapter)
+
+
+class PageLayoutWorker(QObject):
+    """
+    Computes the page breaks of chapters for paginated mode on a long-lived
+    thread. A bumped generation (new page size, other book) drops the
+    requests still queued for the old one.
+    """
+    laid_out = Signal(object, object)
+
+    def __init__(self):
+        super().__init__()
+        self.generation = 0
+
+    def layout(self, generation, key, container, source, params):
+        """source is a rendered chapter, or the spine path of one that is not rendered yet."""
+        if generation != self.generation or container.closed: return
+        from ui.pagination import lay_out_chapter
+        from utils.chapter_renderer import prepare_chapter
+        try:
+            with tracer.span('page.layout', spine=key[1]):
+                chapter = prepare_chapter(container, source) if isinstance(source, str) else source
+                table = lay_out_chapter(container, chapter, *params)
+        except Exception:
+            table = None  # The chapter is paged by scrolling instead.
+        self.laid_out.emit(key, table)
+
+
+class BookFindWorker(QObject):
+    """
+    Searches the open book on a long-lived thread, starting at the displayed
+    document and wrapping around. The book's text index is kept between
+    queries; a newer query (a bumped generation) stops the scan of an older
+    one at the next document.
+    """
+    matches_found = Signal(int, list)
+    finished = Signal(int, int)
+
+    MAX_MATCHES = 5000
+
+    def __init__(self):
+        super().__init__()
+        self.generation = 0
+        self.index = None
+
+    def find(self, generation, container, query, start_spine=0):
+        if container is None:
+            self.index = None  # The book was closed; let its text go.
+            return
+        if generation != self.generation: return
+        from utils.find_index import BookTextIndex, compile_query
+        if self.index is None or self.index.container is not container:
+            self.index = BookTextIndex(container)
+        pattern = compile_query(query)
+        total = 0
+        with tracer.span('find.scan', query=query):
+            try:
+                count = len(self.index) if pattern else 0
+                start_spine = min(max(start_spine, 0), max(count - 1, 0))
+                for spine_index in list(range(start_spine, count)) + list(range(start_spine)):
+                    if generation != self.generation: return
+                    found = islice(self.index.find(spine_index, pattern), self.MAX_MATCHES - total)
+                    matches = [(spine_index, offset, length) for offset, length in found]
+                    if matches:
+                        total += len(matches)
+                        self.matches_found.emit(generation, matches)
+                    if total >= self.MAX_MATCHES: break
+            except ValueError:
+                return  # Closed underneath us.
+        self.finished.emit(generation, total)
+
+
+class ImageDecodeWorker(QObject):
+    """Decodes book images off the GUI thread, scaling while decoding where the format allows it."""
+    decoded = Signal(object, QImage)
+
+    def decode(self, key, data, size):
+        tracer.started('image.decode', key)
+        with tracer.span('image.decode'):
+            reader = image_reader(data)
+            reader.setScaledSize(size)
+            image = reader.read()
+        # A null image still reports back, so the request is no longer pending.
+        self.decoded.emit(key, image)
+
+
+class ThumbnailWorker(QObject):
+    """
+    Serves cover thumbnails to the library view. Cached thumbnails are read
+    from disk; a book whose cover was never looked at is opened once to make
+    one. Requests only come for rows the view is painting.
+    """
+    loaded = Signal(str, QImage)
+    generated = Signal(str, str)
+    EVICT_EVERY = 100
+
+    def __init__(self, thumbnails):
+        super().__init__()
+        self.thumbnails = thumbnails
+        self.stored = 0
+
+    def load(self, key):
+        tracer.started('thumbnail.load', key)
+        with tracer.span('thumbnail.load'):
+            data = self.thumbnails.load(key)
+        # A null image tells the model the file is gone and must be made again.
+        self.loaded.emit(key, QImage.fromData(data) if data else QImage())
+
+    def generate(self, path):
+        from utils.book_index import file_signature, book_cover_key
+        from utils.epub_container import EpubContainer
+        tracer.started('thumbnail.generate', path)
+        try:
+            with tracer.span('thumbnail.generate'):
+                file_size, file_mtime = file_signature(path)
+                with EpubContainer(path) as container:
+                    key = book_cover_key(container, file_size, file_mtime, self.thumbnails)
+        except Exception:
+            key = NO_COVER
+        self.generated.emit(path, key)
+        self.stored += 1
+        if self.stored % self.EVICT_EVERY == 0: self.thumbnails.evict()
+
+
+def find_epub_files(root):
+    """Recursively lists the EPUB files under a folder, in a stable order."""
+    return list(iter_epub_files(root))
+
+
+class LibraryImportWorker(QObject):
+    """
+    Imports every EPUB under a folder. Books are indexed in worker processes
+    and written in batched transactions. Files whose size/mtime match their
+    cached index are skipped, which is also what makes an interrupted import
+    resume where it stopped. Each batch is checked against the library by
+    the fingerprints its records carry: files that are library books moved
+    or renamed take over their entries (progress included) before it is saved.
+    """
+    progress = Signal(int, int)
+    finished = Signal(dict)
+
+    def __init__(self, root, db_manager, max_workers=None, thumbnails=None):
+        super().__init__()
+        self.root = normalize_book_path(root)
+        self.db_manager = db_manager
+        self.thumbnails = thumbnails
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self._cancelled = False
+
+    def cancel(self):
+        self._cancelled = True
+
+    def run(self):
+        from utils.book_index import file_signature, index_book_file
+        from utils.process_pool import imap_bounded, process_pool
+        summary = {'root': self.root, 'imported': 0, 'skipped': 0, 'relinked': 0, 'failed': [], 'cancelled': False}
+        try:
+            self.db_manager.start_import_job(self.root)
+            paths = find_epub_files(self.root)
+            known = self.db_manager.indexed_signatures()
+            todo = []
+            for path in paths:
+                try:
+                    if known.get(path) != file_signature(path): todo.append(path)
+                except OSError as e:
+                    summary['failed'].append((path, str(e)))
+            summary['skipped'] = len(paths) - len(todo) - len(summary['failed'])
+
+            thumbnail_dir = self.thumbnails.directory if self.thumbnails else None
+            batch = []
+            total, done = len(paths), len(paths) - len(todo)
+            self.progress.emit(done, total)
+            with process_pool(self.max_workers) as executor:
+                self.fingerprint_library(executor)
+                for record in imap_bounded(index_book_file, todo, self.max_workers, thumbnail_dir,
+                                           executor=executor, cancelled=lambda: self._cancelled):
+                    done += 1
+                    if 'error' in record:
+                        summary['failed'].append((record['path'], record['error']))
+                    else:
+                        batch.append(record)
+                    if len(batch) >= IMPORT_BATCH_SIZE:
+                        self.save_batch(batch, summary)
+                        batch = []
+                    self.progress.emit(done, total)
+
+            if batch: self.save_batch(batch, summary)
+            summary['cancelled'] = self._cancelled
+            if not self._cancelled:
+                self.db_manager.finish_import_job(self.root)
+            if self.thumbnails: self.thumbnails.evict()
+        except Exception as e:
+            summary['error'] = str(e)
+        # This thread ends with the import, so its database connection goes too.
+        self.db_manager.release_connection()
+        self.finished.emit(summary)
+
+    def fingerprint_library(self, executor):
+        """Books imported before fingerprints were kept get theirs while their files are still in place."""
+        from utils.book_index import book_fingerprint
+        unfingerprinted = [path for path in self.db_manager.paths_without_fingerprint() if os.path.exists(path)]
+        if not unfingerprinted: return
+        found = executor.map(book_fingerprint, unfingerprinted, chunksize=FINGERPRINT_CHUNK_SIZE)
+        self.db_manager.set_fingerprints([(f[0], f[3]) for f in found if f])
+
+    def save_batch(self, batch, summary):
+        # Moved books are rebound first, so saving updates their entries instead of adding new ones.
+        moves = self.db_manager.rebind_moved_books([(r['path'], r['size'], r['mtime'], r.get('fingerprint')) for r in batch])
+        self.db_manager.save_imported_books(batch)
+        summary['relinked'] += len(moves)
+        summary['imported'] += len(batch) - len(moves)
+
+
+class BookExportWorker(QObject):
+    """
+    Exports books to plain text or HTML files, one spine document at a time.
+    `jobs` yields (book path, output path) pairs and is consumed on the
+    worker thread, so a folder walk never blocks the window. A single book
+    is exported right here; a batch runs in worker processes if there is
+    more than one core.
+    """
+    progress = Signal(int, int)
+    finished = Signal(dict)
+
+    def __init__(self, jobs, fmt, max_workers=None):
+        super().__init__()
+        self.jobs = jobs
+        self.fmt = fmt
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self._cancelled = False
+
+    def cancel(self):
+        self._cancelled = True
+
+    def run(self):
+        from utils.book_export import export_job
+        from utils.process_pool import imap_bounded
+        summary = {'exported': 0, 'failed': [], 'outputs': [], 'cancelled': False}
+        try:
+            jobs = list(self.jobs)
+            total, done = len(jobs), 0
+            self.progress.emit(done, total)
+            # Books already being written when the export is cancelled are finished and counted.
+            for record in imap_bounded(export_job, jobs, min(self.max_workers, total), self.fmt,
+                                       cancelled=lambda: self._cancelled):
+                done += 1
+                if 'error' in record:
+                    summary['failed'].append((record['path'], record['error']))
+                else:
+                    summary['exported'] += 1
+                    summary['outputs'].append(record['output'])
+                self.progress.emit(done, total)
+            summary['cancelled'] = self._cancelled
+        except Exception as e:
+            summary['error'] = str(e)
+        self.finished.emit(summary)
+
+
+class LibraryTextIndexWorker(QObject):
+    """
+    Brings the full-text index up to date with the library, or with just
+    `paths` when given. Only books that are new or changed since they were
+    last indexed are read, a couple at a time in worker processes, so it can
+    run quietly in the background.
+    """
+    progress = Signal(int, int)
+    finished = Signal(dict)
+
+    def __init__(self, db_manager, paths=None, max_workers=2):
+        super().__init__()
+        self.db_manager = db_manager
+        self.paths = paths
+        self.max_workers = max(1, min(max_workers, os.cpu_count() or 1))
+        self._cancelled = False
+
+    def cancel(self):
+        self._cancelled = True
+
+    def run(self):
+        from utils.book_index import file_signature, extract_book_text
+        from utils.process_pool import imap_bounded, process_pool
+        summary = {'indexed': 0, 'failed': [], 'cancelled': False}
         try:
-            # Reverted: The problematic 'ignore_ncx' argument is removed.
-            book = epub.read_epub(self.file_path)
-            
-            # --- Metadata Extraction ---
-            book_title_meta = book.get_metadata('DC', 'title')
-            title = book_title_meta[0][0] if book_title_meta else os.path.basename(self.file_path)
-            chapters = [{'title': item.title, 'href': item.href} for item in book.toc if isinstance(item, epub.Link)]
-
-            # --- Stable Progress Calculation ---
-            total_len = 0
-            chap_lens = []
-            cum_lens = [0]
-            
-            spine_items = [book.get_item_with_id(item_id) for item_id, _ in book.spine]
-            
-            for item in spine_items:
-                if item and item.get_type() == ebooklib.ITEM_DOCUMENT:
-                    # This is the stable method: read content and get text length.
-                    content = item.get_content()
-                    text_len = len(BeautifulSoup(content, 'html.parser').get_text(strip=True))
-                    chap_lens.append(text_len)
-                    total_len += text_len
-            
-            cumulative = 0
-            for length in chap_lens:
-                cumulative += length
-                cum_lens.append(cumulative)
-            
-            result = {
-                'book': book, 'title': title, 'chapters': chapters, 'total_len': total_len, 
-                'chap_lens': chap_lens, 'cum_lens': cum_lens
-            }
-            self.finished.emit(result)
+            if not self.db_manager.has_text_index:
+                self.finished.emit(summary)
+                return
+            known = self.db_manager.text_index_signatures()
+            todo = []
+            # Checking the whole library stats every file in it, so that is left to startup and imports.
+            for path in self.paths if self.paths is not None else self.db_manager.library_paths():
+                try:
+                    if known.get(path) != file_signature(path): todo.append(path)
+                except OSError:
+                    continue  # Missing files stay searchable until they come back or are re-indexed.
+            total, done = len(todo), 0
+            if todo:
+                self.progress.emit(done, total)
+                # Always in processes, even on one core: extraction would hold the GIL for long stretches.
+                with process_pool(self.max_workers) as executor:
+                    for record in imap_bounded(extract_book_text, todo, self.max_workers,
+                                               executor=executor, cancelled=lambda: self._cancelled):
+                        done += 1
+                        if 'error' in record:
+                            summary['failed'].append((record['path'], record['error']))
+                        else:
+                            self.db_manager.replace_book_text(record['path'], record['size'], record['mtime'], record['passages'])
+                            summary['indexed'] += 1
+                        self.progress.emit(done, total)
+            summary['cancelled'] = self._cancelled
         except Exception as e:
-            self.finished.emit({'error': str(e)})
+            summary['error'] = str(e)
+        self.db_manager.release_connection()
+        self.finished.emit(summary)
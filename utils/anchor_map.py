@@ -0,0 +1,108 @@
+# utils/anchor_map.py
+import re
+from array import array
+from bisect import bisect_right
+from utils.text_metrics import VisibleTextParser, decode_markup
+
+# Saved positions are offsets into a document's visible text, but Qt lays
+# out its own version of that text (collapsed whitespace, object characters
+# for images). Both sides agree on the non-whitespace characters, so those
+# are what the two are matched on.
+
+CHECKPOINT_STEP = 16
+NOT_TEXT_RE = re.compile(r'[\s\ufffc]+')
+CHECKPOINT_RE = re.compile(r'(?:\s*\S){%d}' % CHECKPOINT_STEP)
+
+
+def count_text_chars(text):
+    """Non-whitespace characters of a string, ignoring Qt's object replacement characters."""
+    return len(NOT_TEXT_RE.sub('', text))
+
+
+def text_char_index(text, count):
+    """Index in text of the first counted character after `count` of them."""
+    seen = 0
+    for i, ch in enumerate(text):
+        if not ch.isspace() and ch != '\ufffc':
+            if seen == count: return i
+            seen += 1
+    return len(text)
+
+
+class TextProfile:
+    """
+    Where every CHECKPOINT_STEP-th non-whitespace character falls in a
+    document's visible text, so offsets and non-whitespace counts convert
+    in O(log n) without keeping the text.
+    """
+    __slots__ = ('ends', 'length', 'chars')
+
+    def __init__(self, text):
+        self.ends = array('l', (m.end() for m in CHECKPOINT_RE.finditer(text)))
+        self.length = len(text)
+        self.chars = count_text_chars(text)
+
+    @classmethod
+    def from_markup(cls, content):
+        runs = []
+        parser = VisibleTextParser(runs.append)
+        parser.feed(decode_markup(content))
+        parser.close()
+        return cls(''.join(runs))
+
+    def _span(self, j):
+        """Offsets bounding the j-th checkpoint interval, and how many characters it holds."""
+        start = self.ends[j - 1] if j > 0 else 0
+        if j < len(self.ends): return start, self.ends[j], CHECKPOINT_STEP
+        return start, self.length, max(self.chars - j * CHECKPOINT_STEP, 0)
+
+    def to_offset(self, chars):
+        """Visible-text offset of the position after `chars` non-whitespace characters."""
+        j = min(int(chars) // CHECKPOINT_STEP, len(self.ends))
+        start, end, count = self._span(j)
+        if count == 0: return start
+        return min(round(start + (chars - j * CHECKPOINT_STEP) * (end - start) / count), end)
+
+    def to_chars(self, offset):
+        """Non-whitespace characters before a visible-text offset."""
+        j = bisect_right(self.ends, offset)
+        start, end, count = self._span(j)
+        if end <= start: return j * CHECKPOINT_STEP
+        return j * CHECKPOINT_STEP + min((offset - start) / (end - start), 1.0) * count
+
+
+class AnchorMap:
+    """
+    The visible-text position of every block of one rendered chapter. It
+    depends only on the chapter's HTML, not on the layout, so it is built
+    once and kept with the cached chapter. first_block is the chapter's
+    first block number in a document that holds more than one chapter.
+    """
+
+    def __init__(self, block_texts, profile, first_block=0):
+        self.profile = profile
+        self.first_block = first_block
+        counts = [count_text_chars(text) for text in block_texts]
+        total = sum(counts)
+        # Any systematic difference between Qt's text and ours is spread evenly.
+        self.scale = profile.chars / total if total else 0.0
+        self.starts = array('d')
+        running = 0
+        for count in counts:
+            self.starts.append(running * self.scale)
+            running += count
+
+    def offset_at(self, block_number, chars_in_block):
+        """Visible-text offset of a point `chars_in_block` characters into a block."""
+        if not self.starts: return 0
+        block_number = min(max(block_number - self.first_block, 0), len(self.starts) - 1)
+        return self.profile.to_offset(self.starts[block_number] + chars_in_block * self.scale)
+
+    def locate(self, offset):
+        """Returns (block number, characters into that block) for a visible-text offset."""
+        if not self.starts: return self.first_block, 0
+        chars = self.profile.to_chars(offset)
+        # Half a character of slack, so rounding never lands on the end of the previous block.
+        block_number = max(bisect_right(self.starts, chars + 0.5) - 1, 0)
+        into = (chars - self.starts[block_number]) / self.scale if self.scale else 0
+        return self.first_block + block_number, max(int(round(into)), 0)
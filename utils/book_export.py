@@ -0,0 +1,198 @@
+# utils/book_export.py
+import os
+from html import escape
+from html.parser import HTMLParser
+from urllib.parse import urlsplit
+from utils.epub_container import EpubContainer, split_fragment
+from utils.html_transform import HtmlTransformPipeline, TransformStage, UNWRAP, WHITESPACE_RE
+from utils.text_metrics import HIDDEN_TEXT_TAGS, decode_markup
+from utils.book_index import document_is_rtl
+from utils.helpers import is_rtl
+
+# Books are exported by walking the spine and writing each document out as
+# soon as it is converted, so only one document (its bytes and its converted
+# text) is ever held, whatever the size of the book. Output goes to a .part
+# file that is renamed into place once the book is complete.
+
+EXPORT_FORMATS = ('txt', 'html')
+
+# Plain text: one line per paragraph, a form feed line between spine documents.
+TEXT_CHAPTER_SEPARATOR = '\f\n'
+# Right-to-left paragraphs start with RLM; left-to-right ones in a
+# right-to-left document with LRM, so line-based tools get each one's direction.
+RLM, LRM = '\u200f', '\u200e'
+
+TEXT_BLOCK_TAGS = frozenset([
+    'address', 'article', 'aside', 'blockquote', 'br', 'caption', 'dd', 'div', 'dl', 'dt', 'figcaption',
+    'figure', 'footer', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'header', 'hr', 'li', 'main', 'nav', 'ol',
+    'p', 'pre', 'section', 'table', 'tr', 'ul'
+])
+TEXT_CELL_TAGS = frozenset(['td', 'th'])
+
+HTML_HEADER = ('<!DOCTYPE html>\n<html>\n<head>\n<meta charset="utf-8">\n<title>{title}</title>\n'
+               '<style>section {{ margin-bottom: 2em; }}</style>\n</head>\n<body>\n')
+HTML_FOOTER = '</body>\n</html>\n'
+
+
+class TextExportParser(HTMLParser):
+    """Streams a document's visible text to `write`, one line per paragraph."""
+
+    def __init__(self, write, rtl):
+        super().__init__(convert_charrefs=True)
+        self.write = write
+        self.rtl = rtl
+        self.parts = []
+        self.hidden_depth = 0
+        self.pre_depth = 0
+
+    def flush(self):
+        if not self.parts: return
+        text = ''.join(self.parts)
+        self.parts = []
+        text = text.strip('\r\n') if self.pre_depth else WHITESPACE_RE.sub(' ', text).strip()
+        if not text: return
+        mark = RLM if is_rtl(text) else (LRM if self.rtl else '')
+        self.write(mark + text + '\n')
+
+    def handle_starttag(self, tag, attrs):
+        if tag in HIDDEN_TEXT_TAGS:
+            self.hidden_depth += 1
+        elif tag in TEXT_BLOCK_TAGS:
+            self.flush()
+            if tag == 'pre': self.pre_depth += 1
+        elif tag in TEXT_CELL_TAGS:
+            self.parts.append(' ')
+
+    def handle_startendtag(self, tag, attrs):
+        if tag in TEXT_BLOCK_TAGS: self.flush()
+
+    def handle_endtag(self, tag):
+        if tag in HIDDEN_TEXT_TAGS:
+            self.hidden_depth = max(self.hidden_depth - 1, 0)
+        elif tag in TEXT_BLOCK_TAGS:
+            self.flush()
+            if tag == 'pre': self.pre_depth = max(self.pre_depth - 1, 0)
+
+    def handle_data(self, data):
+        if not self.hidden_depth: self.parts.append(data)
+
+    def close(self):
+        super().close()
+        self.flush()
+
+
+class ExportCleanStage(TransformStage):
+    """
+    Keeps a document's text and structure for a standalone page: no head,
+    styling, scripts or media. Ids are prefixed with the spine index so they
+    stay unique in one file, and links between documents become #anchors.
+    """
+    DROPPED_TAGS = frozenset(['head', 'script', 'style', 'link', 'meta', 'title', 'template', 'object',
+                              'embed', 'iframe', 'audio', 'video', 'svg', 'form', 'input', 'button'])
+    UNWRAPPED_TAGS = frozenset(['html', 'body'])
+    KEPT_ATTRIBUTES = frozenset(['id', 'dir', 'lang', 'href', 'colspan', 'rowspan', 'start', 'title'])
+
+    def __init__(self, container, document_path, spine_lookup):
+        self.container = container
+        self.document_path = document_path
+        self.spine_lookup = spine_lookup
+
+    def anchor(self, spine_index, fragment=''):
+        return f"d{spine_index}-{fragment}" if fragment else f"d{spine_index}"
+
+    def link(self, href):
+        if urlsplit(href).scheme: return href
+        path, fragment = split_fragment(self.container.resolve(href, self.document_path))
+        spine_index = self.spine_lookup.get(path)
+        # Links to anything outside the spine have nowhere to go in the export.
+        return '#' + self.anchor(spine_index, fragment) if spine_index is not None else None
+
+    def start_tag(self, pipeline, tag, attrs):
+        if tag in self.UNWRAPPED_TAGS: return UNWRAP
+        if tag in self.DROPPED_TAGS: return None
+        if tag in ('img', 'image'):
+            alt = dict(attrs).get('alt')
+            if alt: pipeline.emit(escape(alt, quote=False))
+            return None
+        kept = []
+        for name, value in attrs:
+            if name == 'xml:lang': name = 'lang'
+            if name == 'name' and tag == 'a': name = 'id'
+            if name not in self.KEPT_ATTRIBUTES or value is None: continue
+            if name == 'id':
+                value = self.anchor(self.spine_lookup[self.document_path], value)
+            elif name == 'href':
+                value = self.link(value)
+                if value is None: continue
+            kept.append((name, value))
+        return kept
+
+
+def export_book(container, out, fmt='txt', check=None):
+    """
+    Writes an open book to the text stream `out` as plain text or as one HTML
+    page, spine document by spine document. Returns the number of documents.
+    `check`, if given, is called between documents and may raise to stop.
+    """
+    if fmt not in EXPORT_FORMATS: raise ValueError(f"Unknown export format: {fmt}")
+    spine_lookup = {path: i for i, path in enumerate(container.spine)}
+    if fmt == 'html':
+        out.write(HTML_HEADER.format(title=escape(container.title or os.path.basename(container.file_path))))
+    for spine_index, path in enumerate(container.spine):
+        if check: check()
+        content = container.read(path)
+        rtl = document_is_rtl(content)
+        if fmt == 'html':
+            if spine_index: out.write('<hr>\n')
+            out.write(f'<section id="d{spine_index}" dir="{"rtl" if rtl else "ltr"}">\n')
+            out.write(HtmlTransformPipeline([ExportCleanStage(container, path, spine_lookup)]).transform(content))
+            out.write('\n</section>\n')
+        else:
+            if spine_index: out.write(TEXT_CHAPTER_SEPARATOR)
+            parser = TextExportParser(out.write, rtl)
+            parser.feed(decode_markup(content))
+            parser.close()
+    if fmt == 'html': out.write(HTML_FOOTER)
+    return len(container.spine)
+
+
+def export_book_file(file_path, output_path, fmt='txt'):
+    """
+    Exports one EPUB to output_path. Runs inside export worker processes, so
+    it reports failures instead of raising; no partial file is left behind.
+    """
+    partial = output_path + '.part'
+    try:
+        with EpubContainer(file_path) as container:
+            with open(partial, 'w', encoding='utf-8', newline='\n') as out:
+                documents = export_book(container, out, fmt)
+        os.replace(partial, output_path)
+        return {'path': file_path, 'output': output_path, 'documents': documents, 'bytes': os.path.getsize(output_path)}
+    except Exception as e:
+        try:
+            os.remove(partial)
+        except OSError:
+            pass
+        return {'path': file_path, 'error': str(e)}
+
+
+def export_job(job, fmt):
+    """export_book_file for a (file_path, output_path) pair, as the batch pools hand them out."""
+    return export_book_file(job[0], job[1], fmt)
+
+
+def export_jobs(paths, output_dir, fmt):
+    """
+    Pairs each EPUB with its output file in output_dir, named after the book's
+    file. Books with the same name from different folders get -2, -3, ...
+    Lazy, so a folder walk feeds the exporters as it goes.
+    """
+    used = set()
+    for path in paths:
+        stem = os.path.splitext(os.path.basename(path))[0]
+        name, n = stem, 1
+        while name.lower() in used:
+            n += 1
+            name = f"{stem}-{n}"
+        used.add(name.lower())
+        yield path, os.path.join(output_dir, f"{name}.{fmt}")
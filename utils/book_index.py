@@ -0,0 +1,170 @@
+# utils/book_index.py
+import os
+from utils.epub_container import EpubContainer, file_fingerprint
+from utils.text_metrics import measure_documents, anchor_offsets, VisibleTextParser, decode_markup
+from utils.helpers import is_rtl
+
+class LoadCancelled(Exception):
+    """Raised by a load's check when a newer load has superseded it."""
+
+def book_metadata(container):
+    """The title, author, TOC and spine of an open book; all of it comes from the OPF and NCX/nav."""
+    return {
+        'title': container.title or os.path.basename(container.file_path), 'author': container.author,
+        'chapters': container.chapters(), 'spine': list(container.spine)
+    }
+
+def measure_book(container, use_pool=None, check=None, progress=None):
+    """
+    The per-document text lengths of an open book, with their running totals.
+    `check` is called between spine documents and may raise LoadCancelled;
+    `progress` gets (done, total) as documents are measured.
+    """
+    # Text lengths are counted by a streaming tokenizer, spread across
+    # worker processes for large books.
+    def read_documents():
+        for path in container.spine:
+            if check: check()
+            yield container.read(path)
+    sizes = [container.size_of(path) for path in container.spine]
+    chap_lens = measure_documents(read_documents(), sizes, use_pool=use_pool, check=check, progress=progress)
+    cum_lens = [0]
+
+    cumulative = 0
+    for length in chap_lens:
+        cumulative += length
+        cum_lens.append(cumulative)
+
+    return {'total_len': cum_lens[-1], 'chap_lens': chap_lens, 'cum_lens': cum_lens,
+            'toc_offsets': toc_offsets(container, container.chapters(), check)}
+
+def toc_offsets(container, chapters, check=None):
+    """
+    Where each TOC entry starts in the visible text of its spine document:
+    0 for a whole document, the anchor's offset for a path#fragment, None
+    if the entry points outside the spine or at an anchor that is not there.
+    With the running totals this makes going to any entry O(1).
+    """
+    from utils.epub_container import split_fragment
+    spine_paths = set(container.spine)
+    targets = [split_fragment(c['href']) for c in chapters]
+    wanted = {}
+    for path, fragment in targets:
+        if fragment and path in spine_paths: wanted.setdefault(path, set()).add(fragment)
+    found = {}
+    for path, ids in wanted.items():
+        if check: check()
+        found[path] = anchor_offsets(container.read(path), ids)
+    return [(found[path].get(fragment) if fragment else 0) if path in spine_paths else None
+            for path, fragment in targets]
+
+def build_book_index(container, use_pool=None, check=None):
+    """Extracts the metadata and per-document text lengths of an open book."""
+    return dict(book_metadata(container), **measure_book(container, use_pool=use_pool, check=check))
+
+def file_signature(file_path):
+    """The (size, mtime) pair used to tell whether a file changed since it was indexed."""
+    stat = os.stat(file_path)
+    return stat.st_size, stat.st_mtime_ns
+
+def book_fingerprint(file_path):
+    """
+    (path, size, mtime, fingerprint) of a file, or None if it cannot be read.
+    Runs in import worker processes, where it is what finds moved books.
+    """
+    try:
+        file_size, file_mtime = file_signature(file_path)
+        return file_path, file_size, file_mtime, file_fingerprint(file_path)
+    except Exception:
+        return None
+
+def book_cover_key(container, file_size, file_mtime, thumbnails):
+    """Makes the book's cover thumbnail if it is not cached yet. Returns its key, or NO_COVER."""
+    from utils.thumbnails import cover_key
+    return thumbnails.store_cover(container, cover_key(container.file_path, file_size, file_mtime))
+
+# is_rtl only looks at the start of a text, so that is all that is parsed.
+DIRECTION_SAMPLE_CHARS = 500
+DIRECTION_FEED_CHARS = 8192
+
+def document_is_rtl(content):
+    """Whether a document's visible text starts out right-to-left. Stops parsing once it has a sample."""
+    sample = []
+    parser = VisibleTextParser(sample.append)
+    text = decode_markup(content)
+    for start in range(0, len(text), DIRECTION_FEED_CHARS):
+        parser.feed(text[start:start + DIRECTION_FEED_CHARS])
+        if sum(len(run) for run in sample) >= DIRECTION_SAMPLE_CHARS: break
+    else:
+        parser.close()
+    return is_rtl(' '.join(sample))
+
+def dominant_direction(container, chap_lens):
+    """'rtl' if right-to-left documents hold most of the book's text, else 'ltr'."""
+    rtl_len = sum(length for path, length in zip(container.spine, chap_lens)
+                  if length and document_is_rtl(container.read(path)))
+    return 'rtl' if rtl_len * 2 > sum(chap_lens) else 'ltr'
+
+def index_book_file(file_path, thumbnail_dir=None, with_direction=False):
+    """
+    Indexes one EPUB from scratch. Runs inside import worker processes, so it
+    never starts a nested pool and reports failures instead of raising.
+    With a thumbnail_dir, the cover thumbnail is made while the file is open;
+    with_direction adds the book's dominant text direction to the record.
+    """
+    try:
+        file_size, file_mtime = file_signature(file_path)
+        record = {'path': file_path, 'size': file_size, 'mtime': file_mtime}
+        with EpubContainer(file_path) as container:
+            record['index'] = build_book_index(container, use_pool=False)
+            record['fingerprint'] = container.fingerprint()
+            if with_direction:
+                record['direction'] = dominant_direction(container, record['index']['chap_lens'])
+            if thumbnail_dir:
+                # Only covers need QtGui; indexing and exporting run without it (and without GL libraries).
+                from utils.thumbnails import ThumbnailCache
+                try:
+                    record['cover_key'] = book_cover_key(container, file_size, file_mtime, ThumbnailCache(thumbnail_dir))
+                except Exception:
+                    pass  # A bad cover image never fails the import; the library retries it lazily.
+        return record
+    except Exception as e:
+        return {'path': file_path, 'error': str(e)}
+
+# Passages for the full-text index are built from whole visible-text runs.
+# Runs are joined with U+2029 so words from adjacent paragraphs are not glued
+# together for the tokenizer, while offsets stay in visible-text characters.
+PASSAGE_SEPARATOR = '\u2029'
+PASSAGE_CHARS = 800
+
+def iter_passages(container):
+    """Yields (spine_index, char_offset, text) passages covering every spine document."""
+    for spine_index, path in enumerate(container.spine):
+        runs = []
+        parser = VisibleTextParser(runs.append)
+        parser.feed(decode_markup(container.read(path)))
+        parser.close()
+        offset, start, passage, passage_len = 0, 0, [], 0
+        for run in runs:
+            passage.append(run)
+            passage_len += len(run)
+            offset += len(run)
+            if passage_len >= PASSAGE_CHARS:
+                yield spine_index, start, PASSAGE_SEPARATOR.join(passage)
+                start, passage, passage_len = offset, [], 0
+        if passage:
+            yield spine_index, start, PASSAGE_SEPARATOR.join(passage)
+
+def passage_offset(passage, position):
+    """Converts a position inside a passage's text to visible-text characters."""
+    return position - passage.count(PASSAGE_SEPARATOR, 0, position)
+
+def extract_book_text(file_path):
+    """Collects a book's passages for the full-text index. Runs in a worker process."""
+    try:
+        file_size, file_mtime = file_signature(file_path)
+        with EpubContainer(file_path) as container:
+            passages = list(iter_passages(container))
+        return {'path': file_path, 'size': file_size, 'mtime': file_mtime, 'passages': passages}
+    except Exception as e:
+        return {'path': file_path, 'error': str(e)}
@@ -0,0 +1,53 @@
+# utils/chapter_renderer.py
+import sys
+from utils.anchor_map import TextProfile
+from utils.tracing import tracer
+from utils.html_transform import (
+    HtmlTransformPipeline, DirectionStage, StyleInjectionStage, ScriptStripStage,
+    CssFilterStage, ResourceUrlStage
+)
+
+FONT_CSS = "body { font-family: 'Vazirmatn', sans-serif !important; }"
+
+def chapter_stages(container, document_path):
+    """The transform stages applied to every chapter before display."""
+    return [
+        ScriptStripStage(),
+        CssFilterStage(),
+        ResourceUrlStage(container.resolve, document_path),
+        DirectionStage(),
+        StyleInjectionStage(FONT_CSS),
+    ]
+
+def load_stylesheet(container, path):
+    """A book stylesheet as the text display uses it, with what QTextDocument cannot apply filtered out."""
+    try:
+        css = container.read(path).decode('utf-8', 'replace')
+    except (KeyError, ValueError):
+        css = ""
+    return CssFilterStage().filter_stylesheet(css)
+
+
+class RenderedChapter:
+    """A chapter ready for display: its HTML, its text profile and (once shown) its anchor map."""
+    __slots__ = ('html', 'profile', 'anchor_map')
+
+    def __init__(self, html, profile):
+        self.html = html
+        self.profile = profile
+        self.anchor_map = None
+
+    def nbytes(self):
+        # The anchor map is built later and is small next to the HTML; it is
+        # budgeted as one more profile-sized array.
+        return sys.getsizeof(self.html) + 2 * self.profile.ends.itemsize * len(self.profile.ends)
+
+def prepare_chapter(container, document_path):
+    """Renders a spine document and profiles its visible text, reading it only once."""
+    with tracer.span('chapter.read'):
+        content = container.read(document_path)
+    with tracer.span('chapter.transform'):
+        html = HtmlTransformPipeline(chapter_stages(container, document_path)).transform(content)
+    with tracer.span('chapter.profile'):
+        profile = TextProfile.from_markup(content)
+    return RenderedChapter(html, profile)
@@ -0,0 +1,295 @@
+# utils/epub_container.py
+import os
+import mmap
+import errno
+import hashlib
+import zipfile
+import posixpath
+import threading
+from urllib.parse import unquote
+from xml.etree import ElementTree
+
+# Only XHTML spine items count as documents (same rule ebooklib used), so
+# lengths and saved positions line up with books indexed before this layer.
+DOCUMENT_MEDIA_TYPES = ('application/xhtml+xml',)
+NCX_MEDIA_TYPE = 'application/x-dtbncx+xml'
+
+
+def _local(tag):
+    """Strips the '{namespace}' part of an ElementTree tag."""
+    return tag.rsplit('}', 1)[-1] if isinstance(tag, str) else ''
+
+
+def _children(element, name):
+    return [child for child in element if _local(child.tag) == name]
+
+
+def _text(element):
+    return ' '.join(''.join(element.itertext()).split()) if element is not None else ''
+
+
+def split_fragment(href):
+    """Splits 'path#anchor' into ('path', 'anchor')."""
+    path, _, fragment = href.partition('#')
+    return path, fragment
+
+
+def _opf_path_from(container_xml):
+    root = ElementTree.fromstring(container_xml)
+    for element in root.iter():
+        if _local(element.tag) == 'rootfile' and element.get('full-path'):
+            return element.get('full-path')
+    raise ValueError("Invalid EPUB: no package document found in container.xml")
+
+
+def _fingerprint(zip_file, opf_bytes):
+    digest = hashlib.sha1()
+    # The central directory is already parsed by zipfile: names, sizes and CRCs of every member.
+    for info in zip_file.infolist():
+        digest.update(f"{info.filename}\0{info.file_size}\0{info.CRC:08x}\n".encode('utf-8'))
+    digest.update(opf_bytes)
+    return digest.hexdigest()
+
+
+def file_fingerprint(file_path):
+    """EpubContainer.fingerprint() of a file, without parsing the package or its TOC."""
+    with zipfile.ZipFile(file_path) as zip_file:
+        return _fingerprint(zip_file, zip_file.read(_opf_path_from(zip_file.read('META-INF/container.xml'))))
+
+
+class _MappedFile:
+    """Read-only file object over an mmap, with the methods zipfile expects."""
+
+    def __init__(self, file_path):
+        self._file = open(file_path, 'rb')
+        self.size = os.fstat(self._file.fileno()).st_size
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, OSError):
+            # Empty files and some network filesystems cannot be mapped.
+            self._map = None
+
+    def _target(self):
+        return self._map if self._map is not None else self._file
+
+    def read(self, size=-1): return self._target().read(size)
+
+    def seek(self, offset, whence=0):
+        try:
+            return self._target().seek(offset, whence)
+        except ValueError as e:
+            # mmap rejects an out-of-range seek with ValueError; a file raises OSError,
+            # which is what zipfile expects when it probes a file too short to be a zip.
+            raise OSError(errno.EINVAL, str(e)) from e
+
+    def tell(self): return self._target().tell()
+    def seekable(self): return True
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+
+class EpubContainer:
+    """
+    A lazy view of an EPUB archive. Only container.xml, the OPF and the
+    NCX/nav are parsed up front; chapters and resources are read from the
+    (memory-mapped) zip on demand.
+    """
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self._file = _MappedFile(file_path)
+        self._lock = threading.Lock()
+        try:
+            self._zip = zipfile.ZipFile(self._file)
+            self._names = set(self._zip.namelist())
+            self.opf_path = self._find_opf_path()
+            self.opf_dir = posixpath.dirname(self.opf_path)
+            self._parse_opf(self.read(self.opf_path))
+        except Exception:
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        # Taken under the lock so a background reader never sees a half-closed archive.
+        with self._lock:
+            if getattr(self, '_zip', None) is not None:
+                self._zip.close()
+                self._zip = None
+            if self._file:
+                self._file.close()
+                self._file = None
+
+    @property
+    def closed(self):
+        return self._file is None
+
+    def nbytes(self):
+        """
+        Rough memory held while the book is open: the mapped archive (an upper
+        bound, pages only count once they are read) and the parsed package.
+        """
+        if self.closed: return 0
+        return self._file.size + 512 * len(self._names)
+
+    # --- Archive Access ---
+
+    def resolve(self, href, base_path=None):
+        """Resolves an href relative to a file inside the archive (default: the OPF)."""
+        base_dir = posixpath.dirname(base_path) if base_path is not None else self.opf_dir
+        path, fragment = split_fragment(unquote(href))
+        resolved = posixpath.normpath(posixpath.join(base_dir, path)) if path else (base_path or '')
+        if resolved.startswith('./'): resolved = resolved[2:]
+        return resolved + ('#' + fragment if fragment else '')
+
+    def has(self, path):
+        return split_fragment(path)[0] in self._names
+
+    def read(self, path):
+        """Returns the bytes of an archive member; a '#fragment' is ignored."""
+        path = split_fragment(path)[0]
+        with self._lock:
+            if self._zip is None: raise ValueError("EPUB container is closed")
+            return self._zip.read(path)
+
+    def size_of(self, path):
+        return self._zip.getinfo(split_fragment(path)[0]).file_size
+
+    def fingerprint(self):
+        """
+        Identifies the book by its contents instead of its path: a hash of the
+        zip's central directory (every member's name, size and CRC) and the
+        OPF. Nothing else is decompressed, so a moved or renamed file is
+        recognised for about the cost of opening it.
+        """
+        return _fingerprint(self._zip, self.read(self.opf_path))
+
+    # --- Package Parsing ---
+
+    def _find_opf_path(self):
+        return _opf_path_from(self.read('META-INF/container.xml'))
+
+    def _parse_opf(self, opf_bytes):
+        package = ElementTree.fromstring(opf_bytes)
+        metadata = next((c for c in package if _local(c.tag) == 'metadata'), None)
+        manifest = next((c for c in package if _local(c.tag) == 'manifest'), None)
+        spine = next((c for c in package if _local(c.tag) == 'spine'), None)
+
+        titles = _children(metadata, 'title') if metadata is not None else []
+        self.title = _text(titles[0]) if titles else ''
+        creators = _children(metadata, 'creator') if metadata is not None else []
+        self.author = _text(creators[0]) if creators else ''
+        self.metadata = metadata
+
+        self.manifest = {}
+        for item in (_children(manifest, 'item') if manifest is not None else []):
+            href = item.get('href')
+            if not item.get('id') or not href: continue
+            self.manifest[item.get('id')] = {
+                'path': self.resolve(href),
+                'media_type': item.get('media-type', ''),
+                'properties': (item.get('properties') or '').split()
+            }
+
+        self.spine = []
+        for itemref in (_children(spine, 'itemref') if spine is not None else []):
+            item = self.manifest.get(itemref.get('idref'))
+            if item and item['media_type'] in DOCUMENT_MEDIA_TYPES:
+                self.spine.append(item['path'])
+
+        self.toc = []
+        ncx_id = spine.get('toc') if spine is not None else None
+        ncx = self.manifest.get(ncx_id) or next(
+            (i for i in self.manifest.values() if i['media_type'] == NCX_MEDIA_TYPE), None)
+        nav = next((i for i in self.manifest.values() if 'nav' in i['properties']), None)
+        if ncx and self.has(ncx['path']):
+            self.toc = self._parse_ncx(ncx['path'])
+        if not self.toc and nav and self.has(nav['path']):
+            self.toc = self._parse_nav(nav['path'])
+
+    def _parse_ncx(self, ncx_path):
+        try:
+            root = ElementTree.fromstring(self.read(ncx_path))
+        except ElementTree.ParseError:
+            return []
+        nav_map = next((e for e in root.iter() if _local(e.tag) == 'navMap'), None)
+        if nav_map is None: return []
+
+        def walk(parent):
+            entries = []
+            for point in _children(parent, 'navPoint'):
+                label = next((e for e in point.iter() if _local(e.tag) == 'text'), None)
+                content = next((e for e in _children(point, 'content')), None)
+                src = content.get('src') if content is not None else None
+                entries.append({
+                    'title': _text(label),
+                    'href': self.resolve(src, ncx_path) if src else None,
+                    'children': walk(point)
+                })
+            return entries
+        return walk(nav_map)
+
+    def _parse_nav(self, nav_path):
+        try:
+            root = ElementTree.fromstring(self.read(nav_path))
+        except ElementTree.ParseError:
+            return []
+        navs = [e for e in root.iter() if _local(e.tag) == 'nav']
+        toc_nav = next((n for n in navs if any(_local(k) == 'type' and v == 'toc' for k, v in n.attrib.items())),
+                       navs[0] if navs else None)
+        if toc_nav is None: return []
+        top_list = next((e for e in toc_nav.iter() if _local(e.tag) == 'ol'), None)
+        if top_list is None: return []
+
+        def walk(ol):
+            entries = []
+            for li in _children(ol, 'li'):
+                link = next((c for c in li if _local(c.tag) in ('a', 'span')), None)
+                sub_list = next((c for c in li if _local(c.tag) == 'ol'), None)
+                href = link.get('href') if link is not None else None
+                entries.append({
+                    'title': _text(link),
+                    'href': self.resolve(href, nav_path) if href else None,
+                    'children': walk(sub_list) if sub_list is not None else []
+                })
+            return entries
+        return walk(top_list)
+
+    def cover_path(self):
+        """Archive path of the cover image the OPF declares, or None."""
+        for item in self.manifest.values():
+            if 'cover-image' in item['properties']: return item['path']
+        # EPUB 2: <meta name="cover" content="manifest-id"/>
+        for meta in (_children(self.metadata, 'meta') if self.metadata is not None else []):
+            if meta.get('name') == 'cover':
+                item = self.manifest.get(meta.get('content'))
+                if item and item['media_type'].startswith('image/'): return item['path']
+        for item_id, item in self.manifest.items():
+            if item['media_type'].startswith('image/') and 'cover' in (item_id + item['path']).lower():
+                return item['path']
+        return None
+
+    def chapters(self):
+        """
+        Every TOC entry that points into the book, nested sections included,
+        in reading order with its depth; the spine if there is no TOC.
+        """
+        chapters = []
+        def walk(entries, depth):
+            for e in entries:
+                # An entry without a link still groups its children one level down.
+                if e['href']: chapters.append({'title': e['title'], 'href': e['href'], 'depth': depth})
+                walk(e['children'], depth + 1)
+        walk(self.toc, 0)
+        if not chapters:
+            chapters = [{'title': os.path.splitext(posixpath.basename(p))[0], 'href': p, 'depth': 0} for p in self.spine]
+        return chapters
@@ -0,0 +1,67 @@
+# utils/find_index.py
+import re
+from bisect import bisect_left
+from utils.text_metrics import VisibleTextParser, decode_markup
+
+# Visible text runs are joined with this separator, which is not counted in
+# character offsets. It keeps a word from running into the next run
+# ("bold</b>text") while still acting as whitespace between query words.
+RUN_SEPARATOR = '\u2029'
+
+
+def fold_case(text):
+    """Lower-cases text without changing its length, so offsets stay valid."""
+    lowered = text.lower()
+    if len(lowered) == len(text): return lowered
+    return ''.join(c.lower() if len(c.lower()) == 1 else c for c in text)
+
+
+def compile_query(query):
+    """Regex for a query against folded text: its words, separated by any whitespace."""
+    words = fold_case(query).split()
+    if not words: return None
+    return re.compile(r'\s+'.join(re.escape(w) for w in words))
+
+
+class DocumentText:
+    __slots__ = ('folded', 'separators')
+
+    def __init__(self, runs):
+        self.folded = fold_case(RUN_SEPARATOR.join(runs))
+        self.separators = [i for i, c in enumerate(self.folded) if c == RUN_SEPARATOR]
+
+    def offset(self, position):
+        """Converts a position in the folded text to visible-text characters."""
+        return position - bisect_left(self.separators, position)
+
+
+class BookTextIndex:
+    """
+    The case-folded visible text of each spine document of one open book.
+    Documents are extracted on first use and kept, so repeated searches only
+    run the regex.
+    """
+
+    def __init__(self, container):
+        self.container = container
+        self.documents = [None] * len(container.spine)
+
+    def __len__(self):
+        return len(self.documents)
+
+    def document(self, spine_index):
+        doc = self.documents[spine_index]
+        if doc is None:
+            runs = []
+            parser = VisibleTextParser(runs.append)
+            parser.feed(decode_markup(self.container.read(self.container.spine[spine_index])))
+            parser.close()
+            doc = self.documents[spine_index] = DocumentText(runs)
+        return doc
+
+    def find(self, spine_index, pattern):
+        """Yields (char_offset, length) for each match in a document, in order."""
+        doc = self.document(spine_index)
+        for match in pattern.finditer(doc.folded):
+            start = doc.offset(match.start())
+            yield start, doc.offset(match.end()) - start
@@ -0,0 +1,163 @@
+# utils/headless.py
+import os
+import sys
+import json
+import argparse
+from itertools import chain
+from utils.helpers import iter_epub_files, normalize_book_path
+
+# Command-line mode for servers and cron jobs: `python main.py index ...`.
+# Nothing here creates a QApplication, so it runs without a display.
+#
+#     python main.py index ~/Books --workers 4 --output books.jsonl
+#     python main.py index --list paths.txt --db --changed-only
+#     python main.py export ~/Books --format html --output-dir ~/Exports
+#
+# Each book becomes one JSON line on stdout (or --output). With --db the
+# books are also written to the GUI's library database, so the next GUI
+# start finds them already indexed. `export` writes each book's text (or a
+# single HTML page) to --output-dir, streaming one spine document at a time.
+
+COMMANDS = ('index', 'export')
+GUI_DATABASE = 'epub_swift.db'
+
+# Database writes are batched like the GUI's folder import.
+DB_BATCH_SIZE = 200
+
+
+def iter_input_paths(sources, list_files):
+    """Yields the EPUBs named on the command line (files or folders) and in list files, lazily."""
+    def from_list(list_file):
+        with (sys.stdin if list_file == '-' else open(list_file, encoding='utf-8')) as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith('#'): yield line
+
+    for source in chain(sources, chain.from_iterable(from_list(f) for f in list_files)):
+        if os.path.isdir(source):
+            yield from iter_epub_files(source)
+        else:
+            yield normalize_book_path(source)
+
+
+def book_summary(record):
+    """The JSONL line for one indexed book."""
+    if 'error' in record: return {'path': record['path'], 'error': record['error']}
+    index = record['index']
+    return {
+        'path': record['path'], 'title': index['title'], 'author': index.get('author', ''),
+        'toc': index['chapters'], 'spine': index['spine'], 'spine_lengths': index['chap_lens'],
+        'total_length': index['total_len'], 'direction': record['direction'],
+        'file_size': record['size'], 'file_mtime': record['mtime']
+    }
+
+
+def run_index(args):
+    from utils.book_index import file_signature, index_book_file
+    from utils.process_pool import imap_bounded
+    db_manager = thumbnails = None
+    if args.db:
+        from database.database_manager import DatabaseManager
+        # A path given on the command line is relative to the working directory, not the app folder.
+        db_manager = DatabaseManager(GUI_DATABASE if args.db == GUI_DATABASE else os.path.abspath(args.db))
+        if not args.no_covers:
+            from utils.thumbnails import ThumbnailCache, covers_directory
+            thumbnails = ThumbnailCache(covers_directory(db_manager.db_path))
+
+    paths = iter_input_paths(args.paths, args.list)
+    counts = {'indexed': 0, 'skipped': 0, 'failed': 0}
+    if args.changed_only:
+        known = db_manager.indexed_signatures()
+        def changed(path):
+            try:
+                if known.get(path) != file_signature(path): return True
+            except OSError:
+                return True  # Reported as a failure by the indexer.
+            counts['skipped'] += 1
+            return False
+        paths = filter(changed, paths)
+
+    def save(batch):
+        # Books moved since they were added keep their entry (and progress) at the new path.
+        db_manager.rebind_moved_books([(r['path'], r['size'], r['mtime'], r.get('fingerprint')) for r in batch])
+        db_manager.save_imported_books(batch)
+
+    out = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+    batch = []
+    thumbnail_dir = thumbnails.directory if thumbnails else None
+    try:
+        for record in imap_bounded(index_book_file, paths, args.workers, thumbnail_dir, True):
+            out.write(json.dumps(book_summary(record), ensure_ascii=False) + '\n')
+            if 'error' in record:
+                counts['failed'] += 1
+                continue
+            counts['indexed'] += 1
+            if db_manager:
+                batch.append(record)
+                if len(batch) >= DB_BATCH_SIZE:
+                    save(batch)
+                    batch = []
+        if batch: save(batch)
+    finally:
+        if out is not sys.stdout: out.close()
+        if db_manager: db_manager.close()
+    if thumbnails: thumbnails.evict()
+
+    print(f"Indexed {counts['indexed']} books, skipped {counts['skipped']} unchanged, {counts['failed']} failed.",
+          file=sys.stderr)
+    return 1 if counts['failed'] else 0
+
+
+def run_export(args):
+    from utils.book_export import export_jobs, export_job
+    from utils.process_pool import imap_bounded
+    os.makedirs(args.output_dir, exist_ok=True)
+    jobs = export_jobs(iter_input_paths(args.paths, args.list), args.output_dir, args.format)
+    counts = {'exported': 0, 'failed': 0}
+    for record in imap_bounded(export_job, jobs, args.workers, args.format):
+        print(json.dumps(record, ensure_ascii=False), flush=True)
+        counts['failed' if 'error' in record else 'exported'] += 1
+    print(f"Exported {counts['exported']} books to {args.output_dir}, {counts['failed']} failed.", file=sys.stderr)
+    return 1 if counts['failed'] else 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='main.py', description="ePub Swift without the GUI.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    index = commands.add_parser('index', help="index EPUBs and print one JSON record per book")
+    index.add_argument('paths', nargs='*', help="EPUB files or folders (searched recursively)")
+    index.add_argument('--list', action='append', default=[], metavar='FILE',
+                       help="file with one path per line, or - for stdin; may be repeated")
+    index.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                       help="worker processes (default: one per CPU)")
+    index.add_argument('--output', metavar='FILE', help="write the JSONL here instead of stdout")
+    index.add_argument('--db', nargs='?', const=GUI_DATABASE, metavar='PATH',
+                       help="also add the books to the library database (the GUI's own if no PATH is given)")
+    index.add_argument('--changed-only', action='store_true',
+                       help="with --db, skip books whose file has not changed since it was indexed")
+    index.add_argument('--no-covers', action='store_true', help="with --db, do not make cover thumbnails")
+    export = commands.add_parser('export', help="write each EPUB's text or a single HTML page, one file per book")
+    export.add_argument('paths', nargs='*', help="EPUB files or folders (searched recursively)")
+    export.add_argument('--list', action='append', default=[], metavar='FILE',
+                        help="file with one path per line, or - for stdin; may be repeated")
+    export.add_argument('--format', choices=('txt', 'html'), default='txt', help="plain text (default) or HTML")
+    export.add_argument('--output-dir', default='.', metavar='DIR', help="where the exports go (default: here)")
+    export.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help="worker processes (default: one per CPU)")
+    return parser
+
+
+def run_command(argv):
+    """Entry point for main.py's command mode. Returns the exit status."""
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if not args.paths and not args.list:
+        parser.error("give at least one EPUB, folder or --list file")
+    if args.command == 'index' and args.changed_only and not args.db:
+        # Without a library there is nothing to compare the files against.
+        parser.error("--changed-only needs --db")
+    if args.command == 'index':
+        return run_index(args)
+    if args.command == 'export':
+        return run_export(args)
+    return 2
@@ -12,6 +12,18 @@ def get_base_path():
         # We are running in a normal Python environment
         return os.path.dirname(os.path.abspath(__file__))
 
+def normalize_book_path(path):
+    """Absolute path with forward slashes, matching the paths Qt file dialogs return."""
+    return os.path.abspath(path).replace(os.sep, '/')
+
+def iter_epub_files(root):
+    """Recursively yields the EPUB files under a folder, in a stable order, without listing them all first."""
+    for dir_path, dir_names, file_names in os.walk(root):
+        dir_names.sort()
+        for name in sorted(file_names):
+            if name.lower().endswith('.epub'):
+                yield normalize_book_path(os.path.join(dir_path, name))
+
 def is_rtl(text, threshold=0.4):
     """Detects if a text is predominantly Right-to-Left."""
     if not text: return False
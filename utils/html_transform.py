@@ -0,0 +1,282 @@
+# utils/html_transform.py
+import re
+from html import escape
+from html.parser import HTMLParser
+from urllib.parse import quote, urlsplit
+from utils.helpers import is_rtl
+from utils.text_metrics import VOID_TAGS, decode_markup
+
+# Chapter HTML is rewritten in a single streaming pass: a tokenizer feeds tag
+# and text events through a list of stages, and the result is serialized
+# compactly as it goes. No DOM is built and nothing is pretty-printed.
+
+# Archive members are addressed as epub:/<path inside the zip>.
+RESOURCE_SCHEME = 'epub'
+RAW_TEXT_TAGS = frozenset(['script', 'style'])
+PREFORMATTED_TAGS = frozenset(['pre', 'textarea'])
+WHITESPACE_RE = re.compile(r'\s+')
+# Returned by TransformStage.start_tag to keep an element's content without its tags.
+UNWRAP = object()
+
+
+def resource_url(archive_path):
+    return f"{RESOURCE_SCHEME}:/{quote(archive_path)}"
+
+
+class TransformStage:
+    """Base class for pipeline stages. Every hook is optional."""
+
+    def start_tag(self, pipeline, tag, attrs):
+        """Returns the (possibly rewritten) attribute list, None to drop the element, or UNWRAP."""
+        return attrs
+
+    def after_start_tag(self, pipeline, tag, attrs, index):
+        """Called once the start tag has been written to pipeline.out[index]."""
+
+    def end_tag(self, pipeline, tag):
+        """Called just before an end tag is written."""
+
+    def text(self, pipeline, data):
+        """Returns the (possibly rewritten) text."""
+        return data
+
+    def finish(self, pipeline):
+        """Called after the whole document has been processed."""
+
+
+class HtmlTransformPipeline(HTMLParser):
+    """Runs markup through a list of TransformStage objects in one pass."""
+
+    def __init__(self, stages):
+        super().__init__(convert_charrefs=True)
+        self.stages = stages
+        self.out = []
+        self.open_tags = []
+        self.skipping = None
+        self.skip_depth = 0
+        # Depths in open_tags of the unwrapped elements still open.
+        self.unwrapped = []
+
+    def transform(self, markup):
+        self.feed(decode_markup(markup))
+        self.close()
+        for stage in self.stages:
+            stage.finish(self)
+        return ''.join(self.out)
+
+    # --- Output Helpers ---
+
+    def emit(self, markup):
+        self.out.append(markup)
+        return len(self.out) - 1
+
+    @staticmethod
+    def format_start_tag(tag, attrs):
+        parts = [tag]
+        for name, value in attrs:
+            parts.append(name if value is None else f'{name}="{escape(value, quote=True)}"')
+        return '<' + ' '.join(parts) + '>'
+
+    def inside(self, tags):
+        return any(t in tags for t in self.open_tags)
+
+    # --- Tokenizer Events ---
+
+    def handle_starttag(self, tag, attrs, self_closing=False):
+        if self.skipping:
+            if tag == self.skipping and tag not in VOID_TAGS and not self_closing: self.skip_depth += 1
+            return
+        for stage in self.stages:
+            attrs = stage.start_tag(self, tag, attrs)
+            if attrs is UNWRAP:
+                if tag not in VOID_TAGS and not self_closing:
+                    self.unwrapped.append(len(self.open_tags))
+                    self.open_tags.append(tag)
+                return
+            if attrs is None:
+                # Dropping an element drops everything inside it too.
+                if tag not in VOID_TAGS and not self_closing:
+                    self.skipping, self.skip_depth = tag, 1
+                return
+        index = self.emit(self.format_start_tag(tag, attrs))
+        for stage in self.stages:
+            stage.after_start_tag(self, tag, attrs, index)
+        if tag in VOID_TAGS: return
+        if self_closing:
+            # XHTML's <a id="x"/> must become an explicit pair for Qt's HTML parser.
+            self.handle_endtag(tag)
+        else:
+            self.open_tags.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs, self_closing=True)
+
+    def handle_endtag(self, tag):
+        if self.skipping:
+            if tag == self.skipping:
+                self.skip_depth -= 1
+                if self.skip_depth == 0: self.skipping = None
+            return
+        if tag in VOID_TAGS: return
+        depth = len(self.open_tags) - 1 - self.open_tags[::-1].index(tag) if tag in self.open_tags else -1
+        for stage in self.stages:
+            stage.end_tag(self, tag)
+        if not (self.unwrapped and self.unwrapped[-1] == depth):
+            self.emit(f'</{tag}>')
+        if depth >= 0:
+            # Like BeautifulSoup, an end tag closes everything opened after its match.
+            del self.open_tags[depth:]
+            while self.unwrapped and self.unwrapped[-1] >= depth: self.unwrapped.pop()
+
+    def handle_data(self, data):
+        if self.skipping: return
+        raw = self.open_tags and self.open_tags[-1] in RAW_TEXT_TAGS
+        if not raw and not self.inside(PREFORMATTED_TAGS):
+            data = WHITESPACE_RE.sub(' ', data)
+        for stage in self.stages:
+            data = stage.text(self, data)
+        if data:
+            self.emit(data if raw else escape(data, quote=False))
+
+    # Comments, doctypes and processing instructions are dropped.
+    def handle_comment(self, data): pass
+    def handle_decl(self, decl): pass
+    def handle_pi(self, data): pass
+
+    def unknown_decl(self, data):
+        if data.upper().startswith('CDATA['):
+            self.handle_data(data[len('CDATA['):])
+
+
+class DirectionStage(TransformStage):
+    """Sets <body dir> from the first part of the body text, with bounded lookahead."""
+    SAMPLE_CHARS = 2000
+
+    def __init__(self):
+        self.body = None
+        self.sample = []
+        self.sample_len = 0
+
+    def start_tag(self, pipeline, tag, attrs):
+        if tag == 'body':
+            return [(k, v) for k, v in attrs if k != 'dir']
+        return attrs
+
+    def after_start_tag(self, pipeline, tag, attrs, index):
+        if tag == 'body' and self.body is None:
+            self.body = (index, attrs)
+
+    def text(self, pipeline, data):
+        if self.body and self.sample_len < self.SAMPLE_CHARS and not pipeline.inside(('script', 'style', 'template')):
+            self.sample.append(data)
+            self.sample_len += len(data)
+        return data
+
+    def finish(self, pipeline):
+        if not self.body: return
+        index, attrs = self.body
+        direction = "rtl" if is_rtl(''.join(self.sample)) else "ltr"
+        pipeline.out[index] = pipeline.format_start_tag('body', attrs + [('dir', direction)])
+
+
+class StyleInjectionStage(TransformStage):
+    """Appends a stylesheet to <head>, creating the head if the document has none."""
+
+    def __init__(self, css):
+        self.css = css
+        self.injected = False
+
+    def markup(self):
+        return f'<style>{self.css}</style>'
+
+    def start_tag(self, pipeline, tag, attrs):
+        if not self.injected and tag not in ('html', 'head') and not pipeline.inside(('head',)):
+            # Content started without a head: put one in front of it.
+            self.injected = True
+            pipeline.emit(f'<head>{self.markup()}</head>')
+        return attrs
+
+    def end_tag(self, pipeline, tag):
+        if tag == 'head' and not self.injected:
+            self.injected = True
+            pipeline.emit(self.markup())
+
+    def finish(self, pipeline):
+        if not self.injected:
+            self.injected = True
+            pipeline.out.insert(0, f'<head>{self.markup()}</head>')
+
+
+class ScriptStripStage(TransformStage):
+    """Removes scripts and inline event handlers."""
+
+    def start_tag(self, pipeline, tag, attrs):
+        if tag == 'script': return None
+        return [(k, v) for k, v in attrs if not k.startswith('on')]
+
+
+class CssFilterStage(TransformStage):
+    """Drops CSS that QTextDocument cannot use but would still have to parse."""
+    DROPPED_AT_RULES = ('@font-face', '@import', '@page', '@keyframes', '@-webkit-keyframes', '@supports')
+    UNSUPPORTED_PROPERTIES = frozenset([
+        'position', 'top', 'left', 'right', 'bottom', 'z-index', 'transform', 'transition', 'animation',
+        'filter', 'box-shadow', 'text-shadow', 'opacity', 'overflow', 'columns', 'column-count', 'column-gap'
+    ])
+    DECLARATION_RE = re.compile(r'([-\w]+)\s*:([^;{}]*)(;|(?=\}|$))')
+
+    def filter_declarations(self, css):
+        def keep(match):
+            return '' if match.group(1).lower() in self.UNSUPPORTED_PROPERTIES else match.group(0)
+        return self.DECLARATION_RE.sub(keep, css)
+
+    def filter_stylesheet(self, css):
+        css = re.sub(r'/\*.*?\*/', '', css, flags=re.S)
+        out = []
+        i = 0
+        while i < len(css):
+            at = css.find('@', i)
+            if at == -1:
+                out.append(css[i:]); break
+            out.append(css[i:at])
+            rule = css[at:at + 20].lower()
+            if not rule.startswith(self.DROPPED_AT_RULES):
+                out.append('@'); i = at + 1; continue
+            # Skip the at-rule: either up to ';' or over its balanced {...} block.
+            semi, brace = css.find(';', at), css.find('{', at)
+            if brace == -1 or (semi != -1 and semi < brace):
+                i = semi + 1 if semi != -1 else len(css); continue
+            depth, j = 0, brace
+            while j < len(css):
+                if css[j] == '{': depth += 1
+                elif css[j] == '}':
+                    depth -= 1
+                    if depth == 0: break
+                j += 1
+            i = j + 1
+        return WHITESPACE_RE.sub(' ', self.filter_declarations(''.join(out))).strip()
+
+    def start_tag(self, pipeline, tag, attrs):
+        return [(k, self.filter_declarations(v) if k == 'style' and v else v) for k, v in attrs]
+
+    def text(self, pipeline, data):
+        if pipeline.open_tags and pipeline.open_tags[-1] == 'style':
+            return self.filter_stylesheet(data)
+        return data
+
+
+class ResourceUrlStage(TransformStage):
+    """Rewrites relative image and stylesheet references to absolute archive URLs."""
+    URL_ATTRIBUTES = {'img': ('src',), 'image': ('href', 'xlink:href'), 'link': ('href',), 'source': ('src',)}
+
+    def __init__(self, resolve, document_path):
+        self.resolve = resolve
+        self.document_path = document_path
+
+    def rewrite(self, url):
+        if not url or url.startswith(('#', 'data:')) or urlsplit(url).scheme: return url
+        return resource_url(self.resolve(url, self.document_path))
+
+    def start_tag(self, pipeline, tag, attrs):
+        names = self.URL_ATTRIBUTES.get(tag)
+        if not names: return attrs
+        return [(k, self.rewrite(v) if k in names else v) for k, v in attrs]
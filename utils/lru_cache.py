@@ -0,0 +1,98 @@
+# utils/lru_cache.py
+import sys
+import threading
+from collections import OrderedDict
+
+class SizedLRUCache:
+    """
+    A least-recently-used cache bounded by the total size of its values, in bytes.
+    With a MemoryBudget it also shares one global limit with other caches;
+    on_evict is called with each value the cache drops to stay within bounds.
+    """
+
+    def __init__(self, max_bytes, sizeof=sys.getsizeof, budget=None, on_evict=None):
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.budget = budget
+        self.on_evict = on_evict
+        self.total_bytes = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        if budget: budget.register(self)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._items
+
+    def __len__(self):
+        return len(self._items)
+
+    def _tick(self):
+        return self.budget.tick() if self.budget else 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._items: return default
+            self._items.move_to_end(key)
+            value, size, _ = self._items[key]
+            self._items[key] = (value, size, self._tick())
+            return value
+
+    def put(self, key, value):
+        size = self.sizeof(value)
+        with self._lock:
+            if key in self._items:
+                self.total_bytes -= self._items.pop(key)[1]
+            if size > self.max_bytes:
+                evicted = [value]
+            else:
+                self._items[key] = (value, size, self._tick())
+                self.total_bytes += size
+                evicted = self._evict(self.max_bytes)
+        self._evicted(evicted)
+        if self.budget: self.budget.enforce()
+
+    def pop(self, key, default=None):
+        with self._lock:
+            if key not in self._items: return default
+            value, size, _ = self._items.pop(key)
+            self.total_bytes -= size
+            return value
+
+    def discard_where(self, predicate):
+        """Drops every entry whose key matches the predicate."""
+        with self._lock:
+            for key in [k for k in self._items if predicate(k)]:
+                self.total_bytes -= self._items.pop(key)[1]
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.total_bytes = 0
+
+    # --- Shared Budget ---
+
+    def oldest_tick(self):
+        with self._lock:
+            return next(iter(self._items.values()))[2] if self._items else float('inf')
+
+    def evict_oldest(self):
+        """Drops the least recently used entry. Returns its size."""
+        with self._lock:
+            if not self._items: return 0
+            _, (value, size, _) = self._items.popitem(last=False)
+            self.total_bytes -= size
+        self._evicted([value])
+        return size
+
+    def _evict(self, limit):
+        evicted = []
+        while self._items and self.total_bytes > limit:
+            _, (value, size, _) = self._items.popitem(last=False)
+            self.total_bytes -= size
+            evicted.append(value)
+        return evicted
+
+    def _evicted(self, values):
+        if self.on_evict:
+            for value in values: self.on_evict(value)
@@ -0,0 +1,72 @@
+# utils/memory_budget.py
+import os
+import itertools
+import threading
+
+# One byte limit for everything the reader keeps in memory on behalf of open
+# books: rendered chapters, decoded images and the archives of background
+# tabs. Set EPUB_SWIFT_MEMORY_MB to change the cap.
+MEMORY_ENV_VAR = 'EPUB_SWIFT_MEMORY_MB'
+DEFAULT_MEMORY_MB = 512
+# The caches always get at least this much, however large the process already is.
+MIN_CACHE_BYTES = 64 * 1024 * 1024
+
+
+def memory_cap_bytes():
+    """The configured cap on the process's resident memory."""
+    try:
+        megabytes = int(os.environ.get(MEMORY_ENV_VAR, DEFAULT_MEMORY_MB))
+    except ValueError:
+        megabytes = DEFAULT_MEMORY_MB
+    return max(megabytes, 1) * 1024 * 1024
+
+
+def process_rss():
+    """Resident memory of this process in bytes, where that is cheap to find out (Linux); else None."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+class MemoryBudget:
+    """
+    A byte limit shared by several SizedLRUCaches. When their total goes over
+    it, the least recently used entry across all of them is evicted, whichever
+    cache holds it. `reserved_bytes` is memory held outside the caches (the
+    book in the front tab) that the caches have to make room for.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.reserved_bytes = 0
+        self.caches = []
+        self._clock = itertools.count()
+        self._lock = threading.Lock()
+
+    def register(self, cache):
+        self.caches.append(cache)
+
+    def tick(self):
+        """A use counter, so entries in different caches can be ordered by recency."""
+        return next(self._clock)
+
+    @property
+    def total_bytes(self):
+        return self.reserved_bytes + sum(cache.total_bytes for cache in self.caches)
+
+    def enforce(self, limit=None):
+        """Evicts the globally least recently used entries until the total fits. Returns the bytes freed."""
+        limit = self.max_bytes if limit is None else limit
+        freed = 0
+        with self._lock:
+            while self.total_bytes > limit:
+                cache = min((c for c in self.caches if len(c)), key=lambda c: c.oldest_tick(), default=None)
+                if cache is None: break
+                freed += cache.evict_oldest()
+        return freed
+
+    def release(self, nbytes):
+        """Evicts least recently used entries until `nbytes` are freed, or nothing is left."""
+        return self.enforce(max(self.total_bytes - nbytes, 0))
@@ -0,0 +1,60 @@
+# utils/process_pool.py
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+# Batch work over many books (imports, text indexing, exports, the headless
+# commands) runs in spawned worker processes: fork is unsafe once Qt's
+# threads exist, and the work is CPU-bound pure Python.
+
+# Jobs queued per worker process; this is what keeps memory flat for any number of books.
+JOBS_PER_WORKER = 4
+# How often a wait for results checks whether the caller has cancelled, in seconds.
+CANCEL_POLL_INTERVAL = 0.2
+
+
+def process_pool(workers):
+    """A ProcessPoolExecutor of `workers` spawned processes."""
+    return ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'))
+
+
+def imap_bounded(func, items, workers, *args, executor=None, cancelled=None):
+    """
+    Like map, in `workers` processes, yielding results as they complete.
+    Only a few jobs per process are ever queued, so the input is consumed lazily.
+
+    Runs in `executor` if given; otherwise in a pool of its own, or in this
+    process when workers <= 1. Once `cancelled()` returns true no more jobs
+    are started and queued ones are dropped, but the results of jobs already
+    running are still yielded.
+    """
+    def stopped():
+        return cancelled is not None and cancelled()
+
+    if executor is None:
+        if workers <= 1:
+            for item in items:
+                if stopped(): return
+                yield func(item, *args)
+            return
+        with process_pool(workers) as executor:
+            yield from imap_bounded(func, items, workers, *args, executor=executor, cancelled=cancelled)
+        return
+
+    items = iter(items)
+    in_flight = set()
+    timeout = CANCEL_POLL_INTERVAL if cancelled is not None else None
+    try:
+        while True:
+            while len(in_flight) < workers * JOBS_PER_WORKER and not stopped():
+                item = next(items, None)
+                if item is None: break
+                in_flight.add(executor.submit(func, item, *args))
+            if not in_flight: return
+            completed, in_flight = wait(in_flight, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in completed:
+                if not future.cancelled(): yield future.result()
+            if stopped():
+                for future in in_flight: future.cancel()
+    finally:
+        # A caller that stops early leaves nothing queued behind it.
+        for future in in_flight: future.cancel()
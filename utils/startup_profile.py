@@ -0,0 +1,77 @@
+# utils/startup_profile.py
+import os
+import sys
+import time
+
+# Run with --profile-startup (or EPUB_SWIFT_PROFILE_STARTUP=1) to print how
+# long each startup phase took, from process start to the first painted frame.
+PROFILE_FLAG = '--profile-startup'
+PROFILE_ENV_VAR = 'EPUB_SWIFT_PROFILE_STARTUP'
+
+_imported_at = time.perf_counter()
+
+
+def _process_age():
+    """Seconds since the OS started this process, where that is cheap to find out (Linux); else 0."""
+    try:
+        with open('/proc/self/stat') as f:
+            start_ticks = int(f.read().rsplit(')', 1)[1].split()[19])
+        with open('/proc/uptime') as f:
+            uptime = float(f.read().split()[0])
+        return max(uptime - start_ticks / os.sysconf('SC_CLK_TCK'), 0.0)
+    except (OSError, ValueError, IndexError, AttributeError):
+        return 0.0
+
+
+class StartupProfile:
+    """Wall-clock time of each startup phase. Every call is a no-op until enable()."""
+
+    def __init__(self):
+        self.enabled = False
+        self.reported = False
+        self.phases = []
+        self.origin = self.last = _imported_at
+
+    def enable(self):
+        self.enabled = True
+        # A --windowed build has no stderr; the profile goes next to the executable instead.
+        self.stream = sys.stderr or open(os.path.join(os.path.dirname(sys.executable), 'startup_profile.txt'), 'w')
+        # Interpreter start-up happens before any of our code runs, so it is measured backwards.
+        age = _process_age()
+        self.origin = min(time.perf_counter() - age, _imported_at) if age else _imported_at
+        self.phases = [('interpreter start', _imported_at - self.origin)]
+        self.last = _imported_at
+
+    def mark(self, phase):
+        """Ends a phase, charging it the time since the previous mark."""
+        if not self.enabled: return
+        now = time.perf_counter()
+        self.phases.append((phase, now - self.last))
+        if self.reported:
+            # Deferred work that finishes after the first frame is reported as it happens.
+            self._print_phase(phase, now - self.last, now - self.origin)
+        self.last = now
+
+    def report(self):
+        print("Startup profile (ms):   phase   since start", file=self.stream)
+        total = 0.0
+        for phase, seconds in self.phases:
+            total += seconds
+            self._print_phase(phase, seconds, total)
+
+    def _print_phase(self, phase, seconds, total):
+        print(f"  {seconds * 1000:8.1f}  {total * 1000:8.1f}  {phase}", file=self.stream, flush=True)
+
+    def first_paint(self):
+        """Ends the profile at the first painted frame and prints it."""
+        if not self.enabled or self.reported: return
+        self.mark('first paint')
+        self.report()
+        self.reported = True
+
+
+profile = StartupProfile()
+
+
+def profiling_requested(argv):
+    return PROFILE_FLAG in argv or os.environ.get(PROFILE_ENV_VAR, '') not in ('', '0')
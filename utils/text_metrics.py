@@ -0,0 +1,300 @@
+# utils/text_metrics.py
+import os
+import re
+import atexit
+from html import unescape
+from html.entities import html5
+from html.parser import HTMLParser
+
+# Counting is done with a streaming tokenizer instead of a BeautifulSoup tree.
+# Lengths used to be get_text(strip=True) over ebooklib's get_content(), which
+# regenerates each document from the children of its <body> only. The rules
+# below mirror that, so the lengths (and every saved last_read_pos built on
+# them) stay identical to the old measurement: text ahead of the body's first
+# child, text outside the body and CDATA sections are not counted.
+# benchmarks/run_benchmarks.py checks the parity against the old path. Not
+# mirrored: a document with text ahead of <html> *and* a <head>, which lxml
+# turned into a body holding the head's contents.
+
+# Tags that html.parser closes immediately (BeautifulSoup's empty-element tags).
+VOID_TAGS = frozenset([
+    'area', 'base', 'basefont', 'bgsound', 'br', 'col', 'command', 'embed', 'frame', 'hr',
+    'image', 'img', 'input', 'isindex', 'keygen', 'link', 'menuitem', 'meta', 'nextid',
+    'param', 'source', 'spacer', 'track', 'wbr'
+])
+# Text inside these tags is not part of the visible text. <head> is included
+# because lengths were historically measured on ebooklib's regenerated
+# documents, which never carried the head's <title> text.
+HIDDEN_TEXT_TAGS = frozenset(['head', 'script', 'style', 'template', 'rt', 'rp'])
+# Tags that may come before the body without starting it implicitly.
+HEAD_TAGS = frozenset(['html', 'head', 'base', 'link', 'meta', 'script', 'style', 'title'])
+
+# Where the parser is relative to the document body.
+BEFORE_BODY, BODY_LEADING, IN_BODY, AFTER_BODY = range(4)
+
+# Named references that also work without their ';' (&amp, &copy2). They mean the
+# same with or without it; every other reference depends on whether it was closed.
+LEGACY_ENTITIES = {name: value for name, value in html5.items() if not name.endswith(';')}
+
+# Below this much markup the process pool costs more than it saves.
+POOL_MIN_BYTES = 2 * 1024 * 1024
+
+_BOMS = [
+    (b'\xef\xbb\xbf', 'utf-8'), (b'\xff\xfe\x00\x00', 'utf-32-le'), (b'\x00\x00\xfe\xff', 'utf-32-be'),
+    (b'\xff\xfe', 'utf-16-le'), (b'\xfe\xff', 'utf-16-be')
+]
+_DECLARED_ENCODING_RE = re.compile(
+    rb'^\s*<\?.*encoding=[\'"](.*?)[\'"].*\?>|<\s*meta[^>]+charset\s*=\s*["\']?([^>]*?)[ /;\'">]', re.I
+)
+
+
+def decode_markup(content):
+    """Decodes document bytes the way BeautifulSoup would for ordinary EPUB content."""
+    if isinstance(content, str): return content
+    for bom, encoding in _BOMS:
+        if content.startswith(bom):
+            return content[len(bom):].decode(encoding, 'replace')
+    candidates = []
+    match = _DECLARED_ENCODING_RE.search(content, 0, 1024)
+    if match:
+        declared = (match.group(1) or match.group(2) or b'').decode('ascii', 'ignore').strip().lower()
+        if declared: candidates.append(declared)
+    candidates += ['utf-8', 'windows-1252']
+    for encoding in candidates:
+        try:
+            return content.decode(encoding)
+        except (UnicodeDecodeError, LookupError):
+            continue
+    return content.decode('utf-8', 'replace')
+
+
+def numeric_reference(name):
+    """Resolves the body of a &#...; reference to its character(s)."""
+    base, digits = (16, name[1:]) if name[:1] in ('x', 'X') else (10, name)
+    match = re.match(r'[0-9a-fA-F]+' if base == 16 else r'[0-9]+', digits)
+    if not match: return name
+    number = int(match.group(0), base)
+    extra = digits[match.end():]
+    if number == 0 or number > 0x10FFFF or 0xD800 <= number <= 0xDFFF:
+        return '\ufffd' + extra
+    if 0x80 <= number <= 0x9F:
+        # HTML maps these C1 controls through windows-1252.
+        try:
+            return bytes([number]).decode('windows-1252') + extra
+        except UnicodeDecodeError:
+            pass
+    return chr(number) + extra
+
+
+class VisibleTextParser(HTMLParser):
+    """Streams markup and reports each visible text run, stripped, without building a tree."""
+
+    def __init__(self, on_text):
+        super().__init__(convert_charrefs=False)
+        self.on_text = on_text
+        self.pending = []
+        self.open_tags = []
+        self.hidden_depth = 0
+        self.closed_void_tags = []
+        self.body_state = BEFORE_BODY
+
+    def flush(self):
+        if not self.pending: return
+        text = ''.join(self.pending)
+        self.pending = []
+        if self.body_state == IN_BODY and not self.hidden_depth:
+            text = text.strip()
+            if text: self.on_text(text)
+
+    def enter_element(self, tag):
+        """Moves into the body once it has a child element; text ahead of that was body text, not counted."""
+        if self.body_state == BODY_LEADING or (self.body_state == BEFORE_BODY and tag not in HEAD_TAGS):
+            self.body_state = IN_BODY
+
+    def handle_starttag(self, tag, attrs):
+        self.flush()
+        if tag == 'body':
+            if 'head' in self.open_tags:
+                # An unclosed <head> ends where the body starts.
+                self.handle_endtag('head')
+            if self.body_state == BEFORE_BODY: self.body_state = BODY_LEADING
+        else:
+            self.enter_element(tag)
+        if tag in VOID_TAGS:
+            self.closed_void_tags.append(tag)
+            return
+        self.open_tags.append(tag)
+        if tag in HIDDEN_TEXT_TAGS: self.hidden_depth += 1
+
+    def handle_startendtag(self, tag, attrs):
+        self.flush()
+        self.enter_element(tag)
+
+    def handle_endtag(self, tag):
+        if tag in self.closed_void_tags:
+            # A redundant </br> or </img> is ignored without ending the current text run.
+            self.closed_void_tags.remove(tag)
+            return
+        self.flush()
+        if tag in ('body', 'html') and self.body_state != BEFORE_BODY: self.body_state = AFTER_BODY
+        if tag not in self.open_tags: return
+        # Like BeautifulSoup, an end tag closes everything opened after its match.
+        while self.open_tags:
+            closed = self.open_tags.pop()
+            if closed in HIDDEN_TEXT_TAGS: self.hidden_depth -= 1
+            if closed == tag: break
+
+    def handle_data(self, data):
+        self.pending.append(data)
+
+    def handle_charref(self, name):
+        self.pending.append(numeric_reference(name))
+
+    def handle_entityref(self, name):
+        if name in LEGACY_ENTITIES:
+            self.pending.append(LEGACY_ENTITIES[name])
+            return
+        # HTMLParser has consumed a closing ';' without saying so; only the
+        # updatepos call that follows shows it, so that one call is intercepted.
+        self.entity_name = name
+        self.updatepos = self.resolve_entity
+
+    def resolve_entity(self, i, j):
+        del self.updatepos
+        closed = self.rawdata[j - 1:j] == ';'
+        # Resolved as an HTML5 parser would: unknown names stay as written, ';' included.
+        self.pending.append(unescape('&' + self.entity_name + (';' if closed else '')))
+        return HTMLParser.updatepos(self, i, j)
+
+    def handle_comment(self, data):
+        self.flush()
+        if self.body_state == BODY_LEADING: self.body_state = IN_BODY
+
+    def handle_decl(self, decl):
+        self.flush()
+
+    def handle_pi(self, data):
+        self.flush()
+
+    def unknown_decl(self, data):
+        # CDATA sections never made it through ebooklib's regenerated documents.
+        self.flush()
+
+    def close(self):
+        super().close()
+        self.flush()
+
+
+def count_visible_chars(content):
+    """Returns the length of the document's visible text, as get_text(strip=True) would."""
+    total = 0
+    def add(text):
+        nonlocal total
+        total += len(text)
+    parser = VisibleTextParser(add)
+    parser.feed(decode_markup(content))
+    parser.close()
+    return total
+
+
+
+class AnchorOffsetParser(VisibleTextParser):
+    """Finds where elements with the given ids (or <a name>s) start in the visible text."""
+
+    def __init__(self, ids):
+        # Not `offset`: HTMLParser keeps its own source position under that name.
+        self.text_offset = 0
+        super().__init__(self.advance)
+        self.wanted = set(ids)
+        self.offsets = {}
+
+    def advance(self, text):
+        self.text_offset += len(text)
+
+    def handle_starttag(self, tag, attrs):
+        super().handle_starttag(tag, attrs)
+        self.mark(tag, attrs)
+
+    def handle_startendtag(self, tag, attrs):
+        super().handle_startendtag(tag, attrs)
+        self.mark(tag, attrs)
+
+    def mark(self, tag, attrs):
+        for name, value in attrs:
+            if (name == 'id' or (name == 'name' and tag == 'a')) and value in self.wanted:
+                self.wanted.discard(value)
+                self.offsets[value] = self.text_offset
+
+
+ANCHOR_FEED_CHARS = 8192
+
+def anchor_offsets(content, ids):
+    """
+    Visible-text offsets of the anchors `ids` in a document, as counted by
+    count_visible_chars. Parsing stops once every anchor has been seen;
+    anchors that are not there are left out.
+    """
+    parser = AnchorOffsetParser(ids)
+    text = decode_markup(content)
+    for start in range(0, len(text), ANCHOR_FEED_CHARS):
+        parser.feed(text[start:start + ANCHOR_FEED_CHARS])
+        if not parser.wanted: break
+    return parser.offsets
+
+
+_pool = None
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        # Imported on first use: most processes never need a pool, and these are slow to import.
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        # 'spawn' keeps the children independent of the Qt threads in this process.
+        _pool = ProcessPoolExecutor(mp_context=multiprocessing.get_context('spawn'))
+        atexit.register(shutdown_pool)
+    return _pool
+
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def _count_indexed(item):
+    index, content = item
+    return index, count_visible_chars(content)
+
+def measure_documents(contents, sizes, use_pool=None, check=None, progress=None):
+    """
+    Counts the visible characters of each document, in order. `contents` is
+    read as the documents are measured, so only a few are held at a time;
+    `sizes` (their byte sizes, known up front from the archive) decides
+    whether the batch is large enough to spread across a shared process pool.
+    `check`, if given, is called between documents and may raise to abandon the
+    pass; `progress` is called with (done, total) as documents are measured.
+    """
+    total = len(sizes)
+    if use_pool is None:
+        use_pool = (os.cpu_count() or 1) > 1 and total > 1 and sum(sizes) >= POOL_MIN_BYTES
+    if check is None:
+        check = lambda: None
+    if progress is None:
+        progress = lambda done, total: None
+    lengths = []
+    if not use_pool:
+        for content in contents:
+            check()
+            lengths.append(count_visible_chars(content))
+            progress(len(lengths), total)
+        return lengths
+    from utils.process_pool import imap_bounded
+    lengths, done = [0] * total, 0
+    # Abandoning the pass cancels the documents that have not started yet.
+    for index, length in imap_bounded(_count_indexed, enumerate(contents), os.cpu_count() or 1, executor=_get_pool()):
+        check()
+        lengths[index] = length
+        done += 1
+        progress(done, total)
+    return lengths
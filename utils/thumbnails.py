@@ -0,0 +1,125 @@
+# utils/thumbnails.py
+import os
+import hashlib
+import threading
+from PySide6.QtCore import Qt, QBuffer, QByteArray, QIODevice, QSize
+from PySide6.QtGui import QImage, QImageReader, QPainter, QColor
+
+# Cover thumbnails are small JPEG files on disk, named by a key derived from
+# the book's path, size and mtime, so the library can show covers without
+# opening a single EPUB. They are kept beside the library database they
+# belong to, so a database given with --db gets covers of its own. Only
+# QtGui is used, which works without a QApplication, so thumbnails can also
+# be made in import worker processes.
+
+THUMBNAIL_SIZE = QSize(48, 72)
+THUMBNAIL_CACHE_BYTES = 64 * 1024 * 1024
+THUMBNAIL_QUALITY = 85
+# Stored as the cover key of a book known to have no usable cover.
+NO_COVER = ''
+
+
+def image_reader(data):
+    """A QImageReader over in-memory image bytes."""
+    buffer = QBuffer()
+    buffer.setData(QByteArray(data))
+    buffer.open(QIODevice.ReadOnly)
+    reader = QImageReader(buffer)
+    reader.buffer = buffer  # The reader does not own its device.
+    return reader
+
+
+def covers_directory(db_path):
+    """The thumbnail directory of the library database at db_path."""
+    return os.path.join(os.path.dirname(os.path.abspath(db_path)), 'covers')
+
+
+def cover_key(path, file_size, file_mtime):
+    return hashlib.sha1(f"{path}|{file_size}|{file_mtime}".encode('utf-8')).hexdigest()
+
+
+def make_thumbnail(data):
+    """Scales cover image bytes into a THUMBNAIL_SIZE JPEG, centred on a plain background."""
+    reader = image_reader(data)
+    size = reader.size()
+    if size.isValid():
+        # Decoding straight to a small size is much cheaper for large JPEG covers.
+        reader.setScaledSize(size.scaled(THUMBNAIL_SIZE, Qt.KeepAspectRatio))
+    image = reader.read()
+    if image.isNull(): return None
+    image = image.scaled(THUMBNAIL_SIZE, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+    thumbnail = QImage(THUMBNAIL_SIZE, QImage.Format_RGB32)
+    thumbnail.fill(QColor("#e1e5ea"))
+    painter = QPainter(thumbnail)
+    painter.drawImage((THUMBNAIL_SIZE.width() - image.width()) // 2, (THUMBNAIL_SIZE.height() - image.height()) // 2, image)
+    painter.end()
+    out = QByteArray()
+    buffer = QBuffer(out)
+    buffer.open(QIODevice.WriteOnly)
+    thumbnail.save(buffer, 'JPG', THUMBNAIL_QUALITY)
+    return bytes(out)
+
+
+class ThumbnailCache:
+    """A directory of cover thumbnails, trimmed least-recently-used first past a byte budget."""
+
+    def __init__(self, directory, max_bytes=THUMBNAIL_CACHE_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def path_for(self, key):
+        return os.path.join(self.directory, key[:2], key + '.jpg')
+
+    def has(self, key):
+        return os.path.exists(self.path_for(key))
+
+    def load(self, key):
+        path = self.path_for(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)  # Marks it recently used for eviction.
+            return data
+        except OSError:
+            return None
+
+    def store(self, key, data):
+        path = self.path_for(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Written under a temporary name so a concurrent reader never sees half a file.
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+
+    def store_cover(self, container, key):
+        """Makes and stores the thumbnail of an open book. Returns its key, or NO_COVER."""
+        if self.has(key): return key
+        cover = container.cover_path()
+        if not cover or not container.has(cover): return NO_COVER
+        data = make_thumbnail(container.read(cover))
+        if data is None: return NO_COVER
+        self.store(key, data)
+        return key
+
+    def evict(self):
+        """Deletes the least recently used thumbnails until the cache fits its budget."""
+        entries = []
+        total = 0
+        for dir_path, _, file_names in os.walk(self.directory):
+            for name in file_names:
+                path = os.path.join(dir_path, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+        if total <= self.max_bytes: return
+        for _, size, path in sorted(entries):
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            if total <= self.max_bytes: break
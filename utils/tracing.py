@@ -0,0 +1,177 @@
+# utils/tracing.py
+import os
+import json
+import time
+import threading
+import functools
+from collections import deque
+
+# Named timing spans around the hot paths (book load, chapter render, image
+# decode, SQLite writes...). Tracing is off unless EPUB_SWIFT_TRACE=1 is set
+# or the overlay is switched on from the Tools menu; while off, a span is a
+# shared object whose enter/exit do nothing.
+
+TRACE_ENV_VAR = 'EPUB_SWIFT_TRACE'
+# Raw events kept for export; older ones are dropped first.
+EVENT_LIMIT = 50000
+# Durations kept per span name for the rolling percentiles.
+RECENT_SAMPLES = 256
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ('tracer', 'name', 'args', 'start')
+
+    def __init__(self, tracer, name, args):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.tracer.record(self.name, self.start, time.perf_counter_ns(), self.args)
+        return False
+
+
+class SpanStats:
+    __slots__ = ('count', 'total_ns', 'max_ns', 'last_ns', 'recent')
+
+    def __init__(self):
+        self.count = 0
+        self.total_ns = 0
+        self.max_ns = 0
+        self.last_ns = 0
+        self.recent = deque(maxlen=RECENT_SAMPLES)
+
+    def add(self, duration_ns):
+        self.count += 1
+        self.total_ns += duration_ns
+        self.max_ns = max(self.max_ns, duration_ns)
+        self.last_ns = duration_ns
+        self.recent.append(duration_ns)
+
+    def summary(self):
+        recent = sorted(self.recent)
+        def percentile(p):
+            return recent[min(int(len(recent) * p), len(recent) - 1)] / 1e6 if recent else 0.0
+        return {
+            'count': self.count, 'total_ms': self.total_ns / 1e6, 'mean_ms': self.total_ns / self.count / 1e6,
+            'p50_ms': percentile(0.5), 'p95_ms': percentile(0.95), 'max_ms': self.max_ns / 1e6,
+            'last_ms': self.last_ns / 1e6
+        }
+
+
+class Tracer:
+    """Records spans from any thread, with rolling per-name statistics and a bounded event log."""
+
+    def __init__(self):
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._events = deque(maxlen=EVENT_LIMIT)
+        self._queued = {}
+        self._origin_ns = time.perf_counter_ns()
+
+    def set_enabled(self, enabled):
+        self.enabled = enabled
+
+    def span(self, name, **args):
+        """A context manager timing its block as `name`. Free when tracing is off."""
+        if not self.enabled: return NULL_SPAN
+        return _Span(self, name, args)
+
+    def record(self, name, start_ns, end_ns, args=None):
+        thread = threading.current_thread()
+        with self._lock:
+            stats = self._stats.get(name)
+            if stats is None: stats = self._stats[name] = SpanStats()
+            stats.add(end_ns - start_ns)
+            self._events.append((name, start_ns, end_ns - start_ns, thread.ident, thread.name, args or None))
+
+    # Time spent waiting in a worker thread's queue is recorded as "<name>.wait":
+    # the sender marks a request as queued, the worker as started.
+
+    def queued(self, name, key):
+        if not self.enabled: return
+        with self._lock:
+            self._queued[(name, key)] = time.perf_counter_ns()
+
+    def started(self, name, key):
+        if not self.enabled: return
+        with self._lock:
+            start = self._queued.pop((name, key), None)
+        if start is not None:
+            self.record(name + '.wait', start, time.perf_counter_ns())
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+            self._events.clear()
+            self._queued.clear()
+
+    def stats(self):
+        """Summary statistics per span name, slowest total first."""
+        with self._lock:
+            summaries = {name: stats.summary() for name, stats in self._stats.items()}
+        return dict(sorted(summaries.items(), key=lambda item: -item[1]['total_ms']))
+
+    def events(self):
+        with self._lock:
+            return list(self._events)
+
+    # --- Export ---
+
+    def export_json(self, path):
+        """Writes the statistics and the raw spans (times in ms since tracing began)."""
+        events = [{'name': name, 'start_ms': (start - self._origin_ns) / 1e6, 'duration_ms': duration / 1e6,
+                   'thread': thread_name, **({'args': args} if args else {})}
+                  for name, start, duration, _, thread_name, args in self.events()]
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'stats': self.stats(), 'events': events}, f, indent=1)
+
+    def export_chrome_trace(self, path):
+        """Writes the spans in Chrome's trace event format, for chrome://tracing or Perfetto."""
+        pid = os.getpid()
+        trace_events, thread_names = [], {}
+        for name, start, duration, thread_id, thread_name, args in self.events():
+            thread_names[thread_id] = thread_name
+            event = {'name': name, 'cat': name.split('.', 1)[0], 'ph': 'X', 'pid': pid, 'tid': thread_id,
+                     'ts': (start - self._origin_ns) / 1000, 'dur': duration / 1000}
+            if args: event['args'] = {k: str(v) for k, v in args.items()}
+            trace_events.append(event)
+        for thread_id, thread_name in thread_names.items():
+            trace_events.append({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': thread_id,
+                                 'args': {'name': thread_name}})
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': trace_events, 'displayTimeUnit': 'ms'}, f)
+
+
+tracer = Tracer()
+tracer.set_enabled(os.environ.get(TRACE_ENV_VAR, '') not in ('', '0'))
+
+
+def traced(name):
+    """Decorator form of tracer.span for whole functions."""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not tracer.enabled: return func(*args, **kwargs)
+            with _Span(tracer, name, None):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate